@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+from datetime import datetime
+
+import time
+import os
+import argparse
+
+from src.track import TrackStock, historyAt
+from src.settings import Settings
+from src.results import PoolChannel, rank, writeCsv
+from src.pipeline import Pipeline, workload
+from src.shared import sharedHistory, attachedHistory
+
+''' Decode Config once, pool workers inherit it '''
+settings = Settings.load('./config/config.ini')
+
+resultDir = settings.resultDir
+channel = PoolChannel()
+
+def check(track, code, dates, results, weekBars, dayBars):
+    ''' Analyze every date again on its own, as the first run of the code on it, and report the dates the backfill got another result for.
+        Costs what the backfill saves, run it to verify the backfill rather than with it '''
+    if weekBars is None or dayBars is None:
+        weekBars, dayBars = track.history(code, dates[-1])
+
+    for date, result in zip(dates, results):
+        expected = track.historicalCalc(code, date, *historyAt(weekBars, dayBars, date), resume=False)
+
+        if result != expected:
+            print(u"\u001b[41;1m[ERROR/Check:" + str(code) + "]\u001b[0m " + date.strftime('%Y-%-m-%d') + " backfilled as " + str(result) + " instead of " + str(expected))
+
+def calc(x):
+    ''' Every date of the range for one code, packed per date. A code of the shared history is sliced from it instead of read '''
+    try:
+        track = TrackStock(settings=settings)
+        weekBars, dayBars = attachedHistory(x['shared'], x['code'])
+        results = track.backfillCalc(x['code'], x['dates'], weekBars, dayBars)
+
+        if x['check']:
+            check(track, x['code'], x['dates'], results, weekBars, dayBars)
+    except:
+        print(u"\u001b[41;1m[ERROR/Worker:" + str(x['code']) + "]\u001b[0m failed to call Track class")
+        results = [{'code': x['code'], 'state': 'failed calling'} for date in x['dates']]
+
+    return [channel.put([result]) for result in results]
+
+#Time Counting Declaration
+ts = time.time()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='historical analysis of every trading date in a range, one pass over the history of each code')
+    parser.add_argument('start', type=lambda s: datetime.strptime(s, '%Y-%m-%d'))
+    parser.add_argument('end', type=lambda s: datetime.strptime(s, '%Y-%m-%d'))
+    parser.add_argument('--shared', action='store_true', help='load the stored histories of all codes into shared memory once, the workers slice theirs from it instead of reading a file each')
+    parser.add_argument('--check', action='store_true', help='analyze every date of the range again on its own afterwards and report the results the backfill got otherwise. A verification only, it costs a whole historicalCalc per code and date')
+    parser.add_argument('--reset', action='store_true', help='remove the saved states first, so the range starts from the whole history')
+    args = parser.parse_args()
+
+    dates = settings.calendar.tradingDays(args.start, args.end)
+    codes = [int(code) for code in settings.codes]
+
+    if not dates:
+        print(u"\u001b[41;1m[ERROR/Master]\u001b[0m Stock market is not available between " + args.start.strftime('%Y-%-m-%d') + " and " + args.end.strftime('%Y-%-m-%d'))
+    else:
+        if args.reset:
+            for code in codes:
+                for mode in ['w', 'd']:
+                    for path in [settings.statePath(code, mode), settings.archivePath(code, mode)]:
+                        if os.path.exists(path):
+                            os.remove(path)
+
+        ''' One job per code over all dates, the histories are read at the last date. Shared before the pool starts '''
+        shared = sharedHistory(codes, dates[-1], settings.resources) if args.shared else {}
+        specs = {mode: universe.spec for mode, universe in shared.items()}
+        jobs = [{'code': code, 'dates': dates, 'shared': specs, 'check': args.check} for code in codes]
+
+        with Pipeline() as pipeline:
+            returned = pipeline.run(calc, jobs, weights=[workload(settings, code, 'd', dates[-1]) for code in codes])
+
+        for universe in shared.values():
+            universe.close()
+
+        returned = [r for r in returned if r is not None]
+
+        for i, date in enumerate(dates):
+            df = channel.collect([r[i] for r in returned], codes)
+
+            if not df.empty:
+                writeCsv(rank(df), resultDir + 'result_' + date.strftime('%Y-%-m-%d') + '.csv')
+            else:
+                print(u"\u001b[41;1m[ERROR/Master]\u001b[0m failed to calculate date, " + date.strftime('%Y-%-m-%d') + ", analysis")
+
+        print(u"[\u001b[32;1mDone/Master\u001b[0m] successfully backfilled " + str(len(dates)) + " trading dates")
+
+#Ending Area
+te = time.time()
+td = te - ts
+print("\n運行時間: ", (td/60) , "分.")
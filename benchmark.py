@@ -0,0 +1,392 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from datetime import datetime
+from contextlib import redirect_stdout
+
+import pandas as pd
+import numpy as np
+import configparser
+import subprocess
+import threading
+import platform
+import argparse
+import tempfile
+import json
+import glob
+import time
+import sys
+import os
+
+from src.storage import STORAGES
+from src.client import historyFrame
+from src.settings import Settings
+from src.stock import Stock
+from src.track import TrackStock
+from src.bars import BarSeries
+from src.metrics import metrics
+from src.synthetic import REGIMES, syntheticFrame, weeklyFrame
+from src import kernel
+from stub import history
+
+''' Decode Config '''
+config = configparser.ConfigParser()
+config.read('./config/config.ini')
+
+def benchStorage(args):
+    ''' Load time of every storage format over the same frames '''
+    if args.dir:
+        frames = [STORAGES['csv'].read(path) for path in sorted(glob.glob(os.path.join(args.dir, '*.csv')))[:args.codes * 2]]
+    else:
+        frames = [historyFrame(history(code, mode, int(datetime(2019, 3, 15).timestamp()))) for code in range(1101, 1101 + args.codes) for mode in ['w', 'd']]
+
+    print(u"[\u001b[1mINFO/Benchmark\u001b[0m] " + str(len(frames)) + " frames, " + str(sum(len(df) for df in frames)) + " sticks")
+
+    with tempfile.TemporaryDirectory() as tempDir:
+        for storage in STORAGES.values():
+            paths = [os.path.join(tempDir, str(i) + storage.extension) for i in range(len(frames))]
+
+            for df, path in zip(frames, paths):
+                storage.write(df, path)
+
+            ts = time.perf_counter()
+
+            for _ in range(args.rounds):
+                for path in paths:
+                    storage.read(path)
+
+            td = (time.perf_counter() - ts) / args.rounds
+            size = sum(os.path.getsize(path) for path in paths)
+            print("{:>6}  load {:8.4f} s  {:8.3f} ms/file  {:10d} bytes".format(storage.name, td, td * 1000 / len(paths), size))
+
+def benchSettings(args):
+    ''' Cost of building Stock objects with a fresh config parse each, as before, against the shared settings '''
+    source = historyFrame(history(1101, 'd', int(datetime(2019, 3, 15).timestamp())))
+    cases = [
+        ('parse', lambda: Stock(1101, 'd', datetime(2019, 3, 15), source=source, download_only=True, settings=Settings('./config/config.ini'))),
+        ('shared', lambda: Stock(1101, 'd', datetime(2019, 3, 15), source=source, download_only=True, settings=Settings.load('./config/config.ini')))
+    ]
+
+    for name, build in cases:
+        ts = time.perf_counter()
+
+        for _ in range(args.objects):
+            build()
+
+        td = time.perf_counter() - ts
+        print("{:>6}  {:8.4f} s  {:8.1f} us/object".format(name, td, td * 1e6 / args.objects))
+
+def benchBars(args):
+    ''' Memory of one code held as an analyzed DataFrame against a BarSeries '''
+    frames = [historyFrame(history(code, args.mode, int(datetime(2019, 3, 15).timestamp()))) for code in range(1101, 1101 + args.codes)]
+    frameBytes = barBytes = sticks = 0
+
+    for df in frames:
+        bars = BarSeries.fromFrame(df)
+        frameBytes += bars.toFrame().memory_usage(index=True, deep=True).sum()
+        barBytes += bars.nbytes
+        sticks += len(bars)
+
+    print(u"[\u001b[1mINFO/Benchmark\u001b[0m] " + str(len(frames)) + " codes, " + str(sticks) + " sticks")
+    print("{:>9}  {:10.1f} KiB/code  {:6.1f} B/stick".format('DataFrame', frameBytes / 1024 / len(frames), frameBytes / sticks))
+    print("{:>9}  {:10.1f} KiB/code  {:6.1f} B/stick".format('BarSeries', barBytes / 1024 / len(frames), barBytes / sticks))
+
+''' history.py analyzes this date, so the synthetic histories end on it '''
+PIPELINE_DATE = datetime(2019, 2, 27)
+STAGES = ['trend', 'circle', 'validate', 'estimate']
+
+class SyntheticSource():
+    ''' Local stand-in for the history service serving the synthetic histories, {(code, resolution): frame}, on a free port '''
+    def __init__(self, frames):
+        self.frames = frames
+        source = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                query = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+                body = json.dumps(source.history(query['symbol'], query['resolution'], int(query['to']), query.get('from'))).encode('utf-8')
+
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:' + str(self.server.server_address[1]) + '/Stock/tv/udf.asmx/history'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def history(self, symbol, resolution, to, since=None):
+        df = self.frames.get((int(symbol), resolution)) if str(symbol).isdigit() else None
+
+        if df is None:
+            return {'s': 'no_data', 'nextTime': None}
+
+        ''' Stock.download shifts the timestamp back by 10.5 hours before taking the date '''
+        stamps = np.array([int(datetime.strptime(d, '%Y-%m-%d').timestamp()) + 37800 for d in df['date']])
+        keep = (stamps - 37800 <= to) & (stamps >= float(since) if since is not None else True)
+
+        if not keep.any():
+            return {'s': 'no_data', 'nextTime': None}
+
+        return {
+            't': stamps[keep].tolist(),
+            'c': df['close'].values[keep].tolist(),
+            'o': df['open'].values[keep].tolist(),
+            'h': df['high'].values[keep].tolist(),
+            'l': df['low'].values[keep].tolist(),
+            'v': df['amount'].values[keep].tolist(),
+            's': 'ok',
+            'nextTime': None
+        }
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+def syntheticUniverse(args, calendar):
+    ''' args.codes codes per regime and length with their daily and weekly histories up to PIPELINE_DATE, trading days only. Returns {(regime, length): codes} and the frames '''
+    groups = {}
+    frames = {}
+    code = 9001
+
+    for regime in args.regimes:
+        for length in args.lengths:
+            groups[(regime, length)] = []
+
+            for _ in range(args.codes):
+                ''' Draw some sticks more than length, holidays drop out below '''
+                start = pd.bdate_range(end=PIPELINE_DATE, periods=int(length * 1.1) + 30)[0].to_pydatetime()
+                df = syntheticFrame(int(length * 1.1) + 30, args.volatility, regime, args.seed + code, start)
+                df = df.loc[[calendar.isTradingDay(datetime.strptime(d, '%Y-%m-%d')) for d in df['date']]].iloc[-length:].reset_index(drop=True)
+
+                frames[(code, 'd')] = df
+                frames[(code, 'w')] = weeklyFrame(df)
+                groups[(regime, length)].append(code)
+                code += 1
+
+    return groups, frames
+
+def writeConfig(root, args, url):
+    ''' config.ini of a data directory under root, laid out as setup.py does. It has no [Cache] section, so every run analyzes '''
+    config = configparser.ConfigParser()
+
+    config['Dir'] = {}
+    pathConfig = config['Dir']
+    pathConfig['Root'] = root
+    pathConfig['Config'] = root + '/config/'
+    pathConfig['Archive'] = root + '/data/archive/'
+    pathConfig['Resource'] = root + '/data/resource/'
+    pathConfig['Result'] = root + '/data/result/'
+    pathConfig['Log'] = root + '/log/'
+    pathConfig['Market'] = root + '/data/market.db'
+
+    config['Codes'] = {'CsvFile': pathConfig['Config'] + 'stock_name.csv'}
+    config['Schedule'] = {'CsvFile': os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config', 'holidays.csv')}
+    config['Storage'] = {'Format': args.storage, 'Resources': 'files'}
+    config['Client'] = {'Url': url, 'Retries': '1', 'Delay': '0', 'Timeout': '10'}
+
+    for key in ['Config', 'Archive', 'Resource', 'Result', 'Log']:
+        os.makedirs(pathConfig[key], exist_ok=True)
+
+    with open(pathConfig['Config'] + 'config.ini', 'w') as configfile:
+        config.write(configfile)
+
+    return pathConfig['Config'] + 'config.ini'
+
+def clearStates(settings):
+    for path in glob.glob(settings.archiveDir + 'save_*'):
+        os.remove(path)
+
+def record(results, bench, name, times, **fields):
+    results.append(dict(bench=bench, name=name, **fields, rounds=len(times), median=float(np.median(times)), min=float(np.min(times))))
+
+def benchStages(args, settings, groups, frames, results):
+    ''' Each stage of Stock as the analysis runs it, on the sticks as a BarSeries, from the times metrics records for it, and the whole analysis around them.
+        Every round is a fresh object from no state, without archive or cache '''
+    enabled = metrics.enabled
+    metrics.enable()
+
+    for (regime, length), codes in groups.items():
+        code = codes[0]
+        times = {name: [] for name in STAGES + ['analysis']}
+
+        for _ in range(args.rounds):
+            source = frames[(code, 'd')].copy()
+            metrics.reset()
+
+            ts = time.perf_counter()
+            Stock(code, 'd', PIPELINE_DATE, source=source, modifyArchive=False, settings=settings, cache=False, deep=True)
+            times['analysis'].append(time.perf_counter() - ts)
+
+            for name in STAGES:
+                times[name].append(metrics.stages.get(name, [0, 0.0])[1])
+
+        for name, values in times.items():
+            record(results, 'stage', name, values, regime=regime, length=length)
+
+    metrics.enabled = enabled
+    metrics.reset()
+
+def benchHistorical(args, settings, groups, results):
+    ''' TrackStock.historicalCalc per code over the stored resources, every round from no state '''
+    for (regime, length), codes in groups.items():
+        times = []
+
+        for _ in range(args.rounds):
+            clearStates(settings)
+
+            for code in codes:
+                ts = time.perf_counter()
+                TrackStock(settings=settings).historicalCalc(code, PIPELINE_DATE)
+                times.append(time.perf_counter() - ts)
+
+        record(results, 'track', 'historicalCalc', times, regime=regime, length=length)
+
+def benchHistory(args, root, settings, groups, results):
+    ''' The whole history.py run over every synthetic code, downloading from the local source, every round from no state '''
+    codes = [code for group in groups.values() for code in group]
+    pd.DataFrame({'code': codes, 'name': [str(code) for code in codes]}).to_csv(settings.config['Codes']['CsvFile'], index=False)
+    times = []
+    ranked = 0
+
+    for _ in range(args.rounds):
+        clearStates(settings)
+
+        ts = time.perf_counter()
+        subprocess.run([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'history.py')] + args.history, cwd=root, stdout=subprocess.DEVNULL, check=True)
+        times.append(time.perf_counter() - ts)
+
+        path = settings.resultDir + 'result_' + PIPELINE_DATE.strftime('%Y-%-m-%d') + '.csv'
+        ranked = len(pd.read_csv(path)) if os.path.exists(path) else 0
+
+    record(results, 'flow', 'history.py', times, codes=len(codes), ranked=ranked)
+
+def gitCommit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True).stdout.strip()
+    except:
+        return None
+
+def compareReports(report, baseline, tolerance):
+    ''' Ratio of every timing to the same one of baseline. Returns whether any got slower than tolerance allows '''
+    identify = lambda r: tuple((k, r[k]) for k in sorted(r) if k not in ['rounds', 'median', 'min', 'ranked'])
+    before = {identify(r): r for r in baseline['results']}
+    regressed = False
+
+    print(u"[\u001b[1mINFO/Benchmark\u001b[0m] against " + str(baseline.get('commit')))
+
+    if baseline.get('parameters') != report['parameters']:
+        print(u"\u001b[33;1m[WARNING/Benchmark]\u001b[0m the reports were run with different parameters, codes and sticks differ")
+
+    for r in report['results']:
+        if identify(r) not in before:
+            continue
+
+        ratio = r['median'] / before[identify(r)]['median'] if before[identify(r)]['median'] > 0 else float('inf')
+        slower = ratio > 1 + tolerance
+        regressed = regressed or slower
+        label = ' '.join(str(v) for k, v in identify(r) if k not in ['bench', 'name'])
+        print((u"\u001b[41;1m" if slower else "") + "{:>6} {:>14}  {:<20} {:8.2f}x".format(r['bench'], r['name'], label, ratio) + (u"\u001b[0m" if slower else ""))
+
+    return regressed
+
+def benchPipeline(args):
+    ''' Stages of Stock, historicalCalc and the history.py run over synthetic histories in a temporary data directory, written as a JSON report '''
+    with tempfile.TemporaryDirectory() as root:
+        groups, frames = syntheticUniverse(args, Settings.load('./config/config.ini').calendar)
+        source = SyntheticSource(frames)
+
+        try:
+            settings = Settings.load(writeConfig(root, args, source.url))
+
+            for (code, mode), df in frames.items():
+                settings.resources.write(code, mode, PIPELINE_DATE, df)
+
+            results = []
+
+            ''' print() of the analysis would bury the timings '''
+            with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+                if 'stage' in args.benches:
+                    benchStages(args, settings, groups, frames, results)
+
+                if 'track' in args.benches:
+                    benchHistorical(args, settings, groups, results)
+
+            if 'flow' in args.benches:
+                benchHistory(args, root, settings, groups, results)
+        finally:
+            source.close()
+
+    report = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'commit': gitCommit(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'kernel': 'compiled' if kernel._kernel is not None else 'numpy',
+        'parameters': {'lengths': args.lengths, 'regimes': args.regimes, 'volatility': args.volatility, 'codes': args.codes, 'rounds': args.rounds, 'seed': args.seed, 'storage': args.storage, 'history': args.history},
+        'results': results
+    }
+
+    for r in results:
+        label = ' '.join(str(v) for k, v in r.items() if k not in ['bench', 'name', 'rounds', 'median', 'min'])
+        print("{:>6} {:>14}  {:<20} median {:10.4f} s  min {:10.4f} s".format(r['bench'], r['name'], label, r['median'], r['min']))
+
+    with open(args.report, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print(u"[\u001b[32;1mDone/Benchmark\u001b[0m] report written to " + args.report)
+
+    if args.compare:
+        with open(args.compare) as f:
+            if compareReports(report, json.load(f), args.tolerance):
+                sys.exit(1)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='micro benchmarks of the analysis program')
+    subparsers = parser.add_subparsers(dest='bench')
+
+    storageParser = subparsers.add_parser('storage', help='compare resource load times of the storage formats')
+    storageParser.add_argument('--dir', help='resource directory of one date, synthetic frames when omitted')
+    storageParser.add_argument('--codes', type=int, default=100)
+    storageParser.add_argument('--rounds', type=int, default=3)
+    storageParser.set_defaults(func=benchStorage)
+
+    settingsParser = subparsers.add_parser('settings', help='Stock construction with and without a config parse per object')
+    settingsParser.add_argument('--objects', type=int, default=2000)
+    settingsParser.set_defaults(func=benchSettings)
+
+    barsParser = subparsers.add_parser('bars', help='memory per code of a DataFrame against a BarSeries')
+    barsParser.add_argument('--codes', type=int, default=50)
+    barsParser.add_argument('--mode', choices=['w', 'd'], default='d')
+    barsParser.set_defaults(func=benchBars)
+
+    pipelineParser = subparsers.add_parser('pipeline', help='time the analysis stages, historicalCalc and history.py over synthetic histories, written as a JSON report')
+    pipelineParser.add_argument('--lengths', type=lambda s: [int(x) for x in s.split(',')], default=[250, 1000, 2500], help='daily sticks per code, comma separated')
+    pipelineParser.add_argument('--regimes', type=lambda s: s.split(','), default=REGIMES, help='comma separated of ' + ', '.join(REGIMES))
+    pipelineParser.add_argument('--volatility', type=float, default=0.02, help='standard deviation of the daily log return')
+    pipelineParser.add_argument('--codes', type=int, default=2, help='codes per regime and length')
+    pipelineParser.add_argument('--rounds', type=int, default=3)
+    pipelineParser.add_argument('--seed', type=int, default=0)
+    pipelineParser.add_argument('--storage', choices=list(STORAGES), default='csv', help='format of the resources and archives')
+    pipelineParser.add_argument('--benches', type=lambda s: s.split(','), default=['stage', 'track', 'flow'], help='comma separated of stage, track, flow')
+    pipelineParser.add_argument('--history', nargs=argparse.REMAINDER, default=[], help='arguments of history.py, the rest of the command line')
+    pipelineParser.add_argument('--report', default='benchmark.json', help='JSON report to write')
+    pipelineParser.add_argument('--compare', help='JSON report of an earlier run, exit with 1 when a timing got slower than the tolerance')
+    pipelineParser.add_argument('--tolerance', type=float, default=0.2, help='allowed slowdown against --compare, 0.2 is 20%%')
+    pipelineParser.set_defaults(func=benchPipeline)
+
+    args = parser.parse_args()
+
+    if hasattr(args, 'func'):
+        args.func(args)
+    else:
+        parser.print_help()
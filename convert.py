@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+from datetime import datetime
+
+import configparser
+import argparse
+import glob
+import time
+import os
+
+from src.storage import STORAGES
+from src.market import MarketStore
+from src.state import StockState
+
+''' Decode Config '''
+config = configparser.ConfigParser()
+config.read('./config/config.ini')
+
+#Time Counting Declaration
+ts = time.time()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='convert the resource and archive trees between storage formats')
+    parser.add_argument('--from', dest='source', choices=list(STORAGES), default='csv')
+    parser.add_argument('--to', dest='target', choices=list(STORAGES) + ['market', 'state'], default='npy', help='market imports the per-date resource directories into the single market store, state turns the archives into state files')
+    parser.add_argument('--remove', action='store_true', help='delete each source file once converted')
+    args = parser.parse_args()
+
+    source = STORAGES[args.source]
+
+    if args.target == 'state':
+        paths = glob.glob(config['Dir']['Archive'] + 'save_*' + source.extension)
+    elif args.target == 'market':
+        ''' Oldest date first, so every directory only adds the bars the store has not seen '''
+        target = MarketStore(config['Dir']['Market'])
+        paths = sorted(glob.glob(config['Dir']['Resource'] + '*/*' + source.extension), key=lambda path: datetime.strptime(os.path.basename(os.path.dirname(path)), '%Y-%m-%d'))
+    else:
+        target = STORAGES[args.target]
+        paths = glob.glob(config['Dir']['Resource'] + '*/*' + source.extension) + glob.glob(config['Dir']['Archive'] + 'save_*' + source.extension)
+
+    converted = 0
+
+    for path in paths:
+        try:
+            if args.target == 'state':
+                StockState.fromArchive(source.read(path)).save(path[:-len(source.extension)] + '.state')
+            elif args.target == 'market':
+                code, resolution = os.path.basename(path)[:-len(source.extension)].split('_')
+                target.write(code, resolution, None, source.read(path))
+            else:
+                target.write(source.read(path), path[:-len(source.extension)] + target.extension)
+
+            converted += 1
+
+            if args.remove:
+                os.remove(path)
+        except:
+            print(u"\u001b[41;1m[ERROR/Master]\u001b[0m failed to convert " + path)
+
+    if args.target == 'state':
+        print(u"[\u001b[32;1mDone/Master\u001b[0m] converted " + str(converted) + "/" + str(len(paths)) + " archives, state files are used as soon as they exist")
+    else:
+        print(u"[\u001b[32;1mDone/Master\u001b[0m] converted " + str(converted) + "/" + str(len(paths)) + " files, set " + ("[Storage] Resources = market" if args.target == 'market' else "[Storage] Format = " + target.name) + " to use them")
+
+#Ending Area
+te = time.time()
+td = te - ts
+print("\n運行時間: ", td , "秒.")
@@ -4,112 +4,171 @@ from dateutil.parser import parse
 
 import pandas as pd
 import numpy as np
-import multiprocessing as mp
-import configparser
+import threading
 import time
 import os
-import json
-import redis
+import argparse
 
 from src.stock import Stock
 from src.track import *
-
-''' Decode Config '''
-config = configparser.ConfigParser()
-config.read('./config/config.ini')
-
-resultDir = config['Dir']['Result']
-resourcesDir = config['Dir']['Resource']
+from src.fetch import BulkDownloader
+from src.settings import Settings
+from src.client import HistoryClient
+from src.sync import DeltaSync
+from src.results import PoolChannel, RedisChannel, FAILED_STATES, rank, writeCsv
+from src.pipeline import Pipeline
+from src.ledger import JobLedger
+from src.metrics import metrics
+from src.shared import sharedHistory, attachedHistory
+
+''' Decode Config once, pool workers inherit it '''
+settings = Settings.load('./config/config.ini')
+
+resultDir = settings.resultDir
+resources = settings.resources
 
 def calc(x):
-    try:
-        res = TrackStock().historicalCalc(x['code'], x['date'])
-    except:
-        print(u"\u001b[41;1m[ERROR/Worker:" + str(x['code']) + "]\u001b[0m failed to call Track class")
-        res = {'code': x['code'], 'state': 'failed calling'}
+    ''' Analyze a batch of codes and hand the results to the channel packed together. failed marks a batch with a code worth another attempt.
+        metrics carries what the worker measured since its last batch, downloads it ran in between included. Codes of a shared history are sliced from it instead of read.
+        A code without a stick on the date comes back as None, it is left out of the results like pack leaves it out '''
+    results = []
 
-    r = redis.Redis(host='localhost', port=6379, db=0)
-    r.set(str(x['code']) + x['date'].strftime('%m%d'), str(res))
+    for code in x['codes']:
+        with metrics.job(code):
+            try:
+                weekBars, dayBars = attachedHistory(x['shared'], code)
+                res = TrackStock(settings=settings).historicalCalc(code, x['date'], weekBars, dayBars)
+            except:
+                print(u"\u001b[41;1m[ERROR/Worker:" + str(code) + "]\u001b[0m failed to call Track class")
+                res = {'code': code, 'state': 'failed calling'}
 
-    return res
+        results.append(res)
+
+    return {'returned': x['channel'].put(results), 'failed': any(r is not None and r['state'] in FAILED_STATES for r in results), 'metrics': metrics.take()}
 
 def download(x):
+    ''' A resumed run keeps the downloads of the run before it '''
+    if x['fetched']:
+        return x['fetched']
+
     try:
-        weekilyData = Stock(x['code'], 'w', x['date'], download_only = True).download(all = True)
-        dailyData = Stock(x['code'], 'd', x['date'], download_only = True).download(all = True)
+        if x['incremental']:
+            ''' Only the bars after the stored history travel, the sync writes them itself '''
+            sync = DeltaSync(resources, HistoryClient.shared(settings.configPath))
+            weekilyData = sync.sync(x['code'], 'w', x['date'])
+            dailyData = sync.sync(x['code'], 'd', x['date'])
+        else:
+            weekilyData = Stock(x['code'], 'w', x['date'], download_only = True, settings = settings).download(all = True)
+            dailyData = Stock(x['code'], 'd', x['date'], download_only = True, settings = settings).download(all = True)
+
+            if not weekilyData.empty and not dailyData.empty:
+                resources.write(x['code'], 'w', x['date'], weekilyData)
+                resources.write(x['code'], 'd', x['date'], dailyData)
 
         if not weekilyData.empty and not dailyData.empty:
-            weekilyData.to_csv(x['resourcesDir'] + str(x['code']) + '_w.csv', encoding='utf_8')
-            dailyData.to_csv(x['resourcesDir'] + str(x['code']) + '_d.csv', encoding='utf_8')
-
-            return True
+            return len(dailyData)
         
         raise ValueError('data is not downloaded completely')
     except:
         print(u"\u001b[41;1m[ERROR/Worker:" + str(x['code']) + "]\u001b[0m failed to download the resource")
 
-        return False
+        return 0
 
 #Time Counting Declaration
 ts = time.time()
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--fetch', choices=['pool', 'async'], default='pool', help='download with a process pool, or with asyncio while the analysis pool starts on finished codes')
+    parser.add_argument('--concurrency', type=int, default=200, help='requests in flight in async mode')
+    parser.add_argument('--rate', type=float, default=50, help='requests started per second in async mode')
+    parser.add_argument('--incremental', action='store_true', help='request only the bars after the stored history and merge them in')
+    parser.add_argument('--results', choices=['pool', 'redis'], default='pool', help='return packed results through the pool, or keep them in Redis')
+    parser.add_argument('--resume', action='store_true', help='continue the last run of the date, skipping the codes it finished')
+    parser.add_argument('--attempts', type=int, default=3, help='runs a failing code gets before a resumed run leaves it failed')
+    parser.add_argument('--shared', action='store_true', help='load the stored histories of the date into shared memory once, the workers analyze from it. Only codes whose history ends before the date download')
+    parser.add_argument('--profile', action='store_true', help='time every stage of the analysis and print a summary of the run with its slowest codes')
+    parser.add_argument('--slowest', type=int, default=10, help='codes in the slowest table of --profile')
+    args = parser.parse_args()
+
+    ''' Before the pool forks, so the workers measure too '''
+    if args.profile:
+        metrics.enable()
+
     date = datetime(2019, 2, 27).replace(hour = 0, minute = 0, second = 0, microsecond = 0) #目前日期
 
     #Processing
     if not isHoliday(date):
-        r = redis.Redis(host='localhost', port=6379, db=0)
-        codes = pd.read_csv(config['Codes']['CsvFile'])['code']
-
-        ''' Prepare materials '''
-        resourcesDir = resourcesDir + date.strftime('%Y-%-m-%d') + '/'
-
-        if not os.path.exists(resourcesDir):
-            os.makedirs(resourcesDir)
-
-        r.flushdb()
-
-        ''' Multiple Processing '''
-        with mp.Pool() as pool:
-            jobs = pool.map_async(download, \
-                [{'code': int(codes.iloc[i]), 'date': date, 'resourcesDir': resourcesDir} for i in range(len(codes))], \
-                int(len(codes) / mp.cpu_count()) + 1)
-
-            pool.close()
-            pool.join()
-
-        ''' Multiple Processing '''
-        with mp.Pool() as pool:
-            jobs = pool.map_async(calc, \
-                [{'code': int(codes.iloc[i]), 'date': date} for i in range(len(codes))], \
-                int(len(codes) / mp.cpu_count() / 2) + 1)
-
-            pool.close()
-            pool.join()
-
-            if jobs.ready():
-                df = pd.DataFrame(columns = ['code', 'state', 'gain_rate'])
-
-                for code in codes:
-                    data = r.get(str(code) + date.strftime('%m%d'))
-
-                    if data != None and data != 'None':
-                        df = df.append(json.loads(data.replace("'", '"')), ignore_index=True)
-
-                if not df.empty:
-                    df = pd.concat([
-                        df.loc[df['state'] == 'SynBT'].sort_values(by=['gain_rate'], ascending=False),
-                        df.loc[df['state'] == 'SynFT'].sort_values(by=['gain_rate'], ascending=False),
-                        df.loc[df['state'] == 'RiseBT'].sort_values(by=['gain_rate'], ascending=False),
-                        df.loc[df['state'] == 'DropFT'].sort_values(by=['gain_rate'], ascending=False),
-                        df.loc[(df['state'] == 'Rise') | (df['state'] == 'Drop')].sort_values(by=['code'])
-                    ])
-                    df['gain_rate'] = df['gain_rate'].map(lambda x: round(x, 3))
-
-                    df.to_csv(resultDir + 'result_' + date.strftime('%Y-%-m-%d') + '.csv', encoding='utf_8')
-                    print(u"[\u001b[32;1mDone/Master\u001b[0m] successfully analyzed historical calculations")
-                else:
-                    print(u"\u001b[41;1m[ERROR/Master]\u001b[0m failed to calculate date, " + date.strftime('%Y-%-m-%d') + ", analysis")
+        codes = settings.codes
+        channel = RedisChannel(date.strftime('%m%d')) if args.results == 'redis' else PoolChannel()
+        ledger = JobLedger(resultDir + 'ledger_' + date.strftime('%Y-%-m-%d') + '.db')
+
+        ''' A fresh run forgets the finished work of the last one, a resumed run builds on it '''
+        if not args.resume:
+            ledger.clear()
+
+            if args.results == 'redis':
+                channel.clear()
+
+        done = ledger.load()
+        pending = ledger.pending([int(code) for code in codes], args.attempts)
+        print(u"[\u001b[1mINFO/Master\u001b[0m] " + str(len(pending)) + "/" + str(len(codes)) + " codes to analyze")
+
+        ''' Before the pool starts. A code stored up to the date counts as downloaded and its jobs carry the names of the blocks '''
+        shared = sharedHistory(pending, date, resources) if args.shared else {}
+        specs = {mode: universe.spec for mode, universe in shared.items()}
+        ready = {code for code in pending if shared and shared['w'].reaches(code, date - timedelta(days=date.weekday())) and shared['d'].reaches(code, date)}
+
+        if args.shared:
+            print(u"[\u001b[1mINFO/Master\u001b[0m] " + str(len(ready)) + "/" + str(len(pending)) + " codes analyze from the shared history")
+
+        ''' One job per code. Download and analysis share one pool, a code is analyzed as soon as it is downloaded and the longest histories go first '''
+        jobs = [{'code': code, 'codes': [code], 'date': date, 'incremental': args.incremental, 'channel': channel, 'shared': specs if code in ready else None, \
+            'fetched': done[str(code)][0] if str(code) in done else (shared['d'].size(code) if code in ready else None)} for code in pending]
+
+        def progress(kind, i, value):
+            ''' Record each finished stage as it arrives, a crash loses only the jobs in flight '''
+            if kind == 'fetched':
+                if value:
+                    ledger.fetched(jobs[i]['code'], value)
+            else:
+                ledger.analyzed(jobs[i]['code'], value['returned'] if value is not None else None, value is None or value['failed'])
+                metrics.merge(value['metrics'] if value is not None else None)
+
+        with Pipeline() as pipeline:
+            if args.fetch == 'async':
+                ''' Download with asyncio in a thread of the master, it offers each finished code to the pipeline. Codes downloaded before are offered at once '''
+                position = {job['code']: i for i, job in enumerate(jobs)}
+
+                for i, job in enumerate(jobs):
+                    if job['fetched']:
+                        pipeline.offer(i, job['fetched'])
+
+                downloader = threading.Thread(target=BulkDownloader(args.concurrency, args.rate, args.incremental, settings=settings).run, \
+                    args=([job['code'] for job in jobs if not job['fetched']], date, lambda code, bars: pipeline.offer(position[code], bars)))
+                downloader.start()
+                pipeline.run(calc, jobs, external=True, progress=progress)
+                downloader.join()
+            else:
+                pipeline.run(calc, jobs, fetch=download, progress=progress)
+
+        for universe in shared.values():
+            universe.close()
+
+        ''' Build the whole result frame from the packed batches of this run and the ones before it at once '''
+        done = ledger.load()
+        df = channel.collect([done[str(int(code))][1] for code in codes if str(int(code)) in done and done[str(int(code))][1] is not None], [int(code) for code in codes])
+
+        if not df.empty:
+            df = rank(df)
+
+            writeCsv(df, resultDir + 'result_' + date.strftime('%Y-%-m-%d') + '.csv')
+            print(u"[\u001b[32;1mDone/Master\u001b[0m] successfully analyzed historical calculations")
+        else:
+            print(u"\u001b[41;1m[ERROR/Master]\u001b[0m failed to calculate date, " + date.strftime('%Y-%-m-%d') + ", analysis")
+
+        if args.profile:
+            print('\n'.join(metrics.summary(args.slowest)))
     else:
         print(u"\u001b[41;1m[ERROR/Master]\u001b[0m Stock market is not available in this date, " + date.strftime('%Y-%-m-%d'))
 
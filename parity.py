@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+from datetime import datetime
+
+import pandas as pd
+import numpy as np
+import multiprocessing as mp
+import time
+import sys
+import os
+
+from src.stock import Stock
+from src.settings import Settings
+from src import kernel
+
+''' Decode Config once, pool workers inherit it '''
+settings = Settings.load('./config/config.ini')
+
+resources = settings.resources
+
+def compare(x):
+    ''' Run both trend engines over the same resource and report the sticks they disagree on '''
+    mismatch = {}
+
+    for mode in ['w', 'd']:
+        try:
+            source = resources.read(x['code'], mode, x['date'])
+        except:
+            continue
+
+        if source.empty:
+            continue
+
+        reference = Stock(x['code'], mode, x['date'], source=source.copy(), download_only=True, engine='reference', settings=settings).trend()['turn'].values
+        fast = Stock(x['code'], mode, x['date'], source=source.copy(), download_only=True, engine='numpy', settings=settings).trend()['turn'].values
+
+        if not np.array_equal(reference, fast):
+            mismatch[mode] = np.flatnonzero(reference != fast).tolist()
+
+        ''' The compiled kernel against the NumPy one, turns and circles '''
+        if kernel._kernel is not None:
+            high, low, close = source['high'].values, source['low'].values, source['close'].values
+            turns = kernel.findTurnsNumpy(high, low)
+            compiled = kernel.findTurns(high, low)
+
+            if not np.array_equal(turns, compiled):
+                mismatch[mode + '/compiled'] = np.flatnonzero(turns != compiled).tolist()
+            elif not all(np.array_equal(a, b) for a, b in zip(kernel.markCirclesNumpy(high, low, close, turns), kernel.markCircles(high, low, close, turns))):
+                mismatch[mode + '/circles'] = 'kT/dT differ'
+
+    return {'code': x['code'], 'mismatch': mismatch}
+
+#Time Counting Declaration
+ts = time.time()
+
+if __name__ == '__main__':
+    date = datetime.strptime(sys.argv[1], '%Y-%m-%d') if len(sys.argv) > 1 else datetime(2019, 2, 27)
+    codes = settings.codes
+
+    with mp.Pool() as pool:
+        results = pool.map(compare, [{'code': int(code), 'date': date} for code in codes])
+
+    failed = [r for r in results if r['mismatch']]
+
+    for r in failed:
+        print(u"\u001b[41;1m[ERROR/Parity:" + str(r['code']) + "]\u001b[0m turn mismatch at " + str(r['mismatch']))
+
+    print(u"[\u001b[32;1mDone/Master\u001b[0m] " + str(len(codes) - len(failed)) + "/" + str(len(codes)) + " codes have identical turns" + (" in all kernels" if kernel._kernel is not None else ", compiled kernel not built"))
+
+#Ending Area
+te = time.time()
+td = te - ts
+print("\n運行時間: ", td , "秒.")
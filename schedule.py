@@ -3,64 +3,123 @@
 
 from datetime import datetime, timedelta
 from src.stock import Stock
-from src.track import TrackStock, isHoliday
+from src.track import TrackStock
+from src.settings import Settings
+from src.pipeline import Pipeline, workload
+from src.ledger import JobLedger
+from src.results import FAILED_STATES, NEEDS_HISTORY, writeCsv
+from src.metrics import metrics
 
 import pandas as pd
-import multiprocessing as mp
-import configparser
 import sys
 import os
 import time
 import glob
+import argparse
 
-''' Decode Config '''
-config = configparser.ConfigParser()
-config.read('./config/config.ini')
+''' Decode Config once, pool workers inherit it '''
+settings = Settings.load('./config/config.ini')
 
-resultDir = config['Dir']['Result']
+resultDir = settings.resultDir
+calendar = settings.calendar
 
 try:
     terminalCols, terminalRows = os.get_terminal_size(0)
 except OSError:
     terminalCols, terminalRows = os.get_terminal_size(1)
 
+def measured(result):
+    ''' The result with what the worker measured since its last job, the master takes it out again '''
+    if metrics.enabled:
+        result['metrics'] = metrics.take()
+
+    return result
+
 def dayilyCalc(x):
-    return TrackStock().dailyCalc(x['code'], x['preStat'], x['date'])
+    with metrics.job(x['code']):
+        result = TrackStock(settings=settings).dailyCalc(x['code'], x['preStat'], x['date'], 'd' in x.get('deep', ''))
+
+    return measured(result)
 
 def weeklyCalc(x):
-    return TrackStock().weeklyCalc(x['code'], x['date'])
+    with metrics.job(x['code']):
+        result = TrackStock(settings=settings).weeklyCalc(x['code'], x['date'], x.get('deep', ''))
+
+    return measured(result)
+
+def runPhase(pipeline, calc, jobs, mode, ledger, resume, attempts):
+    ''' Results of a phase in the order of jobs. The ledger records every finished job, a resumed phase only runs the jobs left unfinished or failed.
+        Codes whose stored sticks miss the history their analysis needs are gathered and analyzed again in one pass over their whole history '''
+    if not resume:
+        ledger.clear()
+
+    pending = set(ledger.pending([job['code'] for job in jobs], attempts))
+    todo = [job for job in jobs if job['code'] in pending]
+    print(u"[\u001b[1mINFO/Master\u001b[0m] " + str(len(todo)) + "/" + str(len(jobs)) + " codes to analyze")
+
+    def record(todo):
+        def progress(kind, i, value):
+            if value is not None:
+                metrics.merge(value.pop('metrics', None))
+
+            ledger.analyzed(todo[i]['code'], value, value is None or value['state'] in FAILED_STATES)
+
+        return progress
+
+    ''' Multiple Processing, longest histories first '''
+    results = pipeline.run(calc, todo, weights=[workload(settings, job['code'], mode, job['date']) for job in todo], progress=record(todo))
+
+    deeper = [dict(job, deep=result['deep']) for job, result in zip(todo, results) if result is not None and result['state'] == NEEDS_HISTORY]
+
+    if deeper:
+        print(u"[\u001b[1mINFO/Master\u001b[0m] " + str(len(deeper)) + " codes need a deeper history, analyzing them again over their whole history")
+        metrics.count('deeper history', len(deeper))
+        pipeline.run(calc, deeper, weights=[workload(settings, job['code'], mode, job['date']) for job in deeper], progress=record(deeper))
+
+    done = ledger.load()
+
+    return [done[str(job['code'])][1] for job in jobs if str(job['code']) in done]
 
 #Time Counting Declaration
 ts = time.time()
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--resume', action='store_true', help='skip the finished dates and continue the phase a crash stopped in')
+    parser.add_argument('--attempts', type=int, default=3, help='runs a failing code gets before a resumed phase leaves it failed')
+    parser.add_argument('--profile', action='store_true', help='time every stage of the analysis and print a summary of the run with its slowest codes')
+    parser.add_argument('--slowest', type=int, default=10, help='codes in the slowest table of --profile')
+    args = parser.parse_args()
+
+    ''' Before the pool forks, so the workers measure too '''
+    if args.profile:
+        metrics.enable()
+
     startDate = datetime(2019, 3, 15).replace(hour=0, minute=0, second=0, microsecond=0)
     endDate = datetime(2019, 3, 15).replace(hour=0, minute=0, second=0, microsecond=0)
 
     print("\n" + u"\u001b[1m\u001b[4m\u001b[7m C.C Stock Analysis Program \u001b[0m".center(terminalCols) + "\n")
 
+    ''' One worker pool for every date and both phases '''
+    pipeline = Pipeline()
+
     for d in range((endDate - startDate).days, -1, -1):
         currentDate = (endDate - timedelta(days=d))
         resultFilePath = resultDir + 'result_' + currentDate.strftime('%Y-%-m-%d') + '.csv'
 
         #Only Work when available
-        if not isHoliday(currentDate):
+        if args.resume and os.path.exists(resultFilePath) and not os.path.exists(resultDir + 'result_tmp_' + currentDate.strftime('%Y-%-m-%d') + '.csv'):
+            print(u"[\u001b[1mINFO/Master\u001b[0m] skipping finished date, " + currentDate.strftime('%Y-%-m-%d'))
+        elif calendar.isTradingDay(currentDate):
             df = pd.DataFrame([])
 
             ''' Daily K Calculation '''
             if not os.path.exists(resultDir + 'result_tmp_' + currentDate.strftime('%Y-%-m-%d') + '.csv') and not not glob.glob(resultDir + '*.csv'):
-                lastResultDate = currentDate
-
-                while True:
-                    lastResultDate -= timedelta(days=1)
-
-                    if not isHoliday(lastResultDate):
-                        break
-
+                lastResultDate = calendar.prevTradingDay(currentDate)
                 lastResultPath = resultDir + 'result_' + lastResultDate.strftime('%Y-%-m-%d') + '.csv'
                 
                 ''' Repeat File Deletion '''
-                if os.path.exists(resultFilePath):
+                if os.path.exists(resultFilePath) and not args.resume:
                     os.remove(resultFilePath)
                     print(u"\u001b[41;1m[WARNING/Master]\u001b[0m removing overlaped file: " + os.path.basename(resultFilePath))
 
@@ -69,65 +128,51 @@ if __name__ == '__main__':
                 codes = pd.read_csv(lastResultPath, index_col=0)
                 codes = codes.loc[(codes['state'] == 'Rise') | (codes['state'] == 'Drop')]
 
-                ''' Multiple Processing '''
-                with mp.Pool() as pool:
-                    jobs = pool.map_async(dayilyCalc, \
-                        [{'code': int(codes['code'].iloc[i]), 'preStat': codes['state'].iloc[i], 'date': currentDate} for i in range(len(codes))], \
-                        int(len(codes) / mp.cpu_count() / 2) + 1)
-
-                    pool.close()
-                    pool.join()
+                jobs = [{'code': int(codes['code'].iloc[i]), 'preStat': codes['state'].iloc[i], 'date': currentDate} for i in range(len(codes))]
+                results = runPhase(pipeline, dayilyCalc, jobs, 'd', JobLedger(resultDir + 'ledger_daily_' + currentDate.strftime('%Y-%-m-%d') + '.db'), args.resume, args.attempts)
 
-                    if jobs.ready():
-                        df = pd.DataFrame(jobs.get(), columns=['code', 'state', 'gain_rate'])
+                df = pd.DataFrame([r for r in results if r is not None], columns=['code', 'state', 'gain_rate'])
 
-                        if not df.empty:
-                            df = pd.concat([
-                                df.loc[df['state'] == 'RiseBT'].sort_values(by=['gain_rate'], ascending=False),
-                                df.loc[df['state'] == 'DropFT'].sort_values(by=['gain_rate'], ascending=False),
-                                df.loc[(df['state'] == 'Rise') | (df['state'] == 'Drop')].sort_values(by=['code'])
-                            ])
+                if not df.empty:
+                    df = pd.concat([
+                        df.loc[df['state'] == 'RiseBT'].sort_values(by=['gain_rate'], ascending=False),
+                        df.loc[df['state'] == 'DropFT'].sort_values(by=['gain_rate'], ascending=False),
+                        df.loc[(df['state'] == 'Rise') | (df['state'] == 'Drop')].sort_values(by=['code'])
+                    ])
 
-                            df.to_csv(resultDir + 'result_' + ('tmp_' if isHoliday((currentDate + timedelta(days=1))) else '') + currentDate.strftime('%Y-%-m-%d') + '.csv', encoding='utf_8')
-                            print(u"[\u001b[32;1mDone/Master\u001b[0m] successfully analyzed daily calculations")
-                        else:
-                            print(u"\u001b[41;1m[ERROR/Master]\u001b[0m failed to calculate date, " + currentDate.strftime('%Y-%-m-%d') + ", analysis")
+                    writeCsv(df, resultDir + 'result_' + ('tmp_' if not calendar.isTradingDay(currentDate + timedelta(days=1)) else '') + currentDate.strftime('%Y-%-m-%d') + '.csv')
+                    print(u"[\u001b[32;1mDone/Master\u001b[0m] successfully analyzed daily calculations")
+                else:
+                    print(u"\u001b[41;1m[ERROR/Master]\u001b[0m failed to calculate date, " + currentDate.strftime('%Y-%-m-%d') + ", analysis")
 
             ''' Weekly K Calculation '''
-            if isHoliday((currentDate + timedelta(days=1))):
+            if not calendar.isTradingDay(currentDate + timedelta(days=1)):
                 print(u"[\u001b[1mINFO/Master\u001b[0m] continue calculation, start weekly analysis")
 
-                codes = pd.read_csv(config['Codes']['CsvFile'])['code']
-
-                ''' Multiple Processing '''
-                with mp.Pool() as pool:
-                    jobs = pool.map_async(weeklyCalc, \
-                        [{'code': int(codes.iloc[i]), 'date': currentDate} for i in range(len(codes))], \
-                        int(len(codes) / mp.cpu_count() / 2) + 1)
-
-                    pool.close()
-                    pool.join()
-
-                    if jobs.ready():
-                        df = pd.DataFrame(jobs.get(), columns=['code', 'state', 'gain_rate'])
-
-                        if not df.empty:
-                            df = pd.concat([pd.read_csv(resultDir + 'result_tmp_' + currentDate.strftime('%Y-%-m-%d') + '.csv', index_col=0), 
-                            df.loc[(df['state'] != 'Unfit') & (df['state'] != 'fail')]], sort=False).drop_duplicates(['code'], keep='last')
-                            df = pd.concat([
-                                df.loc[df['state'] == 'SynBT'].sort_values(by=['gain_rate'], ascending=False),
-                                df.loc[df['state'] == 'SynFT'].sort_values(by=['gain_rate'], ascending=False),
-                                df.loc[df['state'] == 'RiseBT'].sort_values(by=['gain_rate'], ascending=False),
-                                df.loc[df['state'] == 'DropFT'].sort_values(by=['gain_rate'], ascending=False),
-                                df.loc[(df['state'] == 'Rise') | (df['state'] == 'Drop')].sort_values(by=['code'])
-                            ])
-                            df['gain_rate'] = df['gain_rate'].map(lambda x: round(x, 3))
-
-                            df.to_csv(resultDir + 'result_' + currentDate.strftime('%Y-%-m-%d') + '.csv', encoding='utf_8')
-                            os.remove(resultDir + 'result_tmp_' + currentDate.strftime('%Y-%-m-%d') + '.csv')
-                            print(u"[\u001b[32;1mDone/Master\u001b[0m] successfully analyzed weekly calculations")
-                        else:
-                            print(u"\u001b[41;1m[ERROR/Master]\u001b[0m failed to calculate date, " + currentDate.strftime('%Y-%-m-%d') + ", analysis")
+                codes = settings.codes
+
+                jobs = [{'code': int(codes.iloc[i]), 'date': currentDate} for i in range(len(codes))]
+                results = runPhase(pipeline, weeklyCalc, jobs, 'w', JobLedger(resultDir + 'ledger_weekly_' + currentDate.strftime('%Y-%-m-%d') + '.db'), args.resume, args.attempts)
+
+                df = pd.DataFrame([r for r in results if r is not None], columns=['code', 'state', 'gain_rate'])
+
+                if not df.empty:
+                    df = pd.concat([pd.read_csv(resultDir + 'result_tmp_' + currentDate.strftime('%Y-%-m-%d') + '.csv', index_col=0), 
+                    df.loc[(df['state'] != 'Unfit') & (df['state'] != 'fail')]], sort=False).drop_duplicates(['code'], keep='last')
+                    df = pd.concat([
+                        df.loc[df['state'] == 'SynBT'].sort_values(by=['gain_rate'], ascending=False),
+                        df.loc[df['state'] == 'SynFT'].sort_values(by=['gain_rate'], ascending=False),
+                        df.loc[df['state'] == 'RiseBT'].sort_values(by=['gain_rate'], ascending=False),
+                        df.loc[df['state'] == 'DropFT'].sort_values(by=['gain_rate'], ascending=False),
+                        df.loc[(df['state'] == 'Rise') | (df['state'] == 'Drop')].sort_values(by=['code'])
+                    ])
+                    df['gain_rate'] = df['gain_rate'].map(lambda x: round(x, 3))
+
+                    writeCsv(df, resultDir + 'result_' + currentDate.strftime('%Y-%-m-%d') + '.csv')
+                    os.remove(resultDir + 'result_tmp_' + currentDate.strftime('%Y-%-m-%d') + '.csv')
+                    print(u"[\u001b[32;1mDone/Master\u001b[0m] successfully analyzed weekly calculations")
+                else:
+                    print(u"\u001b[41;1m[ERROR/Master]\u001b[0m failed to calculate date, " + currentDate.strftime('%Y-%-m-%d') + ", analysis")
             
             ''' Service Boardcast '''
             if not df.empty:
@@ -139,6 +184,11 @@ if __name__ == '__main__':
         else:
             print(u"\u001b[41;1m[ERROR/Master]\u001b[0m Stock market is not available in this date, " + currentDate.strftime('%Y-%-m-%d'))
 
+    pipeline.close()
+
+    if args.profile:
+        print('\n'.join(metrics.summary(args.slowest)))
+
 #Ending Area
 te = time.time()
 td = te - ts
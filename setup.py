@@ -11,6 +11,7 @@ pathConfig['Archive'] = pathConfig['Root'] + '/data/archive/'
 pathConfig['Resource'] = pathConfig['Root'] + '/data/resource/'
 pathConfig['Result'] = pathConfig['Root'] + '/data/result/'
 pathConfig['Log'] = pathConfig['Root'] + '/log/'
+pathConfig['Market'] = pathConfig['Root'] + '/data/market.db'
 
 config['Codes'] = {}
 cfgConfig = config['Codes']
@@ -20,5 +21,34 @@ config['Schedule'] = {}
 scheduleConfig = config['Schedule']
 scheduleConfig['CsvFile'] = pathConfig['Config'] + '/holidays.csv'
 
+config['Storage'] = {}
+storageConfig = config['Storage']
+storageConfig['Format'] = 'csv'
+storageConfig['Resources'] = 'files'
+
+config['Cache'] = {}
+cacheConfig = config['Cache']
+cacheConfig['Dir'] = pathConfig['Root'] + '/data/cache/'
+cacheConfig['Entries'] = '1024'
+cacheConfig['DiskEntries'] = '100000'
+
+config['Client'] = {}
+clientConfig = config['Client']
+clientConfig['Url'] = 'https://histock.tw/Stock/tv/udf.asmx/history'
+clientConfig['Retries'] = '5'
+clientConfig['Delay'] = '1'
+clientConfig['Backoff'] = '1.5'
+clientConfig['MaxDelay'] = '5'
+clientConfig['Timeout'] = '10'
+clientConfig['HostLimit'] = '8'
+
 with open(pathConfig['Config'] + 'config.ini', 'w') as configfile:
-    config.write(configfile)
\ No newline at end of file
+    config.write(configfile)
+
+''' Build the compiled trend/circle kernel next to src/kernel.py. Without a C compiler the NumPy kernel is used '''
+try:
+    from setuptools import setup, Extension
+
+    setup(name='ccas-kernel', script_args=['build_ext', '--inplace', '--quiet'], ext_modules=[Extension('src._kernel', ['src/_kernel.c'])])
+except (Exception, SystemExit) as e:
+    print(u"\u001b[33;1m[WARNING/Setup]\u001b[0m compiled kernel not built, falling back to NumPy: " + str(e))
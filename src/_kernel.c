@@ -0,0 +1,283 @@
+/*
+ * Compiled form of the trend and circle walks of Stock. Built by setup.py,
+ * src/kernel.py falls back to its NumPy versions when it is missing.
+ *
+ * The functions read and write the caller's buffers in place: float64 for
+ * prices, int8 for the turn and circle flags. src/kernel.py allocates the
+ * outputs, so the module needs nothing but Python.h.
+ */
+
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+#include <string.h>
+
+/* Same decisions, in the same order, as the reference walk of Stock.trend */
+static void walkTurns(const double *high, const double *low, Py_ssize_t n, signed char initTurn, signed char *turn)
+{
+    Py_ssize_t i, j, x, y, s, lastPoint = 0;
+
+    memset(turn, 0, n);
+
+    if (n > 0)
+        turn[0] = initTurn;
+
+    for (i = 1; i < n - 1; i++) {
+        double pH = high[i - 1], pL = low[i - 1];
+        double cH = high[i], cL = low[i];
+        double nH = high[i + 1], nL = low[i + 1];
+        int peak = (pH < cH || (pH == cH && pL >= cL)) && cH >= nH;
+        int ok;
+
+        /* Backward check */
+        if (peak || ((cL < pL || (cL == pL && pH <= cH)) && cL <= nL)) {
+            /* A later stick swallowing this one, with nothing in between reaching out of it, skips the stick */
+            for (s = i + 1; s < n; s++)
+                if (high[s] >= cH && low[s] <= cL)
+                    break;
+
+            if (s < n) {
+                for (x = i + 1; x < s; x++)
+                    if (high[x] > high[s] || low[x] < low[s])
+                        break;
+
+                if (x == s)
+                    continue;
+            }
+
+            /* Check the past, turns inside this stick are dropped */
+            for (j = i - 1; j >= 0; j--) {
+                if (turn[j] == 0)
+                    continue;
+
+                if (high[j] <= cH && low[j] >= cL) {
+                    turn[j] = 0;
+                    continue;
+                }
+
+                lastPoint = j;
+                break;
+            }
+        }
+
+        /* re-V type check. A failed backward scan leaves pH/pL on the offending stick */
+        if (peak) {
+            ok = 1;
+
+            for (x = lastPoint; x < i; x++) {
+                pH = high[x];
+                pL = low[x];
+
+                if (pH > cH || (pH == cH && pL < cL)) {
+                    ok = 0;
+                    break;
+                }
+            }
+
+            if (ok) {
+                for (x = i + 1; x < n; x++) {
+                    nH = high[x];
+                    nL = low[x];
+
+                    if (nH > cH || (nH == cH && nL <= cL))
+                        break;
+
+                    if (nH < cH && cL > nL) {
+                        if (lastPoint == 0) {
+                            for (y = 0; y < i; y++) {
+                                if (low[y] <= cL) {
+                                    turn[y] = -1;
+                                    break;
+                                }
+                            }
+                        }
+
+                        turn[i] = 1;
+                        lastPoint = i;
+                        break;
+                    }
+                }
+            }
+        }
+
+        /* V type check */
+        if ((cL < pL || (cL == pL && pH <= cH)) && cL <= nL) {
+            ok = 1;
+
+            for (x = i - 1; x >= lastPoint; x--) {
+                if (low[x] < cL || (low[x] == cL && high[x] > cH)) {
+                    ok = 0;
+                    break;
+                }
+            }
+
+            if (ok) {
+                for (x = i + 1; x < n; x++) {
+                    nH = high[x];
+                    nL = low[x];
+
+                    if (nL < cL || (cL == nL && nH >= cH))
+                        break;
+
+                    if (nH > cH && nL > cL) {
+                        if (lastPoint == 0) {
+                            for (y = 0; y < i; y++) {
+                                if (high[y] >= cH) {
+                                    turn[y] = 1;
+                                    break;
+                                }
+                            }
+                        }
+
+                        turn[i] = -1;
+                        lastPoint = i;
+                        break;
+                    }
+                }
+            }
+        }
+    }
+}
+
+/* A re-V turn is circled when a close from the turn before it on fell under that turn's low, a V turn when one rose over its high. NaN closes are skipped.
+   Runs without the GIL, so it allocates with PyMem_RawMalloc. Returns -1 when that fails, the caller raises MemoryError */
+static int walkCircles(const double *high, const double *low, const double *close, const signed char *turn, Py_ssize_t n, signed char *kT, signed char *dT)
+{
+    Py_ssize_t i, p = -1;
+    double *minClose, *maxClose;
+
+    if (n == 0)
+        return 0;
+
+    minClose = PyMem_RawMalloc(2 * n * sizeof(double));
+
+    if (minClose == NULL)
+        return -1;
+
+    maxClose = minClose + n;
+    minClose[n - 1] = maxClose[n - 1] = close[n - 1];
+
+    for (i = n - 2; i >= 0; i--) {
+        minClose[i] = close[i] < minClose[i + 1] || minClose[i + 1] != minClose[i + 1] ? close[i] : minClose[i + 1];
+        maxClose[i] = close[i] > maxClose[i + 1] || maxClose[i + 1] != maxClose[i + 1] ? close[i] : maxClose[i + 1];
+    }
+
+    for (i = 0; i < n; i++) {
+        if (turn[i] == 0)
+            continue;
+
+        if (p >= 0) {
+            if (turn[i] == 1) {
+                if (minClose[p] < low[p])
+                    kT[i] = 1;
+            } else {
+                if (maxClose[p] > high[p])
+                    dT[i] = 1;
+            }
+        }
+
+        p = i;
+    }
+
+    PyMem_RawFree(minClose);
+
+    return 0;
+}
+
+static int getBuffer(PyObject *obj, Py_buffer *view, const char *format, Py_ssize_t n, int writable)
+{
+    if (PyObject_GetBuffer(obj, view, PyBUF_C_CONTIGUOUS | PyBUF_FORMAT | (writable ? PyBUF_WRITABLE : 0)) < 0)
+        return -1;
+
+    if (strcmp(view->format, format) != 0 || (n >= 0 && view->len / view->itemsize != n)) {
+        PyErr_Format(PyExc_ValueError, "expected a contiguous '%s' buffer of %zd items", format, n);
+        PyBuffer_Release(view);
+        return -1;
+    }
+
+    return 0;
+}
+
+static PyObject *turns(PyObject *self, PyObject *args)
+{
+    PyObject *highObj, *lowObj, *turnObj;
+    Py_buffer high, low, turn;
+    int initTurn;
+    Py_ssize_t n;
+
+    if (!PyArg_ParseTuple(args, "OOiO", &highObj, &lowObj, &initTurn, &turnObj))
+        return NULL;
+
+    if (getBuffer(highObj, &high, "d", -1, 0) < 0)
+        return NULL;
+
+    n = high.len / high.itemsize;
+
+    if (getBuffer(lowObj, &low, "d", n, 0) < 0) {
+        PyBuffer_Release(&high);
+        return NULL;
+    }
+
+    if (getBuffer(turnObj, &turn, "b", n, 1) < 0) {
+        PyBuffer_Release(&high);
+        PyBuffer_Release(&low);
+        return NULL;
+    }
+
+    Py_BEGIN_ALLOW_THREADS
+    walkTurns(high.buf, low.buf, n, (signed char)initTurn, turn.buf);
+    Py_END_ALLOW_THREADS
+
+    PyBuffer_Release(&high);
+    PyBuffer_Release(&low);
+    PyBuffer_Release(&turn);
+
+    Py_RETURN_NONE;
+}
+
+static PyObject *circles(PyObject *self, PyObject *args)
+{
+    PyObject *objs[6];
+    Py_buffer views[6];
+    const char *formats[6] = {"d", "d", "d", "b", "b", "b"};
+    Py_ssize_t n = -1;
+    int k, status;
+
+    if (!PyArg_ParseTuple(args, "OOOOOO", &objs[0], &objs[1], &objs[2], &objs[3], &objs[4], &objs[5]))
+        return NULL;
+
+    for (k = 0; k < 6; k++) {
+        if (getBuffer(objs[k], &views[k], formats[k], n, k >= 4) < 0) {
+            while (--k >= 0)
+                PyBuffer_Release(&views[k]);
+
+            return NULL;
+        }
+
+        n = views[k].len / views[k].itemsize;
+    }
+
+    Py_BEGIN_ALLOW_THREADS
+    status = walkCircles(views[0].buf, views[1].buf, views[2].buf, views[3].buf, n, views[4].buf, views[5].buf);
+    Py_END_ALLOW_THREADS
+
+    for (k = 0; k < 6; k++)
+        PyBuffer_Release(&views[k]);
+
+    if (status < 0)
+        return PyErr_NoMemory();
+
+    Py_RETURN_NONE;
+}
+
+static PyMethodDef methods[] = {
+    {"turns", turns, METH_VARARGS, "turns(high, low, initTurn, turn): fill the int8 buffer turn with the turns of the float64 high/low"},
+    {"circles", circles, METH_VARARGS, "circles(high, low, close, turn, kT, dT): mark the circles into the int8 buffers kT/dT"},
+    {NULL, NULL, 0, NULL}
+};
+
+static struct PyModuleDef module = {PyModuleDef_HEAD_INIT, "_kernel", NULL, -1, methods};
+
+PyMODINIT_FUNC PyInit__kernel(void)
+{
+    return PyModule_Create(&module);
+}
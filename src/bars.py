@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import pandas as pd
+import numpy as np
+
+COLUMNS = ['date', 'close', 'open', 'high', 'low', 'amount']
+FLAGS = ['turn', 'kT', 'dT']
+
+
+class BarSeries():
+    ''' Sticks of one code as parallel typed arrays: date as int32 days since 1970-01-01, float64 prices, int64 amount and int8 turn/kT/dT.
+        Frames are only built at the edges, reading a source or archive and handing rows to estimate '''
+    __slots__ = ['date', 'close', 'open', 'high', 'low', 'amount', 'turn', 'kT', 'dT']
+
+    def __init__(self, date, close, open, high, low, amount, turn=None, kT=None, dT=None):
+        self.date = date
+        self.close = close
+        self.open = open
+        self.high = high
+        self.low = low
+        self.amount = amount
+        self.turn = turn if turn is not None else np.zeros(len(date), dtype=np.int8)
+        self.kT = kT if kT is not None else np.zeros(len(date), dtype=np.int8)
+        self.dT = dT if dT is not None else np.zeros(len(date), dtype=np.int8)
+
+    @classmethod
+    def fromFrame(cls, df):
+        ''' Flag columns are taken over when the frame has them, archives do. A failed download gives an empty frame without columns, no sticks '''
+        df = df if not df.empty else pd.DataFrame(columns=COLUMNS)
+
+        return cls(
+            pd.to_datetime(df['date'].values).values.astype('datetime64[D]').astype(np.int32),
+            df['close'].values.astype(np.float64),
+            df['open'].values.astype(np.float64),
+            df['high'].values.astype(np.float64),
+            df['low'].values.astype(np.float64),
+            df['amount'].values.astype(np.int64),
+            *[df[flag].values.astype(np.int8) if flag in df.columns else None for flag in FLAGS])
+
+    def toFrame(self, flags=True):
+        ''' Frame in the column layout of a Stock, flags as float like the archive files '''
+        df = pd.DataFrame({
+            'date': np.datetime_as_string(self.date.astype('datetime64[D]'), unit='D').astype(object),
+            'close': self.close,
+            'open': self.open,
+            'high': self.high,
+            'low': self.low,
+            'amount': self.amount
+        })
+
+        if flags:
+            for flag in FLAGS:
+                df[flag] = getattr(self, flag).astype(np.float64)
+
+        return df
+
+    def slice(self, start, stop):
+        ''' Sticks start to stop as views, flags included '''
+        return BarSeries(*[getattr(self, name)[start:stop] for name in self.__slots__])
+
+    def take(self, positions):
+        return BarSeries(*[getattr(self, name)[positions] for name in self.__slots__])
+
+    def merge(self, newer):
+        ''' Sticks of both in date order. A date in both keeps the stick of newer '''
+        merged = BarSeries(*[np.concatenate([getattr(self, name), getattr(newer, name)]) for name in self.__slots__])
+        order = np.argsort(merged.date, kind='stable')
+        dates = merged.date[order]
+        last = np.r_[dates[1:] != dates[:-1], True][:len(dates)]
+
+        return merged.take(order[last])
+
+    def mergeSorted(self, newer):
+        ''' merge for two series in date order without repeated dates. Sticks of self missing from newer are inserted in place instead of sorting everything again '''
+        if len(newer) == 0 or np.any(newer.date[1:] <= newer.date[:-1]):
+            return self.merge(newer)
+
+        cut = int(np.searchsorted(self.date, newer.date[0]))
+        tail = self.date[cut:]
+        at = np.searchsorted(newer.date, tail)
+        missing = np.flatnonzero((at == len(newer)) | (newer.date[np.minimum(at, len(newer) - 1)] != tail))
+
+        return BarSeries(*[np.concatenate([getattr(self, name)[:cut], np.insert(getattr(newer, name), at[missing], getattr(self, name)[cut:][missing])]) for name in self.__slots__])
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in self.__slots__)
+
+    def __len__(self):
+        return len(self.date)
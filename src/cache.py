@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+from .bars import BarSeries, COLUMNS
+from .state import StockState
+from collections import OrderedDict
+from datetime import datetime
+
+import hashlib
+import pickle
+import os
+
+
+class AnalysisCache():
+    ''' Analysis results keyed by everything they depend on, with the states the analysis left behind.
+        The latest entries stay in memory, every entry goes to directory as one file. Both sides drop their least recently used entries beyond their bound '''
+    def __init__(self, directory, entries=1024, diskEntries=100000):
+        self.directory = directory
+        self.entries = entries
+        self.diskEntries = diskEntries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.__memory = OrderedDict()
+        self.__puts = 0
+
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(*parts):
+        ''' Digest of everything an analysis depends on. Sticks count by their values, states by their bytes and None apart from any value '''
+        digest = hashlib.blake2b(digest_size=20)
+
+        for part in parts:
+            if isinstance(part, BarSeries):
+                for name in COLUMNS:
+                    digest.update(getattr(part, name).tobytes())
+            elif isinstance(part, StockState):
+                digest.update(part.tobytes())
+            elif isinstance(part, datetime):
+                digest.update(part.strftime('%Y-%m-%d').encode('utf-8'))
+            elif part is None:
+                digest.update(b'\0')
+            else:
+                digest.update(str(part).encode('utf-8'))
+
+            digest.update(b'|')
+
+        return digest.hexdigest()
+
+    def __path(self, key):
+        return os.path.join(self.directory, key + '.pkl')
+
+    def __remember(self, key, entry):
+        self.__memory[key] = entry
+        self.__memory.move_to_end(key)
+
+        while len(self.__memory) > self.entries:
+            self.__memory.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, key):
+        ''' (result, states) stored under key, None on a miss '''
+        entry = self.__memory.get(key)
+
+        if entry is None:
+            try:
+                with open(self.__path(key), 'rb') as f:
+                    entry = pickle.load(f)
+
+                ''' Mark it as used for the eviction on disk '''
+                os.utime(self.__path(key))
+            except:
+                entry = None
+
+        if entry is None:
+            self.misses += 1
+
+            return None
+
+        self.hits += 1
+        self.__remember(key, entry)
+
+        return dict(entry[0]), entry[1]
+
+    def put(self, key, result, states):
+        entry = (dict(result), states)
+        self.__remember(key, entry)
+
+        temp = self.__path(key) + '.' + str(os.getpid())
+
+        try:
+            with open(temp, 'wb') as f:
+                pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+            os.replace(temp, self.__path(key))
+        except:
+            print(u'\u001b[41;1m[WARNING/Cache]\u001b[0m failed to store ' + key)
+
+        ''' Listing the directory costs, so the disk bound is only checked every few puts '''
+        self.__puts += 1
+
+        if self.__puts % 64 == 0:
+            self.prune()
+
+    def prune(self):
+        ''' Drop the least recently used files beyond diskEntries '''
+        try:
+            entries = [entry for entry in os.scandir(self.directory) if entry.name.endswith('.pkl')]
+        except OSError:
+            return
+
+        if len(entries) <= self.diskEntries:
+            return
+
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+
+        for entry in entries[:len(entries) - self.diskEntries]:
+            try:
+                os.remove(entry.path)
+                self.evictions += 1
+            except OSError:
+                pass
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'memory': len(self.__memory)}
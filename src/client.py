@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+from urllib.parse import urlparse
+from requests.adapters import HTTPAdapter
+from datetime import datetime
+
+import pandas as pd
+import configparser
+import threading
+import requests
+import time
+import os
+
+from .metrics import metrics
+
+USER_AGENT = 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_14_2) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/12.0.2 Safari/605.1.15'
+
+
+def historyFrame(data):
+    ''' Sticks of an ok udf payload as the date/close/open/high/low/amount frame Stock works on '''
+    df = pd.DataFrame.from_dict(data = data).drop(['s', 'nextTime'], axis=1)
+    df.columns = ['date', 'close', 'open', 'high', 'low', 'amount']
+    df['date'] = df['date'].map(lambda x: datetime.fromtimestamp(x - 37800).strftime('%Y-%m-%d'))
+
+    return df
+
+
+class HistoryClient():
+    ''' Keep-alive HTTP client for the udf history endpoint with a bounded retry policy and a per-host limit on requests in flight '''
+    __instances = {}
+
+    def __init__(self, url='https://histock.tw/Stock/tv/udf.asmx/history', retries=5, delay=1, backoff=1.5, maxDelay=5, timeout=10, hostLimit=8):
+        self.url = url
+        self.retries = retries
+        self.delay = delay
+        self.backoff = backoff
+        self.maxDelay = maxDelay
+        self.timeout = timeout
+        self.hostLimit = hostLimit
+
+        ''' Counters of the current process '''
+        self.requests = 0
+        self.retried = 0
+
+        self.__session = requests.Session()
+        self.__session.headers.update({'User-Agent': USER_AGENT})
+        self.__session.mount('http://', HTTPAdapter(pool_connections=4, pool_maxsize=hostLimit))
+        self.__session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=hostLimit))
+        self.__hosts = {}
+        self.__lock = threading.Lock()
+
+    @classmethod
+    def fromConfig(cls, configPath=os.path.join(os.path.dirname(__file__), '../config/config.ini'), config=None, **overrides):
+        ''' Build a client from the [Client] section. Missing keys keep the defaults and overrides win over both. A caller holding the parsed config passes it as config '''
+        if config is None:
+            config = configparser.ConfigParser()
+            config.read(configPath)
+
+        kwargs = {}
+
+        if config.has_section('Client'):
+            section = config['Client']
+
+            for key, cast in [('url', str), ('retries', int), ('delay', float), ('backoff', float), ('maxDelay', float), ('timeout', float), ('hostLimit', int)]:
+                if key.lower() in section:
+                    kwargs[key] = cast(section[key.lower()])
+
+        kwargs.update(overrides)
+
+        return cls(**kwargs)
+
+    @classmethod
+    def shared(cls, configPath=os.path.join(os.path.dirname(__file__), '../config/config.ini')):
+        ''' One client per process. Pool workers get their own after fork instead of sharing the parent's sockets '''
+        key = (os.getpid(), os.path.abspath(configPath))
+
+        if key not in cls.__instances:
+            cls.__instances[key] = cls.fromConfig(configPath)
+
+        return cls.__instances[key]
+
+    def __limit(self, url):
+        host = urlparse(url).netloc
+
+        with self.__lock:
+            if host not in self.__hosts:
+                self.__hosts[host] = threading.BoundedSemaphore(self.hostLimit)
+
+            return self.__hosts[host]
+
+    def get(self, url, params=None):
+        ''' GET with retries on connection errors, 429 and 5xx. The last failure is raised '''
+        wait = self.delay
+
+        for attempt in range(self.retries + 1):
+            try:
+                with self.__limit(url):
+                    with self.__lock:
+                        self.requests += 1
+
+                    metrics.count('requests')
+
+                    with metrics.stage('request'):
+                        res = self.__session.get(url, params=params, timeout=self.timeout)
+
+                if res.status_code == 429 or res.status_code >= 500:
+                    res.raise_for_status()
+
+                metrics.count('bytes downloaded', len(res.content) if metrics.enabled else 0)
+
+                return res
+            except (requests.ConnectionError, requests.Timeout, requests.HTTPError):
+                if attempt == self.retries:
+                    raise
+
+                with self.__lock:
+                    self.retried += 1
+
+                metrics.count('retries')
+
+                time.sleep(wait)
+                wait = min(wait * self.backoff, self.maxDelay)
+
+    def history(self, code, resolution, to, since=None):
+        ''' Raw udf payload of one code and resolution up to the timestamp to '''
+        params = {'symbol': code, 'resolution': resolution, 'to': to}
+
+        if since is not None:
+            params['from'] = since
+
+        return self.get(self.url, params).json()
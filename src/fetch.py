@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+from concurrent.futures import ThreadPoolExecutor
+from .client import HistoryClient, historyFrame
+from .settings import Settings, DEFAULT_CONFIG
+from .sync import DeltaSync
+
+import pandas as pd
+import asyncio
+import time
+
+
+class BulkDownloader():
+    ''' Fetch the weekly and daily history of many codes from one process. Up to concurrency requests are in flight, started no faster than rate per second '''
+    def __init__(self, concurrency=200, rate=50, incremental=False, configPath=DEFAULT_CONFIG, settings=None):
+        ''' Decode Config once per process unless the caller hands its settings over '''
+        settings = settings if settings is not None else Settings.load(configPath)
+
+        self.concurrency = concurrency
+        self.rate = rate
+        self.__client = HistoryClient.fromConfig(settings.configPath, config=settings.config, hostLimit=concurrency)
+        self.__resources = settings.resources
+
+        ''' Incremental mode only asks for the bars after the stored ones. Stored history is read and written on the loop thread, the executor only does the requests '''
+        self.sync = DeltaSync(self.__resources, self.__client) if incremental else None
+
+    async def __throttle(self):
+        ''' Hand out start slots 1 / rate seconds apart '''
+        now = time.monotonic()
+        slot = max(now, self.__nextSlot)
+        self.__nextSlot = slot + 1.0 / self.rate
+
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    async def __request(self, code, resolution, date, since=None):
+        async with self.__slots:
+            await self.__throttle()
+            data = await asyncio.get_running_loop().run_in_executor(self.__executor, self.__client.history, code, resolution, int(date.timestamp()), since)
+
+        return historyFrame(data) if data['s'] == 'ok' else pd.DataFrame([])
+
+    async def __fetch(self, code, resolution, date):
+        ''' Frame to store and whether it replaces the stored history '''
+        if self.sync == None:
+            return await self.__request(code, resolution, date), False
+
+        stored = self.__resources.latest(code, resolution, date)
+        delta = await self.__request(code, resolution, date, self.sync.since(stored))
+        self.sync.bars += len(delta)
+        df = self.sync.merge(stored, delta, resolution)
+
+        if df is None:
+            self.sync.refetched += 1
+            df = await self.__request(code, resolution, date)
+            self.sync.bars += len(df)
+
+            return df, True
+
+        return df, False
+
+    async def __download(self, code, date, onDone):
+        try:
+            (weekilyData, weeklyReplace), (dailyData, dailyReplace) = await asyncio.gather(self.__fetch(code, 'w', date), self.__fetch(code, 'd', date))
+
+            if weekilyData.empty or dailyData.empty:
+                raise ValueError('data is not downloaded completely')
+
+            self.__resources.write(code, 'w', date, weekilyData, replace=weeklyReplace)
+            self.__resources.write(code, 'd', date, dailyData, replace=dailyReplace)
+            bars = len(dailyData)
+        except:
+            print(u"\u001b[41;1m[ERROR/Fetch:" + str(code) + "]\u001b[0m failed to download the resource")
+            bars = 0
+
+        if onDone != None:
+            onDone(code, bars)
+
+        return bars > 0
+
+    async def __run(self, codes, date, onDone):
+        self.__slots = asyncio.Semaphore(self.concurrency)
+        self.__nextSlot = time.monotonic()
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as self.__executor:
+            done = await asyncio.gather(*[self.__download(code, date, onDone) for code in codes])
+
+        return dict(zip(codes, done))
+
+    def run(self, codes, date, onDone=None):
+        ''' Write the <code>_w and <code>_d resources as each code completes and call onDone(code, bars) right away, bars of the daily history or 0 when it failed. Returns {code: ok} '''
+        return asyncio.run(self.__run(list(codes), date, onDone))
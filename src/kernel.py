@@ -0,0 +1,427 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import numpy as np
+import bisect
+
+try:
+    from . import _kernel
+except ImportError:
+    _kernel = None
+
+
+class SparseTable():
+    ''' Answer range max/min of a fixed array in O(1) after an O(n log n) build '''
+    def __init__(self, values, func=np.maximum):
+        values = np.ascontiguousarray(values, dtype=np.float64)
+
+        self.__func = func
+        self.__levels = [values]
+
+        k = 1
+        while k * 2 <= len(values):
+            prev = self.__levels[-1]
+            self.__levels.append(func(prev[:len(prev) - k], prev[k:]))
+            k *= 2
+
+    def query(self, start, stop):
+        ''' Extreme of values[start:stop], the range must not be empty '''
+        level = (stop - start).bit_length() - 1
+        table = self.__levels[level]
+
+        return self.__func(table[start], table[stop - (1 << level)])
+
+
+def firstBeyond(values, thresholds, starts, above=False):
+    ''' For every start, the first position from it on whose value is below its threshold, or above it with above. len(values) where there is none.
+        Binary lifting over window minima (maxima), NaN values never count '''
+    values = np.asarray(values, dtype=np.float64)
+    values = np.where(np.isnan(values), -np.inf if above else np.inf, values)
+    func = np.maximum if above else np.minimum
+    levels = [values]
+
+    while 2 ** len(levels) <= len(values):
+        k = 2 ** (len(levels) - 1)
+        levels.append(func(levels[-1][:len(levels[-1]) - k], levels[-1][k:]))
+
+    thresholds = np.asarray(thresholds, dtype=np.float64)
+    positions = np.asarray(starts, dtype=np.int64).copy()
+
+    ''' A whole window on the near side of the threshold is skipped, largest windows first '''
+    for k in range(len(levels) - 1, -1, -1):
+        step = 2 ** k
+        fits = positions + step <= len(values)
+        window = levels[k][np.where(fits, positions, 0)]
+        positions = np.where(fits & ((window <= thresholds) if above else (window >= thresholds)), positions + step, positions)
+
+    return positions
+
+
+class RightmostTree():
+    ''' Values over positions 0 to length - 1, answering the rightmost position holding at most a limit in O(log n) '''
+    def __init__(self, length, empty):
+        self.__size = 1
+
+        while self.__size < length:
+            self.__size *= 2
+
+        self.__tree = [empty] * (2 * self.__size)
+
+    def set(self, position, value):
+        tree = self.__tree
+        i = position + self.__size
+        tree[i] = value
+        i //= 2
+
+        while i:
+            tree[i] = min(tree[2 * i], tree[2 * i + 1])
+            i //= 2
+
+    def rightmost(self, limit):
+        ''' -1 when every value is above limit '''
+        tree = self.__tree
+
+        if tree[1] > limit:
+            return -1
+
+        i = 1
+
+        while i < self.__size:
+            i = 2 * i + 1 if tree[2 * i + 1] <= limit else 2 * i
+
+        return i - self.__size
+
+
+class SuffixLists():
+    ''' (key, position) items over positions 0 to length - 1, answering the least item above a given one among the positions after a given position.
+        A Fenwick tree over the positions from the last one back, each node a sorted list '''
+    def __init__(self, length):
+        self.__length = length
+        self.__tree = [[] for _ in range(length + 1)]
+
+    def add(self, item):
+        i = self.__length - item[1]
+
+        while i <= self.__length:
+            bisect.insort(self.__tree[i], item)
+            i += i & -i
+
+    def remove(self, item):
+        i = self.__length - item[1]
+
+        while i <= self.__length:
+            items = self.__tree[i]
+            del items[bisect.bisect_left(items, item)]
+            i += i & -i
+
+    def least(self, after, item):
+        ''' Least item greater than item among the positions after after, None when there is none '''
+        best = None
+        i = self.__length - after - 1
+
+        while i > 0:
+            items = self.__tree[i]
+            j = bisect.bisect_right(items, item)
+
+            if j < len(items) and (best is None or items[j] < best):
+                best = items[j]
+
+            i -= i & -i
+
+        return best
+
+
+def seek(cond, start, stop, step=16):
+    ''' Find the first position in [start, stop) that cond(a, b) marks as True. The window grows geometrically so near hits stay cheap '''
+    while start < stop:
+        end = min(stop, start + step)
+        hit = np.flatnonzero(cond(start, end))
+
+        if hit.size:
+            return start + int(hit[0])
+
+        start = end
+        step *= 2
+
+    return -1
+
+
+class TurnEngine():
+    ''' Resumable form of the Stock.trend walk. Each step reports how long a prefix must be for its decision to hold, so shorter prefixes can reuse the work '''
+    def __init__(self, high, low, initTurn=0):
+        self.high = np.ascontiguousarray(high, dtype=np.float64)
+        self.low = np.ascontiguousarray(low, dtype=np.float64)
+        self.length = len(self.high)
+        self.__maxHigh = SparseTable(self.high, np.maximum)
+        self.__minLow = SparseTable(self.low, np.minimum)
+
+        turn = np.zeros(self.length, dtype=np.int8)
+
+        if self.length > 0:
+            turn[0] = initTurn
+
+        self.restore(turn, 0)
+
+    def restore(self, turn, lastPoint):
+        ''' Continue from a saved state. turn may be shorter than the series when resuming a prefix '''
+        self.turn = turn
+        self.lastPoint = lastPoint
+
+        ''' Positions of non-zero turns in ascending order '''
+        self.points = np.flatnonzero(turn).tolist()
+
+    def __set(self, x, value, log):
+        if log is not None:
+            log.append((x, self.turn[x]))
+
+        self.turn[x] = value
+
+    def __mark(self, x, value, log):
+        if self.turn[x] == 0:
+            bisect.insort(self.points, x)
+
+        self.__set(x, value, log)
+
+    def step(self, i, end, log=None):
+        ''' Decide stick i seeing only the sticks before end. Returns the shortest prefix that reaches the same decision '''
+        high = self.high
+        low = self.low
+        points = self.points
+        valid = i + 2
+
+        pH = high[i - 1]
+        pL = low[i - 1]
+        cH = high[i]
+        cL = low[i]
+        nH = high[i + 1]
+        nL = low[i + 1]
+
+        peak = (pH < cH or (pH == cH and pL >= cL)) and cH >= nH
+
+        ''' Backward check '''
+        if peak or ((cL < pL or (cL == pL and pH <= cH)) and cL <= nL):
+            ''' Check is swallowing possible '''
+            s = seek(lambda a, b: (high[a:b] >= cH) & (low[a:b] <= cL), i + 1, end)
+
+            ''' A swallow that does not hold acts like no swallow, so only a holding one ties the decision to stick s '''
+            if s != -1 and (s == i + 1 or (self.__maxHigh.query(i + 1, s) <= high[s] and self.__minLow.query(i + 1, s) >= low[s])):
+                return max(valid, s + 1)
+
+            ''' Check the past '''
+            while points and high[points[-1]] <= cH and low[points[-1]] >= cL:
+                self.__set(points.pop(), 0, log)
+
+            if points:
+                self.lastPoint = points[-1]
+
+        ''' re-V type check. A failed backward scan leaves pH/pL on the offending stick, as the reference loop does '''
+        if peak:
+            ok = True
+
+            if self.__maxHigh.query(self.lastPoint, i) >= cH:
+                x = seek(lambda a, b: (high[a:b] > cH) | ((high[a:b] == cH) & (low[a:b] < cL)), self.lastPoint, i)
+
+                if x != -1:
+                    ok = False
+                    pH = high[x]
+                    pL = low[x]
+
+            if ok:
+                x = seek(lambda a, b: (high[a:b] > cH) | ((high[a:b] == cH) & (low[a:b] <= cL)) | ((high[a:b] < cH) & (low[a:b] < cL)), i + 1, end)
+
+                ''' Without a hit nH/nL rest on the last stick, so only the full series agrees '''
+                valid = max(valid, x + 1 if x != -1 else self.length)
+                nH = high[x if x != -1 else end - 1]
+                nL = low[x if x != -1 else end - 1]
+
+                if x != -1 and nH < cH and nL < cL:
+                    if self.lastPoint == 0:
+                        y = seek(lambda a, b: low[a:b] <= cL, 0, i)
+
+                        if y != -1:
+                            self.__mark(y, -1, log)
+
+                    self.__mark(i, 1, log)
+                    self.lastPoint = i
+
+        ''' V type check '''
+        if (cL < pL or (cL == pL and pH <= cH)) and cL <= nL:
+            ok = True
+
+            if self.lastPoint < i and self.__minLow.query(self.lastPoint, i) <= cL:
+                ok = seek(lambda a, b: (low[a:b] < cL) | ((low[a:b] == cL) & (high[a:b] > cH)), self.lastPoint, i) == -1
+
+            if ok:
+                x = seek(lambda a, b: (low[a:b] < cL) | ((low[a:b] == cL) & (high[a:b] >= cH)) | ((high[a:b] > cH) & (low[a:b] > cL)), i + 1, end)
+
+                if x != -1:
+                    valid = max(valid, x + 1)
+
+                if x != -1 and high[x] > cH and low[x] > cL:
+                    if self.lastPoint == 0:
+                        y = seek(lambda a, b: high[a:b] >= cH, 0, i)
+
+                        if y != -1:
+                            self.__mark(y, 1, log)
+
+                    self.__mark(i, -1, log)
+                    self.lastPoint = i
+
+        return valid
+
+    def run(self, start=1, end=None):
+        end = self.length if end is None else end
+
+        for i in range(start, end - 1):
+            self.step(i, end)
+
+        return self.turn
+
+
+def findTurnsNumpy(high, low, initTurn=0):
+    ''' NumPy version of Stock.trend. It walks the same decision sequence, but every forward/backward scan is a vectorized seek or a sparse table lookup '''
+    return TurnEngine(high, low, initTurn).run()
+
+
+def markCirclesNumpy(high, low, close, turns, initK=0, initD=0):
+    ''' kT/dT of a trended series. A re-V turn is circled when a close from the turn before it on fell under that turn's low, a V turn when one rose over its high '''
+    high = np.asarray(high, dtype=np.float64)
+    low = np.asarray(low, dtype=np.float64)
+    close = np.asarray(close, dtype=np.float64)
+    turns = np.asarray(turns)
+    kT = np.zeros(len(close), dtype=np.int8)
+    dT = np.zeros(len(close), dtype=np.int8)
+
+    if len(close) == 0:
+        return kT, dT
+
+    kT[0] = initK
+    dT[0] = initD
+
+    ''' Extremes of the closes from each stick to the end, NaN closes skipped '''
+    minClose = np.fmin.accumulate(close[::-1])[::-1]
+    maxClose = np.fmax.accumulate(close[::-1])[::-1]
+
+    points = np.flatnonzero(turns != 0)
+    p, c = points[:-1], points[1:]
+    rise = turns[c] == 1
+
+    kT[c[rise & (minClose[p] < low[p])]] = 1
+    dT[c[~rise & (maxClose[p] > high[p])]] = 1
+
+    return kT, dT
+
+
+def findTurns(high, low, initTurn=0):
+    ''' Turns of a series as int8, from the compiled kernel when setup.py built it '''
+    if _kernel is None:
+        return findTurnsNumpy(high, low, initTurn)
+
+    high = np.ascontiguousarray(high, dtype=np.float64)
+    low = np.ascontiguousarray(low, dtype=np.float64)
+    turns = np.empty(len(high), dtype=np.int8)
+    _kernel.turns(high, low, int(initTurn), turns)
+
+    return turns
+
+
+def markCircles(high, low, close, turns, initK=0, initD=0):
+    ''' kT/dT of a trended series as int8 arrays, from the compiled kernel when setup.py built it. initK/initD carry the flags of the stick before the series '''
+    if _kernel is None:
+        return markCirclesNumpy(high, low, close, turns, initK, initD)
+
+    kT = np.zeros(len(close), dtype=np.int8)
+    dT = np.zeros(len(close), dtype=np.int8)
+
+    if len(close) == 0:
+        return kT, dT
+
+    kT[0] = initK
+    dT[0] = initD
+
+    _kernel.circles(np.ascontiguousarray(high, dtype=np.float64), np.ascontiguousarray(low, dtype=np.float64), \
+        np.ascontiguousarray(close, dtype=np.float64), np.ascontiguousarray(turns, dtype=np.int8), kT, dT)
+
+    return kT, dT
+
+
+class PrefixTurns():
+    ''' Turns of every prefix of one series from a single journaled run. A prefix rewinds to the last step that still holds for it and re-runs only the rest '''
+    def __init__(self, high, low, initTurn=0):
+        self.__engine = engine = TurnEngine(high, low, initTurn)
+        self.__journal = [None]
+        valid = []
+
+        for i in range(1, engine.length - 1):
+            log = []
+            lastPoint = engine.lastPoint
+            valid.append(engine.step(i, engine.length, log))
+            self.__journal.append((log, lastPoint))
+
+        ''' reach[k - 1] is the shortest prefix for which steps 1..k all hold '''
+        self.__reach = np.maximum.accumulate(valid) if valid else np.zeros(0, dtype=np.int64)
+        self.__final = (engine.turn.copy(), engine.lastPoint)
+        self.__rewind()
+
+    def __rewind(self):
+        self.__turn = self.__final[0].copy()
+        self.__lastPoint = self.__final[1]
+        self.__cursor = len(self.__journal)
+
+    def turns(self, w):
+        ''' Turns of the first w sticks, equal to findTurns(high[:w], low[:w]) '''
+        engine = self.__engine
+        w = min(w, engine.length)
+
+        ''' Steps before k are shared with the full run. Walking w downwards only ever rewinds further '''
+        k = min(int(np.searchsorted(self.__reach, w, side='right')) + 1, max(w - 1, 1))
+
+        if k > self.__cursor:
+            self.__rewind()
+
+        while self.__cursor > k:
+            self.__cursor -= 1
+            log, self.__lastPoint = self.__journal[self.__cursor]
+
+            for x, old in reversed(log):
+                self.__turn[x] = old
+
+        engine.restore(self.__turn[:w].copy(), self.__lastPoint)
+
+        return engine.run(k, w)
+
+
+class CloseIndex():
+    ''' Range min/max of the close over a date-ordered series, so "was it ever broken after date X" is a lookup instead of a mask '''
+    def __init__(self, dates, close):
+        ''' dates may be None when only the positional below/above are used '''
+        self.__dates = np.asarray(dates, dtype=str) if dates is not None else None
+        self.__minClose = SparseTable(close, np.fmin)
+        self.__maxClose = SparseTable(close, np.fmax)
+        self.__length = len(close)
+
+    def after(self, date):
+        ''' Position of the first stick later than date '''
+        return int(np.searchsorted(self.__dates, str(date), side='right'))
+
+    def below(self, price, start, stop=None):
+        ''' Is any close in [start, stop) lower than price '''
+        start = int(start)
+        stop = self.__length if stop is None else stop
+
+        return start < stop and self.__minClose.query(start, stop) < price
+
+    def above(self, price, start, stop=None):
+        ''' Is any close in [start, stop) higher than price '''
+        start = int(start)
+        stop = self.__length if stop is None else stop
+
+        return start < stop and self.__maxClose.query(start, stop) > price
+
+    def brokenDown(self, price, date):
+        ''' Did a close between date and the last stick (both excluded) fall under price '''
+        return self.below(price, self.after(date), self.__length - 1)
+
+    def brokenUp(self, price, date):
+        ''' Did a close between date and the last stick (both excluded) rise over price '''
+        return self.above(price, self.after(date), self.__length - 1)
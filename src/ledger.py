@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import sqlite3
+import pickle
+import os
+
+
+class JobLedger():
+    ''' Progress of one run in an SQLite file, one row per job: the weight its fetch returned, what its analysis returned, whether that failed and how often it ran.
+        Only the master writes, each update is committed at once so a crash loses at most the jobs in flight '''
+    def __init__(self, path):
+        self.path = path
+        self.__connections = {}
+
+    def __connect(self):
+        ''' SQLite handles must not cross a fork, so each process opens its own '''
+        pid = os.getpid()
+
+        if pid not in self.__connections:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('''CREATE TABLE IF NOT EXISTS jobs (
+                job TEXT PRIMARY KEY,
+                fetched REAL,
+                returned BLOB,
+                failed INTEGER NOT NULL DEFAULT 0,
+                attempts INTEGER NOT NULL DEFAULT 0)''')
+            self.__connections = {pid: connection}
+
+        return self.__connections[pid]
+
+    def clear(self):
+        self.__connect().execute('DELETE FROM jobs')
+
+    def fetched(self, job, weight):
+        ''' A fetch that succeeded, weight is what it returned '''
+        self.__connect().execute('INSERT INTO jobs (job, fetched) VALUES (?, ?) ON CONFLICT(job) DO UPDATE SET fetched = excluded.fetched', (str(job), weight))
+
+    def analyzed(self, job, returned, failed=False):
+        self.__connect().execute('INSERT INTO jobs (job, returned, failed, attempts) VALUES (?, ?, ?, 1) ON CONFLICT(job) DO UPDATE SET returned = excluded.returned, failed = excluded.failed, attempts = attempts + 1', \
+            (str(job), pickle.dumps(returned, protocol=pickle.HIGHEST_PROTOCOL), int(failed)))
+
+    def load(self):
+        ''' {job: (fetched weight or None, returned or None, failed, attempts)} of every recorded job '''
+        return {job: (fetched, pickle.loads(returned) if returned is not None else None, bool(failed), attempts) \
+            for job, fetched, returned, failed, attempts in self.__connect().execute('SELECT job, fetched, returned, failed, attempts FROM jobs')}
+
+    def pending(self, jobs, attempts=3):
+        ''' Jobs of jobs a resumed run still has to analyze: never analyzed, or failed fewer than attempts times '''
+        done = self.load()
+
+        return [job for job in jobs if str(job) not in done or done[str(job)][3] == 0 or (done[str(job)][2] and done[str(job)][3] < attempts)]
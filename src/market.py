@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+from datetime import datetime, timedelta
+from .storage import getStorage
+
+import pandas as pd
+import sqlite3
+import glob
+import os
+
+COLUMNS = ['date', 'close', 'open', 'high', 'low', 'amount']
+
+''' Codes MarketStore.readMany lists in the query, more are joined from a temporary table '''
+IN_LIMIT = 500
+
+
+class FileResources():
+    ''' One directory per analyzed date holding the full history of every code, data/resource/YYYY-M-D/<code>_<resolution> '''
+    def __init__(self, resourceDir, storage):
+        self.__resourceDir = resourceDir
+        self.__storage = storage
+
+    def path(self, code, resolution, date):
+        return self.__resourceDir + date.strftime('%Y-%-m-%d') + '/' + str(code) + '_' + resolution + self.__storage.extension
+
+    def read(self, code, resolution, date):
+        return self.__storage.read(self.path(code, resolution, date))
+
+    def readMany(self, codes, resolution, date):
+        ''' Histories of many codes in one frame with a code column, codes without a file left out '''
+        frames = []
+
+        for code in codes:
+            try:
+                df = self.read(code, resolution, date)
+            except:
+                continue
+
+            df.insert(0, 'code', int(code))
+            frames.append(df)
+
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame([], columns=['code'] + COLUMNS)
+
+    def size(self, code, resolution, date):
+        ''' Bytes of the stored history, 0 when missing. Grows with the bar count '''
+        path = self.path(code, resolution, date)
+
+        return os.path.getsize(path) if os.path.exists(path) else 0
+
+    def latest(self, code, resolution, date):
+        ''' History of the newest date directory up to date holding the code, empty when there is none '''
+        for day in sorted(glob.glob(self.__resourceDir + '*/'), key=lambda d: datetime.strptime(os.path.basename(d[:-1]), '%Y-%m-%d'), reverse=True):
+            if datetime.strptime(os.path.basename(day[:-1]), '%Y-%m-%d') > date:
+                continue
+
+            path = day + str(code) + '_' + resolution + self.__storage.extension
+
+            if os.path.exists(path):
+                return self.__storage.read(path)
+
+        return pd.DataFrame([], columns=COLUMNS)
+
+    def write(self, code, resolution, date, df, replace=False):
+        ''' Every directory holds the whole history, so a write always replaces '''
+        path = self.path(code, resolution, date)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.__storage.write(df, path)
+
+
+class MarketStore():
+    ''' Every code and resolution in one SQLite file clustered by (code, resolution, date). Writes only touch bars from the last stored one on, reads take any date-bounded slice '''
+    def __init__(self, path):
+        self.path = path
+        self.__connections = {}
+
+    def __connect(self):
+        ''' SQLite handles must not cross a fork, so each process opens its own '''
+        pid = os.getpid()
+
+        if pid not in self.__connections:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=60)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('''CREATE TABLE IF NOT EXISTS bars (
+                code INTEGER NOT NULL,
+                resolution TEXT NOT NULL,
+                date TEXT NOT NULL,
+                close REAL, open REAL, high REAL, low REAL, amount INTEGER,
+                PRIMARY KEY (code, resolution, date)) WITHOUT ROWID''')
+            self.__connections = {pid: connection}
+
+        return self.__connections[pid]
+
+    def lastDate(self, code, resolution):
+        row = self.__connect().execute('SELECT MAX(date) FROM bars WHERE code = ? AND resolution = ?', (int(code), resolution)).fetchone()
+
+        return row[0]
+
+    def read(self, code, resolution, date=None, start=None):
+        ''' Bars of one code between start and date, both included and optional. A weekly bar holds only the days up to date '''
+        query = 'SELECT date, close, open, high, low, amount FROM bars WHERE code = ? AND resolution = ?'
+        params = [int(code), resolution]
+
+        if start is not None:
+            query += ' AND date >= ?'
+            params.append(start.strftime('%Y-%m-%d') if not isinstance(start, str) else start)
+
+        if date is not None:
+            query += ' AND date <= ?'
+            params.append(date.strftime('%Y-%m-%d') if not isinstance(date, str) else date)
+
+        df = pd.DataFrame.from_records(self.__connect().execute(query + ' ORDER BY date', params).fetchall(), columns=COLUMNS)
+
+        if resolution == 'w' and date is not None:
+            df.insert(0, 'code', int(code))
+            df = self.__weekAt(df, date, code).drop(columns=['code'])
+
+        return df
+
+    def latest(self, code, resolution, date):
+        return self.read(code, resolution, date)
+
+    def readMany(self, codes, resolution, date):
+        ''' Histories of many codes up to date in one query, ordered by code and date. Only the bars of codes are read, a shard of the market reads its own share.
+            A long list of codes is joined from a temporary table, it would pass the limit of SQL variables as an IN list '''
+        codes = [int(code) for code in codes]
+        connection = self.__connect()
+        query = 'SELECT bars.code, date, close, open, high, low, amount FROM bars {} WHERE resolution = ? AND date <= ? {} ORDER BY bars.code, date'
+
+        if len(codes) <= IN_LIMIT:
+            rows = connection.execute(query.format('', 'AND code IN ({})'.format(', '.join('?' * len(codes)))), [resolution, date.strftime('%Y-%m-%d')] + codes).fetchall()
+        else:
+            connection.execute('CREATE TEMP TABLE IF NOT EXISTS wanted (code INTEGER PRIMARY KEY)')
+            connection.execute('DELETE FROM wanted')
+            connection.executemany('INSERT OR IGNORE INTO wanted VALUES (?)', [(code,) for code in codes])
+            rows = connection.execute(query.format('JOIN wanted ON wanted.code = bars.code', ''), (resolution, date.strftime('%Y-%m-%d'))).fetchall()
+            connection.execute('DELETE FROM wanted')
+
+        df = pd.DataFrame.from_records(rows, columns=['code'] + COLUMNS)
+
+        return self.__weekAt(df, date) if resolution == 'w' else df
+
+    def __weekAt(self, df, date, code=None):
+        ''' Weekly bars of df, with a code column, as they stood at the close of date. The bar of the week of date is rewritten as the week goes on,
+            once the store holds daily bars of that week past date it is rebuilt from the daily bars up to date, or dropped without any. code limits the daily bars read to one code '''
+        date = pd.Timestamp(date)
+        monday = date - timedelta(days=date.weekday())
+        current = (df['date'] >= monday.strftime('%Y-%m-%d')).values
+
+        if not current.any():
+            return df
+
+        query = 'SELECT code, date, close, open, high, low, amount FROM bars WHERE resolution = ? AND date >= ? AND date <= ?'
+        params = ['d', monday.strftime('%Y-%m-%d'), (monday + timedelta(days=6)).strftime('%Y-%m-%d')]
+
+        if code is not None:
+            query += ' AND code = ?'
+            params.append(int(code))
+
+        days = pd.DataFrame.from_records(self.__connect().execute(query + ' ORDER BY code, date', params).fetchall(), columns=['code'] + COLUMNS)
+        stale = current & df['code'].isin(days.loc[days['date'] > date.strftime('%Y-%m-%d'), 'code']).values
+
+        if not stale.any():
+            return df
+
+        week = days.loc[days['date'] <= date.strftime('%Y-%m-%d')].groupby('code').agg({'open': 'first', 'close': 'last', 'high': 'max', 'low': 'min', 'amount': 'sum'})
+        rebuilt = stale & df['code'].isin(week.index).values
+        df = df.copy()
+
+        for name in ['close', 'open', 'high', 'low', 'amount']:
+            df.loc[rebuilt, name] = df.loc[rebuilt, 'code'].map(week[name]).values
+
+        return df.loc[~stale | rebuilt].reset_index(drop=True)
+
+    def size(self, code, resolution, date):
+        ''' Bars stored up to date '''
+        return self.__connect().execute('SELECT COUNT(*) FROM bars WHERE code = ? AND resolution = ? AND date <= ?', (int(code), resolution, date.strftime('%Y-%m-%d'))).fetchone()[0]
+
+    def write(self, code, resolution, date, df, replace=False):
+        ''' Append the bars newer than the stored history. The last stored bar is rewritten too, since an open week or day keeps changing.
+            With replace the stored bars of the code are dropped first, for history the source has revised '''
+        last = self.lastDate(code, resolution) if not replace else None
+        df = df.loc[df['date'] >= last] if last is not None else df
+
+        with self.__connect() as connection:
+            if replace:
+                connection.execute('DELETE FROM bars WHERE code = ? AND resolution = ?', (int(code), resolution))
+
+            connection.executemany('INSERT OR REPLACE INTO bars VALUES (?, ?, ?, ?, ?, ?, ?, ?)', \
+                [(int(code), resolution, r[0], float(r[1]), float(r[2]), float(r[3]), float(r[4]), int(r[5])) for r in df[COLUMNS].itertuples(index=False)])
+
+        return len(df)
+
+
+def getResources(config):
+    ''' Market store when [Storage] Resources = market, the per-date directories otherwise '''
+    if config.get('Storage', 'Resources', fallback='files') == 'market':
+        return MarketStore(config['Dir']['Market'])
+
+    return FileResources(config['Dir']['Resource'], getStorage(config))
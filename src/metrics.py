@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import threading
+import time
+
+
+class Stage():
+    ''' Timer of one pass through a stage. Stages nest, the time of the inner ones is left out of the self time of the outer one '''
+    __slots__ = ['metrics', 'name', 'code', 'wall', 'cpu', 'inner', 'outerCode']
+
+    def __init__(self, metrics, name, code=None):
+        self.metrics = metrics
+        self.name = name
+        self.code = code
+
+    def __enter__(self):
+        self.inner = 0.0
+        self.metrics.enter(self)
+        self.wall = time.perf_counter()
+        self.cpu = time.thread_time()
+
+        return self
+
+    def __exit__(self, *args):
+        self.metrics.exit(self, time.perf_counter() - self.wall, time.thread_time() - self.cpu)
+
+
+class NullStage():
+    ''' What a disabled Metrics hands out, entering and leaving it does nothing '''
+    __slots__ = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+NULL_STAGE = NullStage()
+
+
+class Metrics():
+    ''' Wall and CPU seconds and calls per stage, counters such as bytes read and retries, and the seconds of every job by code, all of the current process.
+        Disabled, which it is until enable, a stage costs one call and a flag check. Workers hand take() to the master with their results, the master merges them '''
+    def __init__(self):
+        self.enabled = False
+        self.__lock = threading.Lock()
+        self.__local = threading.local()
+        self.reset()
+
+    def enable(self):
+        self.enabled = True
+
+    def reset(self):
+        ''' stages {name: [calls, wall, self, cpu]}, counters {name: n}, codes {code: {'wall', 'cpu', stage: self}} '''
+        self.stages = {}
+        self.counters = {}
+        self.codes = {}
+
+    def stage(self, name):
+        return Stage(self, name) if self.enabled else NULL_STAGE
+
+    def job(self, code):
+        ''' Stage of all the work on code, the stages inside it are also added up per code '''
+        return Stage(self, 'job', code) if self.enabled else NULL_STAGE
+
+    def count(self, name, n=1):
+        if self.enabled:
+            with self.__lock:
+                self.counters[name] = self.counters.get(name, 0) + n
+
+    def enter(self, stage):
+        ''' Open stages are per thread, the async downloader times its requests beside the master '''
+        if not hasattr(self.__local, 'stack'):
+            self.__local.stack = []
+            self.__local.code = None
+
+        self.__local.stack.append(stage)
+        stage.outerCode = self.__local.code
+
+        if stage.code is not None:
+            self.__local.code = stage.code
+
+    def exit(self, stage, wall, cpu):
+        stack = self.__local.stack
+        stack.pop()
+        code = self.__local.code
+        self.__local.code = stage.outerCode
+
+        if stack:
+            stack[-1].inner += wall
+
+        with self.__lock:
+            figures = self.stages.setdefault(stage.name, [0, 0.0, 0.0, 0.0])
+            figures[0] += 1
+            figures[1] += wall
+            figures[2] += wall - stage.inner
+            figures[3] += cpu
+
+            if code is not None:
+                figures = self.codes.setdefault(code, {'wall': 0.0, 'cpu': 0.0})
+
+                if stage.code is not None:
+                    figures['wall'] += wall
+                    figures['cpu'] += cpu
+
+                figures[stage.name] = figures.get(stage.name, 0.0) + wall - stage.inner
+
+    def take(self):
+        ''' Figures gathered since the last take, None when disabled. Leaves them empty '''
+        if not self.enabled:
+            return None
+
+        with self.__lock:
+            taken = {'stages': self.stages, 'counters': self.counters, 'codes': self.codes}
+            self.reset()
+
+        return taken
+
+    def merge(self, taken):
+        ''' Add the figures another process took '''
+        if taken is None:
+            return
+
+        with self.__lock:
+            for name, figures in taken['stages'].items():
+                self.stages[name] = [a + b for a, b in zip(self.stages.get(name, [0, 0.0, 0.0, 0.0]), figures)]
+
+            for name, n in taken['counters'].items():
+                self.counters[name] = self.counters.get(name, 0) + n
+
+            for code, figures in taken['codes'].items():
+                mine = self.codes.setdefault(code, {'wall': 0.0, 'cpu': 0.0})
+
+                for name, seconds in figures.items():
+                    mine[name] = mine.get(name, 0.0) + seconds
+
+    def summary(self, slowest=10):
+        ''' Lines of the run: every stage by self time, the counters and the slowest codes with the stage they spent most in '''
+        lines = [u"[\u001b[1mINFO/Metrics\u001b[0m] {} codes, {:.2f} s in jobs".format(len(self.codes), self.stages.get('job', [0, 0.0])[1])]
+        lines.append("{:>14} {:>8} {:>10} {:>10} {:>10}".format('stage', 'calls', 'wall s', 'self s', 'cpu s'))
+
+        for name, (calls, wall, own, cpu) in sorted(self.stages.items(), key=lambda item: -item[1][2]):
+            lines.append("{:>14} {:>8d} {:>10.3f} {:>10.3f} {:>10.3f}".format(name, calls, wall, own, cpu))
+
+        if self.counters:
+            lines.append(', '.join('{} {}'.format(name, n) for name, n in sorted(self.counters.items())))
+
+        if self.codes and slowest > 0:
+            lines.append("{:>14} {:>10} {:>10}  {}".format('code', 'wall s', 'cpu s', 'most self time in'))
+
+            for code, figures in sorted(self.codes.items(), key=lambda item: -item[1]['wall'])[:slowest]:
+                stages = {name: seconds for name, seconds in figures.items() if name not in ['wall', 'cpu', 'job']}
+                top = max(stages, key=stages.get) if stages else ''
+                lines.append("{:>14} {:>10.3f} {:>10.3f}  {}".format(str(code), figures['wall'], figures['cpu'], top + (' {:.3f} s'.format(stages[top]) if top else '')))
+
+        return lines
+
+
+''' One per process. Pool workers inherit it enabled or not from the master '''
+metrics = Metrics()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+from collections import deque
+from .metrics import metrics
+
+import multiprocessing as mp
+import heapq
+import queue
+import os
+
+
+def workload(settings, code, mode, date):
+    ''' Sort key for the cost of analyzing a code: the size of its stored bars. schedule.py stores none for the date, its codes weigh what their state or archive holds.
+        A code with neither downloads and walks its whole history, so it goes first '''
+    size = settings.resources.size(code, mode, date)
+
+    if size > 0:
+        return size
+
+    for path in [settings.statePath(code, mode), settings.archivePath(code, mode)]:
+        if os.path.exists(path):
+            return os.path.getsize(path)
+
+    return float('inf')
+
+
+def started():
+    ''' A worker forgets the figures the master had gathered when it forked, they are the master's to report '''
+    metrics.reset()
+
+
+class Pipeline():
+    ''' One worker pool kept for a whole run. Jobs pass an optional fetch stage, then the analysis stage.
+        The master hands out one job per free worker: analysis first, longest job first, fetches while fewer than fetchLimit are in flight '''
+    def __init__(self, processes=None, fetchLimit=None):
+        self.processes = processes or mp.cpu_count()
+        self.fetchLimit = fetchLimit or self.processes
+        self.__pool = mp.Pool(self.processes, initializer=started)
+        self.__events = queue.Queue()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.__pool.close()
+        self.__pool.join()
+
+    def offer(self, i, weight):
+        ''' Hand job i to the analysis stage from a fetcher outside the pool. None drops the job '''
+        self.__events.put(('offered', i, weight))
+
+    def __submit(self, func, kind, i, job):
+        self.__pool.apply_async(func, (job,), \
+            callback=lambda value: self.__events.put((kind, i, value)), \
+            error_callback=lambda e: self.__events.put((kind, i, None)))
+
+    def run(self, analyze, jobs, fetch=None, weights=None, external=False, progress=None):
+        ''' Results of analyze in the order of jobs, None for jobs dropped on the way.
+            fetch runs in the pool and returns the weight of its job, or None when it failed.
+            Without a fetch stage the jobs are analyzed by weights, or arrive through offer when external.
+            progress(kind, i, value) is called in the master as each fetch or offer ('fetched') and analysis ('analyzed') of job i ends '''
+        results = [None] * len(jobs)
+        ready = []
+        fetches = deque(range(len(jobs)) if fetch is not None else [])
+        remaining = len(jobs)
+        running = fetching = 0
+
+        if fetch is None and not external:
+            for i in range(len(jobs)):
+                heapq.heappush(ready, (-(weights[i] if weights is not None else 0), i))
+
+        while remaining:
+            while ready and running + fetching < self.processes:
+                i = heapq.heappop(ready)[1]
+                self.__submit(analyze, 'analyzed', i, jobs[i])
+                running += 1
+
+            while fetches and fetching < self.fetchLimit and running + fetching < self.processes:
+                i = fetches.popleft()
+                self.__submit(fetch, 'fetched', i, jobs[i])
+                fetching += 1
+
+            kind, i, value = self.__events.get()
+
+            if progress is not None:
+                progress('fetched' if kind == 'offered' else kind, i, value)
+
+            if kind == 'analyzed':
+                running -= 1
+                results[i] = value
+                remaining -= 1
+
+                continue
+
+            if kind == 'fetched':
+                fetching -= 1
+
+            if value is None:
+                remaining -= 1
+            else:
+                heapq.heappush(ready, (-value, i))
+
+        return results
@@ -0,0 +1,305 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+from .stock import Stock
+from .kernel import PrefixTurns, TurnEngine, RightmostTree, SuffixLists, firstBeyond
+from .settings import Settings, DEFAULT_CONFIG
+from .state import loadState
+from .metrics import metrics
+
+import pandas as pd
+import numpy as np
+import bisect
+import heapq
+import os
+
+
+class PrefixStates():
+    ''' State of every prefix of one series as Stock(..., deep=True) estimates it without a state, from one forward pass over the sticks.
+        The turns of prefix w are the ones of the whole series up to the first trend step whose decision needs sticks past w, that step and the later ones are run again for w alone and undone after.
+        Only what estimate reads is kept up to date as the turns change: the last circle of each kind, as a circle only needs a close past the low (high) of the turn before it,
+        and the candidate break points, as a turn stays unbroken until the first close past its low (high). A prefix costs O(log^2 n) beyond the trend steps it runs again.
+        states[w] is None where two candidates share the price, pandas may pick either, ask Stock '''
+    def __init__(self, high, low, close):
+        self.__high = high = np.ascontiguousarray(high, dtype=np.float64)
+        self.__low = low = np.ascontiguousarray(low, dtype=np.float64)
+        self.__close = close = np.ascontiguousarray(close, dtype=np.float64)
+        n = self.__length = len(close)
+        starts = np.arange(n)
+
+        ''' A circle needs a close from the turn before it on past that turn, a candidate is broken by a close after it and before the last stick '''
+        self.__belowFrom = firstBeyond(close, low, starts).tolist()
+        self.__aboveFrom = firstBeyond(close, high, starts, above=True).tolist()
+        self.__belowAfter = firstBeyond(close, low, starts + 1).tolist()
+        self.__aboveAfter = firstBeyond(close, high, starts + 1, above=True).tolist()
+
+        ''' The whole run tells for each step the shortest prefix that reaches the same decision, as PrefixTurns does '''
+        self.__engine = engine = TurnEngine(high, low)
+        reach = np.maximum.accumulate([engine.step(i, n) for i in range(1, n - 1)] or [0])
+        engine.restore(np.zeros(n, dtype=np.int8), 0)
+
+        ''' Turns the structures below hold. Circles by the prefix length they appear from, candidates by key, low for V turns and -high for re-V turns '''
+        self.__seen = [0] * n
+        self.__circles = {1: RightmostTree(n, n + 2), -1: RightmostTree(n, n + 2)}
+        self.__positions = {1: [], -1: []}
+        self.__unbroken = {1: [], -1: []}
+        self.__candidates = {1: SuffixLists(n), -1: SuffixLists(n)}
+        self.__expiry = []
+
+        self.states = [None] * (n + 1)
+        step = 1
+
+        for w in range(1, n + 1):
+            k = min(int(np.searchsorted(reach, w, side='right')) + 1, max(w - 1, 1))
+            self.__w = w
+
+            ''' Steps before k hold for every longer prefix, they join the shared turns '''
+            log = []
+
+            while step < k:
+                engine.step(step, n, log)
+                step += 1
+
+            self.__expire()
+            self.__sync([x for x, _ in log])
+
+            ''' The steps from k on see only the first w sticks '''
+            log = []
+            lastPoint = engine.lastPoint
+
+            for i in range(k, w - 1):
+                engine.step(i, w, log)
+
+            touched = [x for x, _ in log]
+            self.__sync(touched)
+            self.states[w] = self.__estimate(w)
+
+            for x, old in reversed(log):
+                engine.turn[x] = old
+
+            for x in set(touched):
+                i = bisect.bisect_left(engine.points, x)
+                listed = i < len(engine.points) and engine.points[i] == x
+
+                if engine.turn[x] != 0 and not listed:
+                    engine.points.insert(i, x)
+                elif engine.turn[x] == 0 and listed:
+                    del engine.points[i]
+
+            engine.lastPoint = lastPoint
+            self.__sync(touched)
+
+    def __key(self, x, kind):
+        return (self.__low[x], x) if kind == -1 else (-self.__high[x], x)
+
+    def __brokenAt(self, x, kind):
+        ''' Shortest prefix in which a close between x and the last stick went past x '''
+        return (self.__belowAfter[x] if kind == -1 else self.__aboveAfter[x]) + 2
+
+    def __add(self, x, kind):
+        bisect.insort(self.__positions[kind], x)
+        self.__candidates[kind].add(self.__key(x, kind))
+
+        if self.__brokenAt(x, kind) > self.__w:
+            bisect.insort(self.__unbroken[kind], self.__key(x, kind))
+            heapq.heappush(self.__expiry, (self.__brokenAt(x, kind), x, kind))
+
+    def __discard(self, items, item):
+        i = bisect.bisect_left(items, item)
+
+        if i < len(items) and items[i] == item:
+            del items[i]
+
+    def __remove(self, x, kind):
+        self.__discard(self.__positions[kind], x)
+        self.__candidates[kind].remove(self.__key(x, kind))
+        self.__discard(self.__unbroken[kind], self.__key(x, kind))
+
+    def __expire(self):
+        while self.__expiry and self.__expiry[0][0] <= self.__w:
+            _, x, kind = heapq.heappop(self.__expiry)
+            self.__discard(self.__unbroken[kind], self.__key(x, kind))
+
+    def __sync(self, touched):
+        ''' Bring the structures in line with the turns at the touched positions. The circle of a turn depends on the turn before it, so the turn after each change is looked at again '''
+        turn = self.__engine.turn
+        points = self.__engine.points
+        changed = [x for x in set(touched) if self.__seen[x] != turn[x]]
+
+        for x in changed:
+            if self.__seen[x] != 0:
+                self.__remove(x, self.__seen[x])
+
+        for x in changed:
+            self.__seen[x] = int(turn[x])
+
+            if turn[x] != 0:
+                self.__add(x, int(turn[x]))
+
+        after = [bisect.bisect_right(points, x) for x in changed]
+
+        for c in set(changed) | {points[i] for i in after if i < len(points)}:
+            i = bisect.bisect_left(points, c)
+            before = points[i - 1] if i > 0 and turn[c] != 0 else None
+            self.__circles[1].set(c, self.__belowFrom[before] + 1 if before is not None and turn[c] == 1 else self.__length + 2)
+            self.__circles[-1].set(c, self.__aboveFrom[before] + 1 if before is not None and turn[c] == -1 else self.__length + 2)
+
+    def __estimate(self, w):
+        if not self.__positions[1] or not self.__positions[-1]:
+            return 'invalid'
+
+        lastK = self.__circles[1].rightmost(w)
+        lastD = self.__circles[-1].rightmost(w)
+
+        if lastK < 0 and lastD < 0:
+            return 'toss'
+
+        close = float(self.__close[w - 1])
+
+        ''' The last circle a re-V one, a V turn above the close may break down. Else a re-V turn under the close may break up '''
+        if lastK > lastD:
+            return self.__side(w, -1, (close, np.inf), lastD, lastK, 'DropFT', 'Drop')
+
+        return self.__side(w, 1, (-close, np.inf), lastK, lastD, 'RiseBT', 'Rise')
+
+    def __side(self, w, kind, beyond, circle, anchor, broke, held):
+        ''' Candidates are the unbroken turns up to the last circle of their kind and every turn after it. The nearest one past the close breaks if still unbroken.
+            Without circles of the kind nor a candidate, the turn before the last circle of the other kind is compared instead '''
+        unbroken = self.__unbroken[kind]
+        candidates = self.__candidates[kind]
+        i = bisect.bisect_right(unbroken, beyond)
+        found = [item for item in [unbroken[i] if i < len(unbroken) else None, candidates.least(circle, beyond)] if item is not None]
+
+        if found:
+            best = min(found)
+            i = bisect.bisect_right(unbroken, best)
+            ties = [item for item in [unbroken[i] if i < len(unbroken) else None, candidates.least(circle, best)] if item is not None and item[0] == best[0]]
+
+            if ties:
+                return None
+
+            x = best[1]
+        elif circle >= 0:
+            return held
+        else:
+            positions = self.__positions[kind]
+            i = bisect.bisect_left(positions, anchor)
+
+            if i == 0:
+                return 'invalid'
+
+            x = positions[i - 1]
+
+        return broke if self.__brokenAt(x, kind) > w else held
+
+
+class PrefixAnalyzer():
+    ''' Evaluate Stock on the prefixes of one BarSeries, as views of it. The state is loaded once and every prefix takes its turns from a single journaled trend run.
+        A prefix the state does not fit, as it keeps sticks past the prefix, is analyzed without it. resume=False analyzes every prefix as the first run of the code would.
+        The prefixes analyzed without the state get their states from one forward pass of PrefixStates, only the ones the state fits run Stock '''
+    def __init__(self, code, mode, date, source, configPath=DEFAULT_CONFIG, settings=None, resume=True):
+        ''' Decode Config '''
+        settings = settings if settings is not None else Settings.load(configPath)
+
+        ''' Properties '''
+        self.__code = code
+        self.__mode = mode
+        self.__date = date
+        self.__source = source
+        self.__settings = settings
+
+        ''' Load the state once for all prefixes. The state fits every prefix from fitting on, as their sticks end later '''
+        self.__state = loadState(settings, code, mode) if resume else None
+        self.__fitting = len(source) + 1
+
+        if self.__state is not None:
+            self.__fitting = next((w for w in range(1, len(source) + 1) if self.__state.fits(int(source.date[w - 1]))), len(source) + 1)
+
+        ''' Journaled trend runs by the turn seeding their first stick, Stock seeds it from the state it resumes '''
+        self.__turns = {}
+
+        ''' Forward pass over the prefixes, latest[w] the longest prefix up to w that breaks or needs Stock. Results by prefix '''
+        self.__states = None
+        self.__latest = None
+        self.__results = {}
+
+    def __prefixTurns(self, state):
+        initTurn = state.turn if state is not None and not state.empty else 0
+
+        if initTurn not in self.__turns:
+            self.__turns[initTurn] = PrefixTurns(self.__source.high, self.__source.low, initTurn)
+
+        return self.__turns[initTurn]
+
+    def __forward(self):
+        if self.__states is None:
+            with metrics.stage('forward'):
+                self.__states = PrefixStates(self.__source.high, self.__source.low, self.__source.close).states
+                latest = np.array([w if state is None or state == 'RiseBT' or state == 'DropFT' else 0 for w, state in enumerate(self.__states)])
+                self.__latest = np.maximum.accumulate(latest).tolist()
+
+        return self.__states
+
+    def evaluate(self, w):
+        ''' Same result as Stock(code, mode, date, source=source.slice(0, w)) without writing the state. A prefix costs less to analyze than to look up in the cache '''
+        state = self.__state if self.__state is not None and (w == 0 or self.__state.fits(int(self.__source.date[w - 1]))) else None
+
+        return Stock(self.__code, self.__mode, self.__date, \
+            source = self.__source.slice(0, w), \
+            modifyArchive = False, \
+            state = state, \
+            turns = self.__prefixTurns(state).turns(w) if w > 0 else None, \
+            settings = self.__settings, \
+            cache = False, \
+            deep = True, \
+            resume = state is not None)
+
+    def result(self, w):
+        ''' state and last_date of prefix w, as evaluate(w) reports them. Without the state from the forward pass, unless two candidates of the prefix tie '''
+        if w not in self.__results:
+            state = self.__forward()[w] if 0 < w < self.__fitting else None
+            self.__results[w] = {'state': state, 'last_date': str(np.datetime64(int(self.__source.date[w - 1]), 'D'))} if state is not None else self.evaluate(w).result
+
+        return self.__results[w]
+
+    def latestBreak(self, end):
+        ''' Longest prefix of 1 to end in RiseBT or DropFT and its result, (None, None) when none breaks. The prefixes the state fits are walked down with Stock, the others looked up '''
+        with metrics.stage('prefixes'):
+            w = end
+
+            while w > 0:
+                if w < self.__fitting:
+                    self.__forward()
+                    w = self.__latest[w]
+
+                    if w == 0:
+                        break
+
+                result = self.result(w)
+
+                if result['state'] == 'fail':
+                    raise RuntimeError
+
+                if result['state'] == 'RiseBT' or result['state'] == 'DropFT':
+                    return w, result
+
+                w -= 1
+
+        return None, None
+
+    def lastBreak(self, end):
+        ''' latestBreak down to the empty prefix, for which Stock downloads the whole history up to date '''
+        w, result = self.latestBreak(end)
+
+        if w is not None:
+            return w, result
+
+        result = self.result(0)
+
+        if result['state'] == 'fail':
+            raise RuntimeError
+
+        if result['state'] == 'RiseBT' or result['state'] == 'DropFT':
+            return 0, result
+
+        return None, None
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import pandas as pd
+import numpy as np
+import os
+
+''' Every state historicalCalc reports. Anything else is packed as the trailing 'other' '''
+STATES = ['SynBT', 'SynFT', 'RiseBT', 'DropFT', 'Rise', 'Drop', 'cancel', 'Missing the source', 'Weekly analysis failed', 'Daily analysis failed', 'missing intermediate data', 'failed calling', 'other']
+STATE_INDEX = {state: i for i, state in enumerate(STATES)}
+
+''' State of a Stock whose sticks begin after the turn it has to compare with. Analyzed again over the whole history of the code it gets a real one '''
+NEEDS_HISTORY = 'needs history'
+
+''' States of an analysis that did not finish, a rerun tries the code again '''
+FAILED_STATES = ['Missing the source', 'Weekly analysis failed', 'Daily analysis failed', 'failed calling', NEEDS_HISTORY]
+RESULT_DTYPE = np.dtype([('code', np.int32), ('state', np.int8), ('gain_rate', np.float64)])
+
+
+def pack(results):
+    ''' Result dicts as one structured array, 13 bytes a code. None results, of codes that never reached the date, are left out '''
+    results = [r for r in results if r is not None]
+    array = np.empty(len(results), dtype=RESULT_DTYPE)
+
+    array['code'] = [int(r['code']) for r in results]
+    array['state'] = [STATE_INDEX.get(r['state'], STATE_INDEX['other']) for r in results]
+    array['gain_rate'] = [r.get('gain_rate', np.nan) for r in results]
+
+    return array
+
+
+def frame(array, codes=None):
+    ''' code/state/gain_rate frame of packed results, in the order of codes when given '''
+    if codes is not None:
+        array = array[np.argsort(pd.Index(codes).get_indexer(array['code']), kind='stable')]
+
+    return pd.DataFrame({'code': array['code'].astype(np.int64), 'state': np.array(STATES, dtype=object)[array['state']], 'gain_rate': array['gain_rate']})
+
+
+def rank(df):
+    ''' Synchronized breaks first, then single breaks by gain rate, then the codes still trending '''
+    df = pd.concat([
+        df.loc[df['state'] == 'SynBT'].sort_values(by=['gain_rate'], ascending=False),
+        df.loc[df['state'] == 'SynFT'].sort_values(by=['gain_rate'], ascending=False),
+        df.loc[df['state'] == 'RiseBT'].sort_values(by=['gain_rate'], ascending=False),
+        df.loc[df['state'] == 'DropFT'].sort_values(by=['gain_rate'], ascending=False),
+        df.loc[(df['state'] == 'Rise') | (df['state'] == 'Drop')].sort_values(by=['code'])
+    ])
+    df['gain_rate'] = df['gain_rate'].map(lambda x: round(x, 3))
+
+    return df
+
+
+def writeCsv(df, path):
+    ''' Write through a temporary file, a crash never leaves half a result behind '''
+    temp = path + '.tmp'
+    df.to_csv(temp, encoding='utf_8')
+    os.replace(temp, path)
+
+
+def unpack(batches):
+    ''' Packed batches back as one structured array '''
+    return np.frombuffer(b''.join(batches), dtype=RESULT_DTYPE)
+
+
+class PoolChannel():
+    ''' Packed results travel back as the raw bytes returned by the pool tasks '''
+    def put(self, results):
+        return pack(results).tobytes()
+
+    def collect(self, returned, codes=None):
+        return frame(unpack(returned), codes)
+
+
+class RedisChannel():
+    ''' Packed results kept in Redis under prefix, one key per batch, for masters that collect from another process. redis is only needed when this channel is used '''
+    def __init__(self, prefix, host='localhost', port=6379, db=0):
+        self.prefix = prefix
+        self.host = host
+        self.port = port
+        self.db = db
+        self.__connections = {}
+
+    def __connect(self):
+        import redis
+
+        pid = os.getpid()
+
+        if pid not in self.__connections:
+            self.__connections = {pid: redis.Redis(host=self.host, port=self.port, db=self.db)}
+
+        return self.__connections[pid]
+
+    def __getstate__(self):
+        ''' Connections stay in the process that opened them '''
+        return {'prefix': self.prefix, 'host': self.host, 'port': self.port, 'db': self.db}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__connections = {}
+
+    def clear(self):
+        keys = self.__connect().keys(self.prefix + ':*')
+
+        if keys:
+            self.__connect().delete(*keys)
+
+    def put(self, results):
+        array = pack(results)
+        key = self.prefix + ':' + (str(int(array['code'][0])) if len(array) else 'empty:' + str(os.getpid()))
+        self.__connect().set(key, array.tobytes())
+
+        return key
+
+    def collect(self, returned, codes=None):
+        ''' One pipelined round trip for every batch '''
+        pipe = self.__connect().pipeline()
+
+        for key in returned:
+            pipe.get(key)
+
+        return frame(unpack([data for data in pipe.execute() if data is not None]), codes)
+
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+from .storage import getStorage
+from .market import getResources
+from .trading import TradingCalendar
+from .cache import AnalysisCache
+
+import pandas as pd
+import configparser
+import os
+
+DEFAULT_CONFIG = os.path.join(os.path.dirname(__file__), '../config/config.ini')
+
+
+class Settings():
+    ''' config.ini resolved once per process. Pool workers inherit the instance the master loaded before forking '''
+    __instances = {}
+
+    def __init__(self, configPath=DEFAULT_CONFIG):
+        config = configparser.ConfigParser()
+        config.read(configPath)
+
+        self.configPath = configPath
+        self.config = config
+
+        ''' Directories '''
+        self.archiveDir = config['Dir']['Archive']
+        self.resourceDir = config['Dir']['Resource']
+        self.resultDir = config['Dir']['Result']
+        self.configDir = config['Dir']['Config']
+
+        ''' Backends '''
+        self.storage = getStorage(config)
+        self.resources = getResources(config)
+        self.calendar = TradingCalendar.load()
+
+        ''' Result cache, off without a [Cache] section '''
+        self.cache = AnalysisCache(config['Cache']['Dir'], int(config['Cache'].get('Entries', 1024)), int(config['Cache'].get('DiskEntries', 100000))) if config.has_section('Cache') else None
+
+        self.__codes = None
+
+    @classmethod
+    def load(cls, configPath=DEFAULT_CONFIG):
+        ''' Shared instance of a config file, parsed on first use '''
+        key = os.path.abspath(configPath)
+
+        if key not in cls.__instances:
+            cls.__instances[key] = cls(configPath)
+
+        return cls.__instances[key]
+
+    @property
+    def codes(self):
+        ''' Codes of the market from [Codes] CsvFile, read on first use '''
+        if self.__codes is None:
+            self.__codes = pd.read_csv(self.config['Codes']['CsvFile'])['code']
+
+        return self.__codes
+
+    def archivePath(self, code, mode):
+        return self.archiveDir + 'save_' + str(code) + '_' + mode + self.storage.extension
+
+    def statePath(self, code, mode):
+        return self.archiveDir + 'save_' + str(code) + '_' + mode + '.state'
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+from multiprocessing import shared_memory, util
+from .universe import Universe
+from .bars import BarSeries, COLUMNS
+from .metrics import metrics
+
+import numpy as np
+
+FIELDS = ['codes', 'offsets'] + COLUMNS
+
+
+class SharedUniverse():
+    ''' A Universe whose arrays live in shared memory, one block per array: codes, offsets and the stick columns.
+        The master creates it before the pool starts and hands spec to the jobs. Workers attach by the block names and slice the sticks of a code as views, nothing is copied, pickled or read from disk '''
+
+    ''' Universes this process attached to, by the name of their codes block. A worker attaches once, keeps them for every later job and closes them when it exits '''
+    __attached = {}
+
+    def __init__(self, universe, blocks, owner=False):
+        self.universe = universe
+        self.__blocks = blocks
+        self.__owner = owner
+        self.__positions = {int(code): i for i, code in enumerate(universe.codes)}
+
+    @classmethod
+    def create(cls, universe):
+        ''' Copy the arrays of universe into new blocks. Only the master creates, it also unlinks them at the end '''
+        arrays = {'codes': universe.codes, 'offsets': np.asarray(universe.offsets, dtype=np.int64)}
+        arrays.update({name: getattr(universe.bars, name) for name in COLUMNS})
+        blocks = {}
+        views = {}
+
+        for name in FIELDS:
+            array = np.ascontiguousarray(arrays[name])
+            blocks[name] = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            views[name] = np.ndarray(array.shape, dtype=array.dtype, buffer=blocks[name].buf)
+            views[name][:] = array
+
+        return cls(Universe(views['codes'], views['offsets'], BarSeries(*[views[name] for name in COLUMNS])), blocks, owner=True)
+
+    @property
+    def spec(self):
+        ''' What a worker needs to attach: {field: (block name, dtype, length)}, small enough to travel with every job '''
+        return {name: (self.__blocks[name].name, self.__array(name).dtype.str, len(self.__array(name))) for name in FIELDS}
+
+    def __array(self, name):
+        return getattr(self.universe, name) if name in ['codes', 'offsets'] else getattr(self.universe.bars, name)
+
+    @classmethod
+    def attach(cls, spec):
+        ''' The universe of spec, attached on the first call in a process and reused after '''
+        key = spec['codes'][0]
+
+        if key not in cls.__attached:
+            if not cls.__attached:
+                util.Finalize(None, cls.detach, exitpriority=0)
+
+            with metrics.stage('attach'):
+                blocks = {name: shared_memory.SharedMemory(name=spec[name][0]) for name in FIELDS}
+                views = {name: np.ndarray((spec[name][2],), dtype=np.dtype(spec[name][1]), buffer=blocks[name].buf) for name in FIELDS}
+                cls.__attached[key] = cls(Universe(views['codes'], views['offsets'], BarSeries(*[views[name] for name in COLUMNS])), blocks)
+
+        return cls.__attached[key]
+
+    @classmethod
+    def detach(cls):
+        ''' Close every universe this process attached to '''
+        for universe in cls.__attached.values():
+            try:
+                universe.close()
+            except:
+                print(u'\u001b[41;1m[WARNING/Shared]\u001b[0m failed to close an attached history, views of it are still in use')
+
+        cls.__attached.clear()
+
+    def bars(self, code):
+        ''' Sticks of code as views into the blocks, None for a code the universe holds no sticks of '''
+        i = self.__positions.get(int(code))
+
+        if i is None or self.universe.offsets[i] == self.universe.offsets[i + 1]:
+            return None
+
+        return self.universe[i]
+
+    def reaches(self, code, date):
+        ''' Whether the sticks of code run up to date '''
+        bars = self.bars(code)
+
+        return bars is not None and bars.date[-1] >= np.datetime64(date, 'D').astype(np.int64)
+
+    def size(self, code):
+        i = self.__positions.get(int(code))
+
+        return int(self.universe.offsets[i + 1] - self.universe.offsets[i]) if i is not None else 0
+
+    def close(self):
+        ''' Drop the views before the blocks, a block with views left on it can't close. The owner removes the blocks too '''
+        self.universe = None
+
+        for block in self.__blocks.values():
+            block.close()
+
+            if self.__owner:
+                block.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def sharedHistory(codes, date, resources):
+    ''' Weekly and daily sticks of codes up to date in shared memory, {'w': SharedUniverse, 'd': SharedUniverse} '''
+    return {mode: SharedUniverse.create(Universe.load(codes, mode, date, resources)) for mode in ['w', 'd']}
+
+
+def attachedHistory(specs, code):
+    ''' (weekBars, dayBars) of code as views into the shared history of specs, (None, None) when specs hold no sticks of it in either resolution '''
+    if not specs:
+        return None, None
+
+    weekBars, dayBars = [SharedUniverse.attach(specs[mode]).bars(code) for mode in ['w', 'd']]
+
+    return (weekBars, dayBars) if weekBars is not None and dayBars is not None else (None, None)
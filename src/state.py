@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+from .bars import BarSeries
+from .metrics import metrics
+
+import numpy as np
+import struct
+import os
+
+MAGIC = b'CCST'
+VERSION = 1
+
+''' magic, version, sticks, resume date as days since 1970-01-01, turn/kT/dT seeds '''
+HEADER = struct.Struct('<4sHIi3b')
+NO_DATE = -2 ** 31
+STICK_DTYPE = np.dtype([('date', '<i4'), ('close', '<f8'), ('open', '<f8'), ('high', '<f8'), ('low', '<f8'), ('amount', '<i8'), ('turn', 'i1'), ('kT', 'i1'), ('dT', 'i1')])
+
+
+class StockState():
+    ''' What a Stock resumes from for one (code, mode): the date the next run re-downloads from, the flags seeding its first stick and the kept turns and circles.
+        The sticks are stored in date order without repeated dates, so a run only appends its new sticks instead of sorting and de-duplicating the archive again '''
+    __slots__ = ['lastDate', 'turn', 'kT', 'dT', 'bars']
+
+    def __init__(self, lastDate, turn, kT, dT, bars):
+        self.lastDate = lastDate
+        self.turn = turn
+        self.kT = kT
+        self.dT = dT
+        self.bars = bars
+
+    @classmethod
+    def fromArchive(cls, df):
+        ''' State of an archive frame as estimate lays it out. The last row marks where to resume, the row before it seeds the flags '''
+        if df.empty:
+            return cls('', 0, 0, 0, BarSeries.fromFrame(df))
+
+        seed = df.iloc[-2] if len(df) >= 2 else None
+        bars = BarSeries.fromFrame(df.iloc[:-1])
+        order = np.argsort(bars.date, kind='stable')
+        dates = bars.date[order]
+
+        return cls(str(df['date'].iloc[-1]), \
+            int(seed['turn']) if seed is not None else 0, \
+            int(seed['kT'] == 1) if seed is not None else 0, \
+            int(seed['dT'] == 1) if seed is not None else 0, \
+            bars.take(order[np.r_[dates[1:] != dates[:-1], True][:len(dates)]]))
+
+    @property
+    def empty(self):
+        ''' A state without kept sticks resumes nothing, the next run downloads the whole history '''
+        return len(self.bars) == 0
+
+    def fits(self, date):
+        ''' Whether sticks ending on date can resume from the state: it resumes before date and keeps no stick after it.
+            A state saved from later sticks would bring them into an analysis of the earlier ones '''
+        day = np.datetime64(date, 'D')
+
+        return (not self.lastDate or np.datetime64(self.lastDate, 'D') < day) and (self.empty or self.bars.date[-1] <= day.astype(np.int64))
+
+    def resume(self, bars):
+        ''' Kept sticks followed by the sticks of a new run, which win on the dates they share '''
+        return self.bars.mergeSorted(bars)
+
+    def toFrame(self):
+        return self.bars.toFrame()
+
+    def tobytes(self):
+        data = np.empty(len(self.bars), dtype=STICK_DTYPE)
+
+        for name in STICK_DTYPE.names:
+            data[name] = getattr(self.bars, name)
+
+        lastDate = int(np.datetime64(self.lastDate, 'D').astype(np.int64)) if self.lastDate else NO_DATE
+
+        return HEADER.pack(MAGIC, VERSION, len(data), lastDate, self.turn, self.kT, self.dT) + data.tobytes()
+
+    @classmethod
+    def frombytes(cls, raw):
+        ''' ValueError when raw is not a state of this version '''
+        if len(raw) < HEADER.size:
+            raise ValueError('truncated state file')
+
+        magic, version, length, lastDate, turn, kT, dT = HEADER.unpack_from(raw)
+
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('state file of version {} instead of {}'.format(version, VERSION))
+
+        if len(raw) != HEADER.size + length * STICK_DTYPE.itemsize:
+            raise ValueError('truncated state file')
+
+        data = np.frombuffer(raw, dtype=STICK_DTYPE, count=length, offset=HEADER.size)
+        bars = BarSeries(*[data[name].astype(STICK_DTYPE[name].newbyteorder('=')) for name in STICK_DTYPE.names])
+
+        return cls(str(np.datetime64(lastDate, 'D')) if lastDate != NO_DATE else '', turn, kT, dT, bars)
+
+    def save(self, path):
+        writeState(self.tobytes(), path)
+
+    @classmethod
+    def load(cls, path):
+        return cls.frombytes(readState(path))
+
+
+def readState(path):
+    ''' Raw bytes of a state file, None when there is none '''
+    if not os.path.exists(path):
+        return None
+
+    with metrics.stage('state read'), open(path, 'rb') as f:
+        raw = f.read()
+
+    metrics.count('bytes read', len(raw))
+
+    return raw
+
+
+def writeState(raw, path):
+    ''' Replace rather than rewrite in place, a reader may be half way through the old file '''
+    temp = path + '.tmp'
+
+    with metrics.stage('state write'):
+        with open(temp, 'wb') as f:
+            f.write(raw)
+
+        os.replace(temp, path)
+
+    metrics.count('bytes written', len(raw))
+
+
+def fittingState(state, date, code):
+    ''' state when sticks ending on date can resume from it. None when it was saved from later sticks, the sticks are analyzed without it '''
+    if state is None or state.fits(date):
+        return state
+
+    print(u'\u001b[33;1m[WARNING/State: {}]\u001b[0m state resuming on {} keeps sticks past {}, analyzing without it'.format(code, state.lastDate, np.datetime64(date, 'D')))
+
+    return None
+
+
+def loadState(settings, code, mode):
+    ''' State of (code, mode), converted from the archive file of earlier runs while there is no state file.
+        None when there is neither, or the state file is of another version, so the code is analyzed over its whole history again '''
+    path = settings.statePath(code, mode)
+
+    if os.path.exists(path):
+        try:
+            return StockState.load(path)
+        except ValueError as e:
+            print(u'\u001b[41;1m[WARNING/State: {}]\u001b[0m {}, analyzing without it'.format(code, e))
+
+            return None
+
+    archivePath = settings.archivePath(code, mode)
+
+    if os.path.exists(archivePath):
+        return StockState.fromArchive(settings.storage.read(archivePath))
+
+    return None
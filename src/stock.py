@@ -3,50 +3,68 @@
 
 from datetime import datetime, timedelta
 from dateutil.parser import parse
-from retry import retry
 from io import StringIO
 
 import pandas as pd
 import numpy as np
 import time
 import math
-import requests
-import configparser
 import re
 import calendar
 import json
 import os
 
+from .kernel import findTurns, markCircles, CloseIndex
+from .bars import BarSeries, COLUMNS
+from .client import HistoryClient, historyFrame
+from .settings import Settings, DEFAULT_CONFIG
+from .state import StockState, loadState, writeState
+from .metrics import metrics
+from .results import NEEDS_HISTORY
+
+''' Part of every cache key. Raise it with any change that alters the result or the state of an analysis '''
+ALGORITHM_VERSION = 2
+
 
 class Stock():
-    def __init__(self, code, mode, date, source=pd.DataFrame([]), download_only=False, modifyArchive=True, configPath=os.path.join(os.path.dirname(__file__), '../config/config.ini')):
-        ''' Decode Config '''
-        config = configparser.ConfigParser()
-        config.read(configPath)
+    def __init__(self, code, mode, date, source=pd.DataFrame([]), download_only=False, modifyArchive=True, engine='numpy', state=None, turns=None, configPath=DEFAULT_CONFIG, settings=None, cache=True, deep=False, resume=True):
+        ''' deep tells that the sticks reach back to the beginning of the code, without a source the whole history is downloaded. Otherwise estimate may end in NEEDS_HISTORY.
+            resume=False analyzes the sticks as the first run of the code would, whatever state is stored.
+            Decode Config once per process unless the caller hands its settings over '''
+        settings = settings if settings is not None else Settings.load(configPath)
         
         ''' Properties '''
         self.__code = code
         self.__mode = mode
         self.__date = date
         self.__modifyArchive = modifyArchive
+        self.__engine = engine
+        self.__turns = turns
+        self.__configPath = settings.configPath
+        self.__cache = settings.cache if cache else None
 
         ''' Files '''
-        self.__archiveDir = config['Dir']['Archive']
-        self.__archivePath = self.__archiveDir + 'save_' + str(self.__code) + '_' + self.__mode + '.csv'
+        self.__statePath = settings.statePath(self.__code, self.__mode)
         
-        ''' Process archive file '''
-        self.__archiveData = pd.DataFrame([])
+        ''' Resume from the state of the last run. A caller analyzing many slices of one code can hand over the state it already loaded.
+            The state is resumed as it is, a caller analyzing sticks older than the state checks it with fittingState first '''
+        self.__state = (state if state is not None else loadState(settings, self.__code, self.__mode)) if resume else None
+
+        self.__stored = self.__state is not None
+        self.__lastPCDate = self.__state.lastDate if self.__stored else ''
+        self.__resumed = self.__stored and not self.__state.empty
+        self.__saved = None
 
-        if os.path.exists(self.__archivePath):
-            self.__archiveData = pd.read_csv(self.__archivePath, index_col=0)
-            self.__lastPCDate = self.__archiveData['date'].iloc[-1] if not self.__archiveData.empty else ''
-            self.__archiveData = self.__archiveData.iloc[:-1]
+        ''' Without a state to resume from the download has no date to start from, it reaches back to the beginning of the code '''
+        self.__deep = deep or (len(source) == 0 and not self.__resumed)
 
-        ''' Public '''
+        ''' Public. written is the state this object wrote for the next run, None when it wrote none '''
         self.result = {}
+        self.written = None
 
-        ''' Get data from source '''
-        self.__data = self.download() if source.empty else source
+        ''' Get data from source, downloaded without any stick. A BarSeries source is analyzed as it is, the frame only serves the figures below and estimate '''
+        self.__bars = source if isinstance(source, BarSeries) and len(source) > 0 else None
+        self.__data = source.toFrame(flags=False) if self.__bars is not None else self.download(all=self.__deep) if len(source) == 0 else source
 
         ''' If the object is going to run, run all the analysis '''
         if not self.__data.empty and not download_only:
@@ -57,52 +75,146 @@ class Stock():
             #self.__data = self.getMean(20)
             #self.__data = self.getMean(60)
 
-            ''' Algorithm '''
-            self.__data = self.trend()
-            self.__data = self.circle()
-            self.__data = self.validate()
-            self.result['state'] = self.estimate()
+            ''' Algorithm, unless the same sticks were analyzed the same way from the same state before. A shallow run may end in NEEDS_HISTORY where a deep one does not, handed over turns skip the trend run '''
+            bars = (self.__bars if self.__bars is not None else BarSeries.fromFrame(self.__data)) if self.__cache is not None else None
+            key = self.__key(bars, self.__state) if self.__cache is not None else None
+            cached = self.__cache.get(key) if key is not None else None
+
+            if cached is not None:
+                self.result, saved = cached
+
+                if self.__modifyArchive and saved is not None:
+                    writeState(saved, self.__statePath)
+                    self.written = StockState.frombytes(saved)
+            else:
+                self.__data = self.__analyze()
+
+                with metrics.stage('estimate'):
+                    self.result['state'] = self.estimate()
+
+                ''' Failed analyses are left out, a rerun tries them again. A rerun starts from the state this run wrote, so the entry goes under the key of that state too '''
+                if key is not None and self.result['state'] not in ['', 'fail', NEEDS_HISTORY]:
+                    saved = self.__saved.tobytes() if self.__saved is not None else None
+                    self.__cache.put(key, self.result, saved)
+
+                    if self.written is not None:
+                        self.__cache.put(self.__key(bars, self.written), self.result, saved)
         else:
             self.result['state'] = 'fail'
 
-    @retry(delay = 1, max_delay = 5, backoff = 1.5)
+    def __key(self, bars, state):
+        return self.__cache.key('Stock', self.__code, self.__mode, self.__date, bars, state, self.__engine, self.__deep, self.__turns is not None, ALGORITHM_VERSION)
+
     def download(self, all=False):
-        rs = requests.session()
         df = pd.DataFrame([])
 
-        ''' Mark the timestamp if the has archive file '''
-        fromDate = '&from=' + str(parse(self.__lastPCDate).timestamp()) if not all and not self.__archiveData.empty else ''
-
         try:
-            ''' Connect to server '''
-            res = rs.get('https://histock.tw/Stock/tv/udf.asmx/history?symbol={}&resolution={}&to={}'.format(self.__code, self.__mode, int(self.__date.timestamp())) + fromDate, \
-                headers = {'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_14_2) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/12.0.2 Safari/605.1.15'}, \
-                timeout=10, \
-                stream=True)
-
-            data = json.loads(res.text)
-            df = pd.DataFrame.from_dict(data = data)
-
-            if data['s'] == 'ok':
-                ''' Organize the df from network '''
-                df = df.drop(['s', 'nextTime'], axis=1)
-                df.columns = ['date', 'close', 'open', 'high', 'low', 'amount']
-                df['date'] = df['date'].map(lambda x: datetime.fromtimestamp(x - 37800).strftime('%Y-%m-%d'))
-            else:
-                print(u'\u001b[41;1m[WARNING/Stock: {}]\u001b[0m successful connection but with incorrect status'.format(self.__code))
+            ''' Mark the timestamp if the code has a state to resume from '''
+            fromDate = str(parse(self.__lastPCDate).timestamp()) if not all and self.__resumed else None
+
+            ''' Connect to server through the pooled client of this process '''
+            with metrics.stage('download'):
+                data = HistoryClient.shared(self.__configPath).history(self.__code, self.__mode, int(self.__date.timestamp()), fromDate)
+
+                if data['s'] == 'ok':
+                    ''' Organize the df from network '''
+                    df = historyFrame(data)
+                else:
+                    print(u'\u001b[41;1m[WARNING/Stock: {}]\u001b[0m successful connection but with incorrect status'.format(self.__code))
         except:
             print(u'\u001b[41;1m[ERROR/Stock: {}]\u001b[0m failed to connect source'.format(self.__code))
         finally:
             return df
     
+    def __analyze(self):
+        ''' Trend, circle and validate self.__data. The NumPy engine runs them on a BarSeries and builds the frame once, after resuming the state '''
+        if self.__engine == 'reference':
+            with metrics.stage('trend'):
+                self.__data = self.trend()
+
+            with metrics.stage('circle'):
+                self.__data = self.circle()
+
+            with metrics.stage('validate'):
+                return self.validate()
+
+        bars = BarSeries(*[getattr(self.__bars, name) for name in COLUMNS]) if self.__bars is not None else BarSeries.fromFrame(self.__data)
+        self.__bars = None
+
+        with metrics.stage('trend'):
+            self.__trendBars(bars)
+
+        with metrics.stage('circle'):
+            self.__circleBars(bars)
+
+        with metrics.stage('validate'):
+            return self.__validateBars(bars)
+
+    def __trendBars(self, bars):
+        try:
+            initTurn = self.__state.turn if self.__resumed else 0
+            bars.turn = (self.__turns if self.__turns is not None else findTurns(bars.high, bars.low, initTurn)).astype(np.int8)
+        except:
+            print(u'\u001b[41;1m[ERROR/Stock: {}]\u001b[0m failed to trend'.format(self.__code))
+
+    def __circleBars(self, bars):
+        ''' The flags of the state carry over to the first stick, kT before dT '''
+        initK = initD = 0
+
+        if self.__resumed:
+            if self.__state.kT == 1:
+                initK = 1
+            elif self.__state.dT == 1:
+                initD = 1
+
+        try:
+            bars.kT, bars.dT = markCircles(bars.high, bars.low, bars.close, bars.turn, initK, initD)
+        except MemoryError:
+            ''' Unmarked sticks would be estimated as if they had no circles, the analysis fails instead '''
+            raise
+        except:
+            print(u'\u001b[41;1m[ERROR/Stock: {}]\u001b[0m failed to circle'.format(self.__code))
+
+    def __validateBars(self, bars):
+        ''' A circle is dropped when the next circle of its kind does not go beyond it. Returns the frame following the sticks kept in the state '''
+        try:
+            for flag, price, beyond in [(bars.kT, bars.high, np.less_equal), (bars.dT, bars.low, np.greater_equal)]:
+                circles = np.flatnonzero(flag == 1)
+
+                if len(circles) > 1:
+                    flag[circles[:-1][beyond(price[circles[:-1]], price[circles[1:]])]] = 0
+
+            if self.__resumed:
+                bars = self.__state.resume(bars)
+        except:
+            print(u'\u001b[41;1m[ERROR/Stock: {}]\u001b[0m failed to validate'.format(self.__code))
+
+        return bars.toFrame()
+
     def trend(self):
+        ''' The reference engine is the original stick-by-stick walk, kept to cross-check the NumPy engine '''
+        return self.__trendReference() if self.__engine == 'reference' else self.__trendNumpy()
+
+    def __trendNumpy(self):
+        df = self.__data
+
+        try:
+            initTurn = self.__state.turn if self.__resumed else 0
+            turns = self.__turns if self.__turns is not None else findTurns(df['high'].values, df['low'].values, initTurn)
+            df['turn'] = turns.astype(np.float64)
+        except:
+            print(u'\u001b[41;1m[ERROR/Stock: {}]\u001b[0m failed to trend'.format(self.__code))
+        finally:
+            return df
+
+    def __trendReference(self):
         df = self.__data
 
         df['turn'] = pd.Series(index = df.index).fillna(0)
         lastPoint = 0
 
-        if not self.__archiveData.empty: 
-            df.at[0, 'turn'] = self.__archiveData['turn'].iloc[-1]
+        if self.__resumed: 
+            df.at[0, 'turn'] = self.__state.turn
 
         try:
             ''' Loop each stick '''
@@ -207,13 +319,14 @@ class Stock():
         df = self.__data
 
         tpDF = df.loc[df['turn'] != 0].reset_index()
+        closeIndex = CloseIndex(df['date'].values, df['close'].values)
         df['kT'] = pd.Series(index = df.index).fillna(0)
         df['dT'] = pd.Series(index = df.index).fillna(0)
 
-        if not self.__archiveData.empty:
-            if self.__archiveData['kT'].iloc[-1] == 1:
+        if self.__resumed:
+            if self.__state.kT == 1:
                 df.at[0, 'kT'] = 1
-            elif self.__archiveData['dT'].iloc[-1] == 1:
+            elif self.__state.dT == 1:
                 df.at[0, 'dT'] = 1
 
         try:
@@ -224,10 +337,10 @@ class Stock():
                 pK = tpDF.iloc[i - 1]
 
                 if row['turn'] == 1:
-                    if (pK['low'] > df[['close']].iloc[pK['index']:]).any().bool():
+                    if closeIndex.below(pK['low'], pK['index']):
                         df.at[row['index'], 'kT'] = 1
                 else:
-                    if (pK['high'] < df[['close']].iloc[pK['index']:]).any().bool():
+                    if closeIndex.above(pK['high'], pK['index']):
                         df.at[row['index'], 'dT'] = 1
         except:
             print(u'\u001b[41;1m[ERROR/Stock: {}]\u001b[0m failed to circle'.format(self.__code))
@@ -260,10 +373,10 @@ class Stock():
                     if cL >= nL:
                         df.loc[df['date'] == row['date'], 'dT'] = 0
 
-            df = pd.concat([self.__archiveData, df], sort=False) \
+            df = pd.concat([self.__state.toFrame(), df], sort=False) \
             .drop_duplicates(subset=['date'], keep='last') \
             .sort_values(by=['date']) \
-            .reset_index(drop=True) if not self.__archiveData.empty else df    
+            .reset_index(drop=True) if self.__resumed else df    
         except:
             print(u'\u001b[41;1m[ERROR/Stock: {}]\u001b[0m failed to validate'.format(self.__code))
         finally:
@@ -276,6 +389,7 @@ class Stock():
         try:
             ''' Get the last stick '''
             cK = df.iloc[-1]
+            closeIndex = CloseIndex(df['date'].values, df['close'].values)
 
             ''' Check is all types of turn existed '''
             lkT = df.loc[df['turn'] == 1].iloc[[-1]].index if len(df.loc[df['turn'] == 1]) > 0 else -1 #若有倒v轉折點，則選最後一個點；若無，則 -1
@@ -310,89 +424,38 @@ class Stock():
             ndT = nkT = tDT = tKT = pd.DataFrame([])
 
             ''' Calculate Drop type circles if needed '''
-            if (not os.path.exists(self.__archivePath) or int(lP['turn']) == 1):
-                if not lDT.empty:
-                    ndT = lDT.loc[lDT.date <= lDT.iloc[-1].date]
-
-                    for i, r in ndT.iloc[::-1].iterrows():
-                        if not ndT.loc[ndT.date < r.date].empty:
-                            pI = ndT.loc[ndT.date < r.date].iloc[-1]
-                        else:
-                            break
-
-                        rP = ldT.loc[ldT.date > pI.date]
-                        rP = rP.loc[rP.date < r.date]
-                        ndT = ndT.append(rP)
-
-                    ndT = ndT.append(ldT.loc[ldT.date < ndT.date.iloc[0]], ignore_index = True)
-                    ndT = ndT.reset_index(drop=True)
-
-                    for i, r in ndT.iterrows():
-                        if (float(r['low']) > df[['close']].loc[(df.date > r.date) & (df.date < df.date.iloc[-1])]).any().bool():
-                            ndT = ndT.drop([ndT.loc[ndT.date == r.date].index[0]])
-
-                ndT = ndT.append(ldT.loc[ldT.date > lDT.date.iloc[-1]] if not lDT.empty else ldT).sort_values(by = ['date'])
+            if (not self.__stored or int(lP['turn']) == 1):
+                ndT = self.__candidates(df, df['dT'].values == 1, df['turn'].values == -1, 'low', closeIndex.brokenDown)
                 tDT = ndT.loc[ndT['low'] > float(cK['close'])].sort_values(by = ['low']).iloc[0] if len(ndT.loc[ndT['low'] > float(cK['close'])]) > 0 else pd.DataFrame([])
 
             ''' Calculate Rise type circles if needed '''
-            if (not os.path.exists(self.__archivePath) or int(lP['turn']) == -1):
-                if not lKT.empty:
-                    nkT = lKT.loc[lKT.date <= lKT.iloc[-1].date]
-                    
-                    for i, r in nkT.iloc[::-1].iterrows():
-                        if not nkT.loc[nkT.date < r.date].empty:
-                            pI = nkT.loc[nkT.date < r.date].iloc[-1]
-                        else:
-                            break
-
-                        rP = lkT.loc[lkT.date > pI.date]
-                        rP = rP.loc[rP.date < r.date]
-                        nkT = nkT.append(rP)
-                    
-                    nkT = nkT.append(lkT.loc[lkT.date < nkT.date.iloc[0]], ignore_index = True)
-                    nkT = nkT.reset_index(drop=True)
-                
-                    for i, r in nkT.iterrows():
-                        if (float(r['high']) < df[['close']].loc[(df.date > r.date) & (df.date < df.date.iloc[-1])]).any().bool():
-                            nkT = nkT.drop([nkT.loc[nkT.date == r.date].index[0]])
-
-                nkT = nkT.append(lkT.loc[lkT.date > lKT.date.iloc[-1]] if not lKT.empty else lkT).sort_values(by = ['date'])
+            if (not self.__stored or int(lP['turn']) == -1):
+                nkT = self.__candidates(df, df['kT'].values == 1, df['turn'].values == 1, 'high', closeIndex.brokenUp)
                 tKT = nkT.loc[nkT['high'] < float(cK['close'])].sort_values(by = ['high'], ascending = False).iloc[0] if len(nkT.loc[nkT['high'] < float(cK['close'])]) > 0 else pd.DataFrame([])
 
-            ''' Save the result of calculation if permitted '''
-            if self.__modifyArchive:
-                (pd.concat([
+            ''' State to save if permitted, written once the state of the stock is known. A cached result keeps it for later runs '''
+            if self.__modifyArchive or self.__cache is not None:
+                self.__saved = StockState.fromArchive(pd.concat([
                     ndT.loc[(((ndT.low <= tDT.low) if not tDT.empty else True) & (ndT.date < cK.date)) | (ndT.date >= cK.date)] if not ndT.empty else df.loc[df['turn'] == -1],
                     nkT.loc[(((nkT.high >= tKT.high) if not tKT.empty else True) & (nkT.date < cK.date)) | (nkT.date >= cK.date)] if not nkT.empty  else df.loc[df['turn'] == 1],
                     df.loc[(df['kT'] != 0) | (df['dT'] != 0)].iloc[[-2]] if len(df.loc[(df['kT'] != 0) | (df['dT'] != 0)]) >= 2 else df.iloc[[0]]
-                ]).reset_index(drop=True)).to_csv(self.__archivePath, encoding='utf_8')
-
-            '''if not self.__archiveData.empty and not self.__archiveData.equals(pd.read_csv(self.__archivePath, index_col=0).iloc[:-1]):
-                print(str(self.__code) + " is changed.")'''
+                ]).reset_index(drop=True))
 
             ''' Determine the state of the stock by comparing the close and the closest potential break point '''
             if int(lP['turn']) == 1:
                 if lDT.empty and tDT.empty:
-                    for x in range(2):
-                        tK = df.loc[(df.date < lKT.date.iloc[-1]) & (df['turn'] == -1)]
-
-                        if tK.empty:
-                            self.__data = self.download(all=True)
-                            self.__data = self.trend()
-                            self.__data = self.circle()
-                            self.__data = self.validate()
-                            df = self.__data
+                    tK = df.loc[(df.date < lKT.date.iloc[-1]) & (df['turn'] == -1)]
 
                     if tK.empty:
-                        result = 'invalid'
+                        result = self.__shallow()
 
-                        raise ValueError('tK is empty')
+                        raise ValueError('tK is empty' if result == 'invalid' else 'tK is before the sticks')
                     else:
                         tK = tK.iloc[-1]
                 else:
                     tK = tDT
 
-                if not tK.empty and not (float(tK['low']) > df[['close']].loc[(df.date > tK.date) & (df.date < df.date.iloc[-1])]).any().bool():
+                if not tK.empty and not closeIndex.brokenDown(float(tK['low']), tK.date):
                     self.result['break_date'] = tK['date']
 
                     result = 'DropFT'
@@ -400,26 +463,18 @@ class Stock():
                     result = 'Drop'
             else:
                 if lKT.empty and tKT.empty:
-                    for x in range(2):
-                        tK = df.loc[(df.date < lDT.date.iloc[-1]) & (df['turn'] == 1)]
-
-                        if tK.empty:
-                            self.__data = self.download(all=True)
-                            self.__data = self.trend()
-                            self.__data = self.circle()
-                            self.__data = self.validate()
-                            df = self.__data
+                    tK = df.loc[(df.date < lDT.date.iloc[-1]) & (df['turn'] == 1)]
 
                     if tK.empty:
-                        result = 'invalid'
+                        result = self.__shallow()
 
-                        raise ValueError('tK is empty')
+                        raise ValueError('tK is empty' if result == 'invalid' else 'tK is before the sticks')
                     else:
                         tK = tK.iloc[-1]
                 else:
                     tK = tKT
 
-                if not tK.empty and not (float(tK['high']) < df[['close']].loc[(df.date > tK.date) & (df.date < df.date.iloc[-1])]).any().bool():
+                if not tK.empty and not closeIndex.brokenUp(float(tK['high']), tK.date):
                     self.result['break_date'] = tK['date']
 
                     result = 'RiseBT'
@@ -430,8 +485,42 @@ class Stock():
         except:
             print(u'\u001b[41;1m[ERROR/Stock: {}]\u001b[0m failed to estimate'.format(self.__code))
         finally:
+            ''' A run in need of a deeper history leaves the state as it found it, the deeper run starts from there again '''
+            if self.__modifyArchive and self.__saved is not None and result != NEEDS_HISTORY:
+                try:
+                    self.__saved.save(self.__statePath)
+                    self.written = self.__saved
+                except:
+                    print(u'\u001b[41;1m[ERROR/Stock: {}]\u001b[0m failed to save the state'.format(self.__code))
+
             return result
 
+    def __shallow(self):
+        ''' State of a Stock without the turn before its last circle. Sticks that do not reach back to the beginning of the code may miss it, the caller analyzes it again over the whole history '''
+        if self.__deep:
+            return 'invalid'
+
+        metrics.count('needs history')
+
+        return NEEDS_HISTORY
+
+    def __candidates(self, df, circles, turns, price, broken):
+        ''' Potential break points of one side, by position. Up to the last circle they are the circles and the turns before it, less the ones the close has broken through.
+            The turns after the last circle are all kept. Without circles every turn is a candidate '''
+        circles = np.flatnonzero(circles)
+        turns = np.flatnonzero(turns)
+
+        if len(circles) == 0:
+            return df.iloc[turns]
+
+        last = circles[-1]
+        kept = np.union1d(circles, turns[turns < last])
+        prices = df[price].values
+        dates = df['date'].values
+        kept = kept[[not broken(float(prices[p]), dates[p]) for p in kept]] if len(kept) else kept
+
+        return df.iloc[np.concatenate([kept, turns[turns > last]]).astype(np.int64)]
+
     def getMean(self, days):
         df = self.__data
         columnName = 'ma_{}'.format(days)
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import pandas as pd
+import numpy as np
+import os
+
+from .metrics import metrics
+
+
+class CsvStorage():
+    ''' Text files, the original layout of resources and archives '''
+    name = 'csv'
+    extension = '.csv'
+
+    def read(self, path):
+        with metrics.stage('read'):
+            df = pd.read_csv(path, index_col=0)
+
+        metrics.count('bytes read', os.path.getsize(path) if metrics.enabled else 0)
+
+        return df
+
+    def write(self, df, path):
+        with metrics.stage('write'):
+            df.to_csv(path, encoding='utf_8')
+
+        metrics.count('bytes written', os.path.getsize(path) if metrics.enabled else 0)
+
+
+class NpyStorage():
+    ''' One structured NumPy array per frame with fixed-width dtypes. Loading maps the file and copies the columns out, no text parsing '''
+    name = 'npy'
+    extension = '.npy'
+
+    def read(self, path):
+        with metrics.stage('read'):
+            data = np.load(path, mmap_mode='r')
+            df = pd.DataFrame({column: np.datetime_as_string(data[column].astype('datetime64[D]'), unit='D') if column == 'date' else np.array(data[column]) for column in data.dtype.names})
+
+        metrics.count('bytes read', os.path.getsize(path) if metrics.enabled else 0)
+
+        return df
+
+    def write(self, df, path):
+        ''' Dates are kept as int32 days since 1970-01-01 and come back as YYYY-MM-DD strings '''
+        dtype = []
+
+        for column in df.columns:
+            values = df[column].values
+
+            if column == 'date':
+                dtype.append(('date', np.int32))
+            elif values.dtype == object:
+                dtype.append((str(column), 'U{}'.format(max(1, int(df[column].astype(str).str.len().max()) if len(df) else 1))))
+            else:
+                dtype.append((str(column), values.dtype))
+
+        data = np.empty(len(df), dtype=dtype)
+
+        for column in df.columns:
+            if column == 'date':
+                data['date'] = pd.to_datetime(df['date']).values.astype('datetime64[D]').astype(np.int64)
+            else:
+                data[str(column)] = df[column].astype(str).values if df[column].dtype == object else df[column].values
+
+        ''' Replace rather than rewrite in place, another process may have the old file mapped '''
+        with metrics.stage('write'):
+            temp = path + '.tmp.npy'
+            np.save(temp, data)
+            os.replace(temp, path)
+
+        metrics.count('bytes written', data.nbytes)
+
+
+STORAGES = {storage.name: storage for storage in [CsvStorage(), NpyStorage()]}
+
+
+def getStorage(config):
+    ''' Backend named by [Storage] Format, csv when the section is missing '''
+    return STORAGES[config.get('Storage', 'Format', fallback='csv')]
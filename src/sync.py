@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+from dateutil.parser import parse
+from .client import historyFrame
+
+import pandas as pd
+import numpy as np
+
+
+class DeltaSync():
+    ''' Bring stored resources up to date by requesting only the bars from the last stored ones on.
+        The first overlap bars are fetched again and compared, a revised close or volume means the source adjusted the history and the code is re-fetched in full once '''
+    def __init__(self, resources, client, overlap=2):
+        self.__resources = resources
+        self.__client = client
+        self.overlap = overlap
+
+        ''' Counters of the current process '''
+        self.bars = 0
+        self.refetched = 0
+
+    def since(self, stored):
+        ''' Timestamp of the first overlap bar, None when there is nothing stored to extend '''
+        if stored.empty:
+            return None
+
+        return int(parse(stored['date'].iloc[-min(self.overlap, len(stored))]).timestamp())
+
+    def merge(self, stored, delta, resolution):
+        ''' Stored bars before the delta followed by the delta, or None when the overlap disagrees.
+            The last stored week is still open on the day it was stored, so it may change and is not compared '''
+        if stored.empty:
+            return delta
+
+        if delta.empty or delta['date'].iloc[0] != stored['date'].iloc[-min(self.overlap, len(stored))]:
+            return None
+
+        overlap = stored.iloc[-min(self.overlap, len(stored)):]
+        overlap = overlap.iloc[:-1] if resolution == 'w' else overlap
+        fresh = delta.set_index('date').reindex(overlap['date'])
+
+        if fresh['close'].isnull().any() or not np.allclose(fresh['close'].values, overlap['close'].values) or not np.array_equal(fresh['amount'].values, overlap['amount'].values):
+            return None
+
+        return pd.concat([stored.loc[stored['date'] < delta['date'].iloc[0]], delta]).reset_index(drop=True)
+
+    def fetch(self, code, resolution, date, since=None):
+        data = self.__client.history(code, resolution, int(date.timestamp()), since)
+
+        return historyFrame(data) if data['s'] == 'ok' else pd.DataFrame([])
+
+    def sync(self, code, resolution, date):
+        ''' Store the history of one code up to date and return it, empty when the source has nothing '''
+        try:
+            stored = self.__resources.latest(code, resolution, date)
+        except:
+            stored = pd.DataFrame([])
+
+        delta = self.fetch(code, resolution, date, self.since(stored))
+        self.bars += len(delta)
+        df = self.merge(stored, delta, resolution)
+        replace = df is None
+
+        if replace:
+            self.refetched += 1
+            df = self.fetch(code, resolution, date)
+            self.bars += len(df)
+
+        if not df.empty:
+            self.__resources.write(code, resolution, date, df, replace=replace)
+
+        return df
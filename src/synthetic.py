@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+from datetime import datetime
+
+import pandas as pd
+import numpy as np
+
+REGIMES = ['trending', 'ranging', 'gaps']
+
+
+def syntheticFrame(length, volatility=0.02, regime='trending', seed=0, start=datetime(2010, 1, 4)):
+    ''' Daily sticks of a made-up code in the layout of a resource, the same for the same arguments.
+        trending drifts away from its start, ranging is pulled back to it and gaps opens away from the last close every few days. Prices are rounded to cents so ties happen as in real quotes '''
+    rng = np.random.RandomState(seed)
+    steps = rng.normal(0, volatility, length)
+
+    if regime == 'trending':
+        ''' Long runs up or down, a new direction every 60 sticks on average '''
+        direction = np.where(rng.random_sample(length) < 1 / 60, -1, 1).cumprod() * (1 if rng.random_sample() < 0.5 else -1)
+        logClose = np.cumsum(steps + direction * volatility / 4)
+    elif regime == 'ranging':
+        logClose = np.zeros(length)
+
+        for i in range(1, length):
+            logClose[i] = logClose[i - 1] * 0.9 + steps[i]
+    elif regime == 'gaps':
+        logClose = np.cumsum(steps)
+    else:
+        raise ValueError('unknown regime ' + regime)
+
+    close = np.round(np.maximum(50 * np.exp(logClose), 1), 2)
+    gap = rng.normal(0, volatility / 4, length)
+
+    if regime == 'gaps':
+        gap = np.where(rng.random_sample(length) < 0.2, rng.normal(0, volatility * 3, length), gap)
+
+    openP = np.round(np.maximum(np.r_[close[0], close[:-1]] * (1 + gap), 1), 2)
+    high = np.round(np.maximum(close, openP) * (1 + np.abs(rng.normal(0, volatility / 2, length))), 2)
+    low = np.round(np.minimum(close, openP) * (1 - np.abs(rng.normal(0, volatility / 2, length))), 2)
+
+    return pd.DataFrame({
+        'date': pd.bdate_range(start, periods=length).strftime('%Y-%m-%d'),
+        'close': close,
+        'open': openP,
+        'high': high,
+        'low': low,
+        'amount': rng.randint(100, 20000, length).astype(np.int64)
+    })
+
+
+def weeklyFrame(dayDf):
+    ''' Weekly sticks of daily ones, each dated by the Monday of its week like the history service does '''
+    dates = pd.to_datetime(dayDf['date'])
+    week = (dates - pd.to_timedelta(dates.dt.weekday, unit='D')).dt.strftime('%Y-%m-%d')
+    groups = dayDf.groupby(week.values, sort=True)
+
+    return pd.DataFrame({
+        'date': groups['date'].first().index.values,
+        'close': groups['close'].last().values,
+        'open': groups['open'].first().values,
+        'high': groups['high'].max().values,
+        'low': groups['low'].min().values,
+        'amount': groups['amount'].sum().values
+    })
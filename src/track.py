@@ -4,42 +4,70 @@
 from datetime import datetime, timedelta
 from dateutil.parser import parse
 from .stock import Stock
+from .prefix import PrefixAnalyzer
+from .trading import TradingCalendar, DateIndex
+from .settings import Settings, DEFAULT_CONFIG
+from .state import loadState, readState, writeState, fittingState
+from .bars import BarSeries, COLUMNS
+from .stock import ALGORITHM_VERSION
+from .results import FAILED_STATES, NEEDS_HISTORY
 
 import pandas as pd
-import configparser
+import numpy as np
 import time
 import os
 
 def isHoliday(date, holidayFilePath = os.path.join(os.path.dirname(__file__), '../config/holidays.csv')):
-    configDf = pd.read_csv(holidayFilePath, index_col=0)
+    return not TradingCalendar.load(holidayFilePath).isTradingDay(date)
 
-    if date.strftime('%Y/%-m/%-d') in configDf.index and (date.weekday() >= 5 or configDf['isHoliday'].loc[date.strftime('%Y/%-m/%-d')] == '是'):
-        return True
+def historyAt(weekBars, dayBars, date):
+    ''' Weekly and daily sticks as they stood at the close of date, cut from a longer history. The stick of the week of date is rebuilt from its daily sticks up to date.
+        The daily sticks and a weekly series without sticks of the week stay views of the history '''
+    day = np.datetime64(date, 'D').astype(np.int64)
+    weekBars = weekBars.slice(0, int(np.searchsorted(weekBars.date, day, side='right')))
+    dayBars = dayBars.slice(0, int(np.searchsorted(dayBars.date, day, side='right')))
 
-    return False
+    if len(weekBars) == 0 or len(dayBars) == 0:
+        return weekBars, dayBars
+
+    week = dayBars.slice(int(np.searchsorted(dayBars.date, weekBars.date[-1])), len(dayBars))
+
+    if len(week) > 0:
+        weekBars = BarSeries(*[getattr(weekBars, name).copy() for name in COLUMNS])
+        weekBars.open[-1] = week.open[0]
+        weekBars.close[-1] = week.close[-1]
+        weekBars.high[-1] = week.high.max()
+        weekBars.low[-1] = week.low.min()
+        weekBars.amount[-1] = week.amount.sum()
+
+    return weekBars, dayBars
 
 class TrackStock():
-    def __init__(self, configPath=os.path.join(os.path.dirname(__file__), '../config/config.ini')):
-        ''' Decode Config '''
-        config = configparser.ConfigParser()
-        config.read(configPath)
+    def __init__(self, configPath=DEFAULT_CONFIG, settings=None):
+        ''' Decode Config once per process unless the caller hands its settings over '''
+        self.__settings = settings if settings is not None else Settings.load(configPath)
         
         ''' Define all the default path for each functional folder '''
-        self.__savesDir = config['Dir']['Archive']
-        self.__resourcesDir = config['Dir']['Resource']
-        self.__configDir = config['Dir']['Config']
+        self.__savesDir = self.__settings.archiveDir
+        self.__resources = self.__settings.resources
+        self.__configDir = self.__settings.configDir
+        self.__calendar = self.__settings.calendar
 
-    def dailyCalc(self, code, preStat, date=datetime.now().replace(hour = 0, minute = 0, second = 0, microsecond = 0)):
+    def dailyCalc(self, code, preStat, date=datetime.now().replace(hour = 0, minute = 0, second = 0, microsecond = 0), deep=False):
+        ''' A code in need of a deeper history comes back as NEEDS_HISTORY with deep 'd', the scheduler runs it again with deep '''
         currentTime = datetime.now()
 
         try:
             ''' Run single daily stock analysis. If the time is in the opening time, record file won't save '''
-            stock = Stock(code, 'd', date, modifyArchive=True if currentTime.hour < 9 or currentTime.hour >= 14 else False)
+            stock = Stock(code, 'd', date, modifyArchive=True if currentTime.hour < 9 or currentTime.hour >= 14 else False, settings=self.__settings, deep=deep)
             state = stock.result['state']
 
             if state == 'fail':
                 raise RuntimeError
 
+            if state == NEEDS_HISTORY:
+                return {'code': code, 'state': state, 'deep': 'd'}
+
             ''' Transform real state to camo-state '''
             if preStat == 'Rise' and state != 'RiseBT':
                 state = 'Rise'
@@ -52,17 +80,182 @@ class TrackStock():
 
             return {'code': code, 'state': 'Daily analysis failed'}
 
-    def weeklyCalc(self, code, date = datetime.now().replace(hour = 0, minute = 0, second = 0, microsecond = 0)):
+    def history(self, code, date):
+        ''' (weekBars, dayBars) of code up to date, from the stored resources or else downloaded '''
+        try:
+            ''' Get resources from local '''
+            weekDf = self.__resources.read(code, 'w', date)
+            dayDf = self.__resources.read(code, 'd', date)
+
+            if weekDf.empty or dayDf.empty:
+                raise ValueError('resources are not stored')
+        except:
+            ''' Get resources from network '''
+            weekDf = Stock(code, 'w', date, download_only = True, settings = self.__settings).download(all = True)
+            dayDf = Stock(code, 'd', date, download_only = True, settings = self.__settings).download(all = True)
+
+        return BarSeries.fromFrame(weekDf), BarSeries.fromFrame(dayDf)
+
+    def backfillCalc(self, code, dates, weekBars = None, dayBars = None):
+        ''' historicalCalc of every date in dates, oldest first, from one read of the history at the last date, or from weekBars/dayBars a caller holds.
+            Each date gets the result of the first run of the code on that date. A state the date before left was saved from sticks the earlier weeks of the date did not have.
+            The work carries over from date to date instead: the weekly breaks of all dates come from one forward pass over the weekly prefixes, and the daily replay of a weekly break
+            goes on from the day and the state the date before stopped with, each day a Stock over its new sticks. Only a new weekly break starts a replay over, from its own week.
+            A date inside a week still analyzes the week as it stood on the date over the whole weekly history, once per such date. The states left are the ones of the run on the last date '''
+        if weekBars is None or dayBars is None:
+            weekBars, dayBars = self.history(code, dates[-1])
+
+        weekBars, dayBars = historyAt(weekBars, dayBars, dates[-1])
+
+        ''' Weekly prefixes of the last date, the daily replay under the weekly break of the date before '''
+        prefixes = PrefixAnalyzer(code, 'w', dates[-1], weekBars, settings=self.__settings, resume=False)
+        dayIndex = DateIndex(dayBars.date.astype('datetime64[D]'), self.__calendar)
+        replay = None
+        results = []
+
+        for date in dates:
+            try:
+                result, replay = self.__backfillDate(code, date, dates[-1], weekBars, dayBars, prefixes, dayIndex, replay)
+                results.append(result)
+            except:
+                print(u'\u001b[41;1m[ERROR/Track: {}]\u001b[0m failed to backfill {}'.format(code, date.strftime('%Y-%m-%d')))
+                results.append({'code': code, 'state': 'failed calling'})
+                replay = None
+
+        return results
+
+    def __backfillDate(self, code, date, lastDate, weekBars, dayBars, prefixes, dayIndex, replay):
+        ''' historicalCalc of date from the history of the last date. Returns the result and the daily replay for the next date '''
+        day = np.datetime64(date, 'D').astype(np.int64)
+        length = int(np.searchsorted(weekBars.date, day, side='right'))
+        sticks = int(np.searchsorted(dayBars.date, day, side='right'))
+
+        if length == 0 or sticks == 0:
+            print(u'\u001b[41;1m[ERROR/Track: {}]\u001b[0m resources are incomplete, stop analyzing the stock'.format(code))
+
+            return {'code': code, 'state': 'Missing the source'}, replay
+
+        end = length + (-1 if self.__calendar.isTradingDay(date + timedelta(days = 1)) else 0)
+
+        try:
+            weekly = None
+
+            ''' The stick of the week of date as it stood on date. A prefix ending in it differs from the one of the later dates unless the week closed the same '''
+            if end == length:
+                week, _ = historyAt(weekBars, dayBars, date)
+
+                if any(getattr(week, name)[-1] != getattr(weekBars, name)[length - 1] for name in COLUMNS):
+                    weekly = Stock(code, 'w', date, source = week, modifyArchive = False, settings = self.__settings, cache = False, deep = True, resume = False).result
+                    end = length - 1
+
+                    if weekly['state'] == 'fail':
+                        raise RuntimeError
+
+            if weekly is None or not self.__breaks(weekly['state']):
+                _, weekly = prefixes.latestBreak(end)
+
+            ''' Without any prefix in a break the walk ends on the empty one, for which Stock downloads the whole history up to date '''
+            if weekly is None:
+                weekly = Stock(code, 'w', date, modifyArchive = False, settings = self.__settings, cache = False, deep = True, resume = False).result
+
+                if weekly['state'] == 'fail':
+                    raise RuntimeError
+
+                weekly = weekly if self.__breaks(weekly['state']) else None
+
+            ''' Make weekly save record of the last date '''
+            if date == lastDate:
+                Stock(code, 'w', date, source = weekBars, settings = self.__settings, deep = True, resume = False)
+        except:
+            print(u'\u001b[41;1m[ERROR/Track: {}]\u001b[0m failed to process weekly analysis'.format(code))
+
+            return {'code': code, 'state': 'Weekly analysis failed'}, replay
+
+        if weekly is None:
+            print(u'\u001b[41;1m[ERROR/Track: {}]\u001b[0m missing intermediateDate'.format(code))
+
+            return {'code': code, 'state': 'missing intermediate data'}, replay
+
+        intermediateDate = self.__calendar.lastTradingDayOfWeek(parse(weekly['last_date']))
+
+        ''' The replay of the same weekly break goes on, the days before date were replayed for an earlier date already '''
+        if replay is None or replay['break'] != (intermediateDate, weekly['state']):
+            replay = {'break': (intermediateDate, weekly['state']), 'days': dayIndex.tradingDays(intermediateDate, lastDate), 'next': 0, 'state': None, 'last': None, 'ended': None}
+
+        return self.__replayDate(code, date, weekly, intermediateDate, dayBars, dayIndex, replay), replay
+
+    def __breaks(self, state):
+        return state == 'RiseBT' or state == 'DropFT'
+
+    def __replayDate(self, code, date, weekly, intermediateDate, dayBars, dayIndex, replay):
+        ''' Daily part of historicalCalc of date. Only the days up to date the replay has not reached for an earlier date are analyzed '''
+        while replay['ended'] is None and replay['next'] < len(replay['days']) and replay['days'][replay['next']][0] <= date:
+            day, end = replay['days'][replay['next']]
+            replay['next'] += 1
+
+            try:
+                stock, state = self.__dayStep(code, date, dayBars, dayIndex, day, end, replay['state'])
+            except:
+                replay['ended'] = (day, 'fail')
+                break
+
+            if stock.written is not None:
+                replay['state'] = stock.written
+
+            replay['last'] = (day, stock, state)
+
+            ''' A daily break in the direction of the weekly one cancels every later date '''
+            if state == weekly['state']:
+                replay['ended'] = (day, 'break')
+
+        if replay['ended'] is not None and replay['ended'][0] <= date:
+            if replay['ended'][1] == 'fail':
+                print(u'\u001b[41;1m[ERROR/Track: {}]\u001b[0m failed to process daily analysis'.format(code))
+
+                return {'code': code, 'state': 'Daily analysis failed'}
+            elif replay['ended'][0] < date:
+                return {'code': code, 'state': 'cancel'}
+
+        if replay['last'] is not None and replay['last'][0] == date:
+            return self.__dayResult(code, date, weekly, intermediateDate, *replay['last'][1:])
+
+        return None
+
+    def __dayResult(self, code, date, weekly, intermediateDate, stock, state):
+        ''' Result of the daily Stock of date under the result of the weekly break. Transform real state to camo-state '''
+        if weekly['state'] == 'RiseBT' and state != 'RiseBT':
+            state = 'Rise'
+        elif weekly['state'] == 'DropFT' and state != 'DropFT':
+            state = 'Drop'
+
+        if intermediateDate == date:
+            if state == 'RiseBT':
+                state = 'SynBT'
+            elif state == 'DropFT':
+                state = 'SynFT'
+
+        return {'code': code, 'state': state, 'gain_rate': stock.result['gain_rate']}
+
+    def weeklyCalc(self, code, date = datetime.now().replace(hour = 0, minute = 0, second = 0, microsecond = 0), deep=''):
+        ''' A code in need of a deeper history comes back as NEEDS_HISTORY, deep naming the resolutions to analyze over their whole history when the scheduler runs it again.
+            With deep 'd' alone the weekly break was found by the run before, only the daily analysis is repeated '''
         currentTime = datetime.now()
 
         try:
-            stock = Stock(code, 'w', date, modifyArchive=True if currentTime.hour < 9 or currentTime.hour >= 14 else False)
+            if deep != 'd':
+                stock = Stock(code, 'w', date, modifyArchive=True if currentTime.hour < 9 or currentTime.hour >= 14 else False, settings=self.__settings, deep='w' in deep)
+
+                if stock.result['state'] == NEEDS_HISTORY:
+                    return {'code': code, 'state': NEEDS_HISTORY, 'deep': 'wd'}
 
-            if stock.result['state'] == 'RiseBT' or stock.result['state'] == 'DropFT':
+            if deep == 'd' or stock.result['state'] == 'RiseBT' or stock.result['state'] == 'DropFT':
                 try:
-                    stock = Stock(code, 'd', date)
+                    stock = Stock(code, 'd', date, settings=self.__settings, deep='d' in deep)
                     state = stock.result['state']
 
+                    if state == NEEDS_HISTORY:
+                        return {'code': code, 'state': state, 'deep': 'd'}
+
                     if state == 'RiseBT':
                         state = 'SynBT'
                     elif state == 'DropFT':
@@ -78,21 +271,67 @@ class TrackStock():
 
             return {'code': code, 'state': 'Weekly analysis failed'}
 
-    def historicalCalc(self, code, date = datetime.now().replace(hour = 0, minute = 0, second = 0, microsecond = 0)):
-        ''' Define the local resources dir path '''
-        resourcesDir = self.__resourcesDir + date.strftime('%Y-%-m-%d') + '/'
-        
-        try:
-            ''' Get resources from local '''
-            weekDf = pd.read_csv(resourcesDir + str(code) + '_w.csv', index_col=0)
-            dayDf = pd.read_csv(resourcesDir + str(code) + '_d.csv', index_col=0)
-        except:
-            ''' Get resources from network '''
-            weekDf = Stock(code, 'w', date, download_only = True).download(all = True)
-            dayDf = Stock(code, 'd', date, download_only = True).download(all = True)
+    def historicalCalc(self, code, date = datetime.now().replace(hour = 0, minute = 0, second = 0, microsecond = 0), weekBars = None, dayBars = None, resume = True):
+        ''' Callers that already hold the history of the code up to date can pass it as weekBars/dayBars. resume=False analyzes as the first run of the code would, whatever states are stored.
+            With a cache a rerun on the same history from the same states only restores the result and the states it left '''
+        if weekBars is None or dayBars is None:
+            weekBars, dayBars = self.history(code, date)
+
+        cache = self.__settings.cache
+
+        if cache is None or len(weekBars) == 0 or len(dayBars) == 0:
+            return self.__historicalCalc(code, date, weekBars, dayBars, resume)
+
+        key = cache.key('historicalCalc', code, date, weekBars, dayBars, *[loadState(self.__settings, code, mode) if resume else None for mode in ['w', 'd']], ALGORITHM_VERSION)
+        cached = cache.get(key)
+
+        if cached is not None:
+            result, states = cached
+
+            for mode, saved in states.items():
+                if saved is not None:
+                    writeState(saved, self.__settings.statePath(code, mode))
 
+            return result
+
+        result = self.__historicalCalc(code, date, weekBars, dayBars, resume)
+
+        ''' Failures are left out, a rerun tries them again. So is None, of a code without a stick on the date.
+            A rerun starts from the states this run left, so the entry goes under the key of those states too '''
+        if result is not None and result['state'] not in FAILED_STATES:
+            states = {mode: readState(self.__settings.statePath(code, mode)) for mode in ['w', 'd']}
+            cache.put(key, result, states)
+
+            if resume:
+                cache.put(cache.key('historicalCalc', code, date, weekBars, dayBars, *[loadState(self.__settings, code, mode) for mode in ['w', 'd']], ALGORITHM_VERSION), result, states)
+
+        return result
+
+    def __dayStep(self, code, date, dayBars, dayIndex, day, end, dayState):
+        ''' Daily Stock of the sticks before position end, the last of them on day, and its state. It resumes from dayState when the state fits the sticks, else it starts from the first stick.
+            The replay is cached as a whole by historicalCalc, its days are not. RuntimeError when the analysis failed '''
+        dayState = fittingState(dayState, day, code)
+
+        ''' Begin at the latest trading day with sticks up to the date of the state '''
+        start = dayIndex.latest(parse(dayState.lastDate)) if dayState is not None and dayState.lastDate else None
+        start = start if start is not None else 0
+
+        stock = Stock(code, 'd', date, source = dayBars.slice(start, end), state = dayState, settings = self.__settings, cache = False, deep = start == 0, resume = dayState is not None)
+        state = stock.result['state']
+
+        ''' The sticks from the state on miss the turn to compare with. The whole history is at hand, analyze it from the same state '''
+        if state == NEEDS_HISTORY:
+            stock = Stock(code, 'd', date, source = dayBars.slice(0, end), state = dayState, settings = self.__settings, cache = False, deep = True, resume = dayState is not None)
+            state = stock.result['state']
+
+        if state == 'fail':
+            raise RuntimeError
+
+        return stock, state
+
+    def __historicalCalc(self, code, date, weekBars, dayBars, resume):
         ''' Make sure the resources are all prepared. None of the resouces are empty '''
-        if weekDf.empty or dayDf.empty:
+        if len(weekBars) == 0 or len(dayBars) == 0:
             print(u'\u001b[41;1m[ERROR/Track: {}]\u001b[0m resources are incomplete, stop analyzing the stock'.format(code))
 
             return {'code': code, 'state': 'Missing the source'}
@@ -101,19 +340,14 @@ class TrackStock():
         
         try:
             ''' Loop each week from the finishing date to the beginning. It stops when break appears '''
-            for w in range(len(weekDf) + (-1 if not isHoliday(date + timedelta(days = 1)) else 0), -1, -1):
-                stock = weeklyStockIns = Stock(code, 'w', date, source = weekDf.iloc[:w].reset_index(drop=True), modifyArchive=False)
-
-                if stock.result['state'] == 'fail':
-                    raise RuntimeError
-
-                if stock.result['state'] == 'RiseBT' or stock.result['state'] == 'DropFT':
-                    intermediateDate = stock.result['last_date']
+            w, weekly = PrefixAnalyzer(code, 'w', date, weekBars, settings=self.__settings, resume=resume).lastBreak(len(weekBars) + (-1 if self.__calendar.isTradingDay(date + timedelta(days = 1)) else 0))
 
-                    break
+            if weekly != None:
+                intermediateDate = weekly['last_date']
 
-            ''' Make weekly save record '''
-            Stock(code, 'w', date, source = weekDf)
+            ''' Make weekly save record, from the stored state unless it was saved from sticks past the history '''
+            weekState = fittingState(loadState(self.__settings, code, 'w'), int(weekBars.date[-1]), code) if resume else None
+            Stock(code, 'w', date, source = weekBars, state = weekState, settings = self.__settings, deep = True, resume = weekState is not None)
         except:
             print(u'\u001b[41;1m[ERROR/Track: {}]\u001b[0m failed to process weekly analysis'.format(code))
 
@@ -125,55 +359,28 @@ class TrackStock():
                 intermediateDate = parse(intermediateDate) if type(intermediateDate) != datetime else intermediateDate
                 print(intermediateDate)
                 ''' Find the end of day that has opened stock market in that week '''
-                while not isHoliday(intermediateDate + timedelta(days = 1)):
-                    intermediateDate += timedelta(days = 1)
-
-                ''' Loop each day from the week its break to the finishing date '''
-                for d in range((date - intermediateDate).days, -1, -1):
-                    daySourceEndIndex = (date - timedelta(days = d))
-            
-                    ''' Check is the processing date in the resource '''
-                    if isHoliday(daySourceEndIndex) or not dayDf['date'].isin([daySourceEndIndex.strftime('%Y-%m-%d')]).any():
-                        continue
-
-                    ''' Find the corresponding index to current processing date '''
-                    daySourceEndIndex = dayDf.loc[dayDf['date'] == daySourceEndIndex.strftime('%Y-%m-%d')].index[0] + 1
-                    
-                    ''' Find the beginning index of range of the mandatory resource '''
-                    if os.path.exists(self.__savesDir + 'save_' + str(code) + '_d.csv'):
-                        tempResourceStartDate = parse(pd.read_csv(self.__savesDir + 'save_' + str(code) + '_d.csv', index_col=0)['date'].iloc[-1])
-                        
-                        while isHoliday(tempResourceStartDate) or not dayDf['date'].isin([tempResourceStartDate.strftime('%Y-%m-%d')]).any():
-                            tempResourceStartDate -= timedelta(days = 1)
-                            
-                        daySourceStartIndex = dayDf.loc[dayDf['date'] == tempResourceStartDate.strftime('%Y-%m-%d')].index[0]
-                    else:
-                        daySourceStartIndex = 0
-                    
+                intermediateDate = self.__calendar.lastTradingDayOfWeek(intermediateDate)
+
+                ''' Positions of the daily sticks by date, and the daily state kept in memory. Each Stock below hands over the state it wrote, the file is read once '''
+                dayIndex = DateIndex(dayBars.date.astype('datetime64[D]'), self.__calendar)
+                dayState = loadState(self.__settings, code, 'd') if resume else None
+
+                ''' Loop each trading day with sticks from the week its break to the finishing date '''
+                for day, daySourceEndIndex in dayIndex.tradingDays(intermediateDate, date):
+                    d = (date - day).days
+
                     try:
-                        stock = Stock(code, 'd', date, source = dayDf.iloc[daySourceStartIndex:daySourceEndIndex].reset_index(drop=True))
-                        state = stock.result['state']
+                        stock, state = self.__dayStep(code, date, dayBars, dayIndex, day, daySourceEndIndex, dayState)
 
-                        if state == 'fail':
-                            raise RuntimeError
+                        if stock.written is not None:
+                            dayState = stock.written
 
                         ''' Work on the business logic. If it breaks early, it doesn't follow the core '''
-                        if d != 0 and ((weeklyStockIns.result['state'] == 'RiseBT' and state == 'RiseBT') or (weeklyStockIns.result['state'] == 'DropFT' and state == 'DropFT')):
+                        if d != 0 and ((weekly['state'] == 'RiseBT' and state == 'RiseBT') or (weekly['state'] == 'DropFT' and state == 'DropFT')):
                             
                             return {'code': code, 'state': 'cancel'}
                         elif d == 0:
-                            if weeklyStockIns.result['state'] == 'RiseBT' and state != 'RiseBT':
-                                state = 'Rise'
-                            elif weeklyStockIns.result['state'] == 'DropFT' and state != 'DropFT':
-                                state = 'Drop'
-
-                            if intermediateDate == date:
-                                if state == 'RiseBT':
-                                    state = 'SynBT'
-                                elif state == 'DropFT':
-                                    state = 'SynFT'
-                                    
-                            return {'code': code, 'state': state, 'gain_rate': stock.result['gain_rate']}
+                            return self.__dayResult(code, date, weekly, intermediateDate, stock, state)
                     except:
                         print(u'\u001b[41;1m[ERROR/Track: {}]\u001b[0m failed to process daily analysis'.format(code))
 
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+from datetime import datetime, date as Date
+
+import pandas as pd
+import numpy as np
+import os
+
+EPOCH = Date(1970, 1, 1).toordinal()
+
+
+def toOrdinals(dates):
+    ''' Proleptic ordinals of an array of dates, strings or datetimes '''
+    return pd.to_datetime(np.asarray(dates)).values.astype('datetime64[D]').astype(np.int64) + EPOCH
+
+
+def weekdaysUntil(ordinal):
+    ''' Count of Monday to Friday days in [1, ordinal]. Ordinal 1 is a Monday '''
+    return ordinal // 7 * 5 + np.minimum(ordinal % 7, 5)
+
+
+class TradingCalendar():
+    ''' Trading days held as a day-indexed bitmap over the range of holidays.csv. Outside that range only weekends are closed. Use TradingCalendar.load so a process parses the file once '''
+    __instances = {}
+
+    def __init__(self, holidayFilePath=os.path.join(os.path.dirname(__file__), '../config/holidays.csv')):
+        df = pd.read_csv(holidayFilePath)
+        days = pd.to_datetime(df['date'], format='%Y/%m/%d')
+        ordinals = toOrdinals(days)
+
+        ''' A listed date is closed on weekends or when marked 是, the same rule isHoliday always applied '''
+        closed = (days.dt.weekday.values >= 5) | (df['isHoliday'].astype(str).str.strip().values == '是')
+
+        self.__first = int(ordinals.min())
+        self.__last = int(ordinals.max())
+        self.__open = np.ones(self.__last - self.__first + 1, dtype=bool)
+        self.__open[ordinals[closed] - self.__first] = False
+
+        ''' count[i] is the number of trading days in [first, first + i]. days lists them in order '''
+        self.__count = np.cumsum(self.__open)
+        self.__days = np.flatnonzero(self.__open) + self.__first
+
+    @classmethod
+    def load(cls, holidayFilePath=os.path.join(os.path.dirname(__file__), '../config/holidays.csv')):
+        ''' Process-wide instance per file. Workers forked after the first load inherit it '''
+        holidayFilePath = os.path.abspath(holidayFilePath)
+
+        if holidayFilePath not in cls.__instances:
+            cls.__instances[holidayFilePath] = cls(holidayFilePath)
+
+        return cls.__instances[holidayFilePath]
+
+    def __isOpen(self, ordinal):
+        if self.__first <= ordinal <= self.__last:
+            return bool(self.__open[ordinal - self.__first])
+
+        return (ordinal - 1) % 7 < 5
+
+    def __walk(self, ordinal, direction):
+        ''' Step to the nearest trading day. Only needed outside the bitmap, where it takes at most two steps '''
+        while not self.__isOpen(ordinal):
+            ordinal += direction
+
+        return ordinal
+
+    def __cumulative(self, ordinals):
+        ''' Trading days up to each ordinal, counted from the first day of the bitmap '''
+        ordinals = np.asarray(ordinals, dtype=np.int64)
+        inside = np.clip(ordinals, self.__first, self.__last) - self.__first
+
+        return np.where(ordinals < self.__first, weekdaysUntil(ordinals) - weekdaysUntil(self.__first - 1),
+            np.where(ordinals > self.__last, self.__count[-1] + weekdaysUntil(ordinals) - weekdaysUntil(self.__last), self.__count[inside]))
+
+    def isTradingDay(self, date):
+        return self.__isOpen(date.toordinal())
+
+    def nextTradingDay(self, date):
+        ''' First trading day after date '''
+        ordinal = date.toordinal() + 1
+
+        if self.__first <= ordinal <= self.__last:
+            k = self.__count[ordinal - self.__first] - self.__open[ordinal - self.__first]
+            ordinal = self.__days[k] if k < len(self.__days) else self.__walk(self.__last + 1, 1)
+        else:
+            ordinal = self.__walk(ordinal, 1)
+
+        return datetime.fromordinal(int(ordinal))
+
+    def prevTradingDay(self, date):
+        ''' Last trading day before date '''
+        ordinal = date.toordinal() - 1
+
+        if self.__first <= ordinal <= self.__last:
+            k = self.__count[ordinal - self.__first]
+            ordinal = self.__days[k - 1] if k > 0 else self.__walk(self.__first - 1, -1)
+        else:
+            ordinal = self.__walk(ordinal, -1)
+
+        return datetime.fromordinal(int(ordinal))
+
+    def lastTradingDayOfWeek(self, date):
+        ''' Last trading day on or before the Sunday closing the week of date '''
+        sunday = date.toordinal() + 6 - date.weekday()
+
+        return self.prevTradingDay(datetime.fromordinal(sunday + 1))
+
+    def tradingDaysBetween(self, start, end):
+        ''' Number of trading days in [start, end]. Takes single dates or arrays of them '''
+        scalar = isinstance(start, Date) and isinstance(end, Date)
+        start = np.array([start.toordinal()]) if isinstance(start, Date) else toOrdinals(start)
+        end = np.array([end.toordinal()]) if isinstance(end, Date) else toOrdinals(end)
+        count = np.maximum(self.__cumulative(end) - self.__cumulative(start - 1), 0)
+
+        return int(count[0]) if scalar else count
+
+    def tradingDays(self, start, end):
+        ''' Trading days in [start, end] as datetimes in ascending order '''
+        ordinals = np.arange(start.toordinal(), end.toordinal() + 1)
+        inside = (ordinals >= self.__first) & (ordinals <= self.__last)
+        isOpen = np.where(inside, self.__open[np.clip(ordinals, self.__first, self.__last) - self.__first], (ordinals - 1) % 7 < 5)
+
+        return [datetime.fromordinal(int(o)) for o in ordinals[isOpen]]
+
+
+class DateIndex():
+    ''' Positions of the sticks of a date-ordered frame by date, looked up by binary search over their ordinals instead of scanning the date column '''
+    def __init__(self, dates, calendar):
+        self.ordinals = toOrdinals(dates) if len(dates) else np.zeros(0, dtype=np.int64)
+
+        ''' Distinct dates of the sticks that fall on trading days '''
+        days = np.unique(self.ordinals)
+        asDates = (days - EPOCH).astype('datetime64[D]')
+        self.__days = days[calendar.tradingDaysBetween(asDates, asDates) == 1] if len(days) else days
+
+    def find(self, ordinal):
+        ''' Position of the first stick on the day ordinal, None without one '''
+        i = int(np.searchsorted(self.ordinals, ordinal))
+
+        return i if i < len(self.ordinals) and self.ordinals[i] == ordinal else None
+
+    def latest(self, date):
+        ''' Position of the first stick of the latest trading day up to date holding sticks, None without one '''
+        k = int(np.searchsorted(self.__days, date.toordinal(), side='right'))
+
+        return self.find(self.__days[k - 1]) if k > 0 else None
+
+    def tradingDays(self, start, end):
+        ''' (day, position after its first stick) of every trading day in [start, end] holding sticks, in date order '''
+        days = self.__days[(self.__days >= start.toordinal()) & (self.__days <= end.toordinal())]
+
+        return [(datetime.fromordinal(int(o)), self.find(o) + 1) for o in days]
@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+from .bars import BarSeries
+
+import pandas as pd
+import numpy as np
+
+
+class Universe():
+    ''' Sticks of many codes in one ragged BarSeries. Code i owns the sticks offsets[i] to offsets[i + 1] '''
+    __slots__ = ['codes', 'offsets', 'bars']
+
+    def __init__(self, codes, offsets, bars):
+        self.codes = codes
+        self.offsets = offsets
+        self.bars = bars
+
+    @classmethod
+    def load(cls, codes, resolution, date, resources):
+        ''' One read for every code. A code without stored sticks gets an empty slice '''
+        codes = np.asarray([int(code) for code in codes], dtype=np.int64)
+        df = resources.readMany(codes, resolution, date)
+
+        ''' Group the sticks in the order of codes, each code keeps its date order '''
+        order = np.argsort(pd.Index(codes).get_indexer(df['code'].values), kind='stable')
+        df = df.iloc[order].reset_index(drop=True)
+        counts = pd.Series(df['code'].values).value_counts().reindex(codes, fill_value=0).values
+
+        return cls(codes, np.r_[0, np.cumsum(counts)], BarSeries.fromFrame(df))
+
+    def __getitem__(self, i):
+        return self.bars.slice(self.offsets[i], self.offsets[i + 1])
+
+    def __len__(self):
+        return len(self.codes)
+
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from datetime import datetime, timedelta
+
+import numpy as np
+import json
+import sys
+
+''' Local stand-in for udf.asmx/history. Point [Client] url at http://127.0.0.1:<port>/Stock/tv/udf.asmx/history to run without the network '''
+
+def history(symbol, resolution, to, since=None, start=datetime(2010, 1, 4), end=datetime(2030, 1, 1)):
+    ''' Deterministic random walk per symbol in the udf layout: t, c, o, h, l, v then status.
+        The walk is drawn up to end and cut at to, so a later request repeats the bars of an earlier one '''
+    rng = np.random.RandomState(int(symbol) if str(symbol).isdigit() else abs(hash(symbol)) % 2 ** 31)
+    days = [d for d in (start + timedelta(days=i) for i in range((end - start).days + 1)) if d.weekday() < 5]
+
+    close = np.round(np.maximum(50 * np.exp(np.cumsum(rng.normal(0, 0.02, len(days)))), 1), 2)
+    openP = np.round(np.r_[close[0], close[:-1]] * (1 + rng.normal(0, 0.005, len(days))), 2)
+    high = np.round(np.maximum(close, openP) * (1 + np.abs(rng.normal(0, 0.01, len(days)))), 2)
+    low = np.round(np.minimum(close, openP) * (1 - np.abs(rng.normal(0, 0.01, len(days)))), 2)
+    volume = rng.randint(100, 20000, len(days))
+
+    ''' Sessions up to to '''
+    n = sum(1 for d in days if d <= datetime.fromtimestamp(to))
+    days, close, openP, high, low, volume = days[:n], close[:n], openP[:n], high[:n], low[:n], volume[:n]
+
+    if not days:
+        return {'s': 'no_data', 'nextTime': None}
+
+    if resolution == 'w':
+        weeks = {}
+
+        for i, d in enumerate(days):
+            weeks.setdefault(d - timedelta(days=d.weekday()), []).append(i)
+
+        days = list(weeks.keys())
+        close, openP, high, low, volume = \
+            np.array([close[w[-1]] for w in weeks.values()]), \
+            np.array([openP[w[0]] for w in weeks.values()]), \
+            np.array([high[w].max() for w in weeks.values()]), \
+            np.array([low[w].min() for w in weeks.values()]), \
+            np.array([volume[w].sum() for w in weeks.values()])
+
+    ''' Stock.download shifts the timestamp back by 10.5 hours before taking the date '''
+    stamps = np.array([int(d.timestamp()) + 37800 for d in days])
+    keep = stamps >= float(since) if since is not None else np.ones(len(days), dtype=bool)
+
+    if not keep.any():
+        return {'s': 'no_data', 'nextTime': None}
+
+    return {
+        't': stamps[keep].tolist(),
+        'c': close[keep].tolist(),
+        'o': openP[keep].tolist(),
+        'h': high[keep].tolist(),
+        'l': low[keep].tolist(),
+        'v': volume[keep].tolist(),
+        's': 'ok',
+        'nextTime': None
+    }
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+
+        if not url.path.endswith('/history'):
+            self.send_error(404)
+            return
+
+        body = json.dumps(history(query['symbol'], query['resolution'], int(query['to']), query.get('from'))).encode('utf-8')
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+if __name__ == '__main__':
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8000
+    print(u"[\u001b[1mINFO/Stub\u001b[0m] serving udf history on http://127.0.0.1:" + str(port) + "/Stock/tv/udf.asmx/history")
+
+    ThreadingHTTPServer(('127.0.0.1', port), Handler).serve_forever()
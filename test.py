@@ -7,14 +7,13 @@ import time
 import os
 import glob
 import smtplib
-import configparser
 
 from src.stock import Stock
 from src.track import TrackStock
+from src.settings import Settings
 
 ''' Decode Config '''
-config = configparser.ConfigParser()
-config.read('./config/config.ini')
+settings = Settings.load('./config/config.ini')
 
 try:
     terminalCols, terminalRows = os.get_terminal_size(0)
@@ -31,13 +30,15 @@ if __name__ == '__main__':
 
     code = input("Search: ")
     
-    print(u"[\u001b[32:1mDONE\u001b[0m] Result: " + str(TrackStock().historicalCalc(code, date)))
+    print(u"[\u001b[32:1mDONE\u001b[0m] Result: " + str(TrackStock(settings=settings).historicalCalc(code, date)))
 
-    if os.path.exists(config['Dir']['Archive'] + 'save_' + str(code) + '_w.csv'):
-        os.remove(config['Dir']['Archive'] + 'save_' + str(code) + '_w.csv')
+    if settings.cache is not None:
+        print(u"[\u001b[1mINFO\u001b[0m] Cache: " + str(settings.cache.stats()))
 
-    if os.path.exists(config['Dir']['Archive'] + 'save_' + str(code) + '_d.csv'):
-        os.remove(config['Dir']['Archive'] + 'save_' + str(code) + '_d.csv')
+    for mode in ['w', 'd']:
+        for path in [settings.statePath(code, mode), settings.archivePath(code, mode)]:
+            if os.path.exists(path):
+                os.remove(path)
 
 #Ending Area
 te = time.time()
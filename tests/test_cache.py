@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+from datetime import datetime
+from src.cache import AnalysisCache
+from src.state import StockState
+from tests.test_state import bars
+
+import os
+
+
+def test_key_depends_on_every_part():
+    sticks = bars(['2019-01-02', '2019-01-07'])
+    key = AnalysisCache.key('Stock', 1, 'w', datetime(2019, 1, 7), sticks, None, 'numpy', True)
+
+    assert key == AnalysisCache.key('Stock', 1, 'w', datetime(2019, 1, 7), bars(['2019-01-02', '2019-01-07']), None, 'numpy', True)
+    assert key != AnalysisCache.key('Stock', 1, 'd', datetime(2019, 1, 7), sticks, None, 'numpy', True)
+    assert key != AnalysisCache.key('Stock', 1, 'w', datetime(2019, 1, 8), sticks, None, 'numpy', True)
+    assert key != AnalysisCache.key('Stock', 1, 'w', datetime(2019, 1, 7), sticks, None, 'reference', True)
+    assert key != AnalysisCache.key('Stock', 1, 'w', datetime(2019, 1, 7), sticks, None, 'numpy', False)
+    assert key != AnalysisCache.key('Stock', 1, 'w', datetime(2019, 1, 7), sticks, StockState('', 0, 0, 0, bars([])), 'numpy', True)
+
+
+def test_key_counts_sticks_by_their_values():
+    sticks = bars(['2019-01-02', '2019-01-07'])
+    key = AnalysisCache.key(sticks)
+    sticks.close[-1] += 0.5
+
+    assert AnalysisCache.key(sticks) != key
+
+
+def test_key_tells_none_from_its_text():
+    assert AnalysisCache.key(None) != AnalysisCache.key('None')
+    assert AnalysisCache.key('a', 'b') != AnalysisCache.key('ab')
+
+
+def test_entries_round_trip_through_the_disk(tmp_path):
+    cache = AnalysisCache(str(tmp_path / 'cache'))
+    cache.put('k', {'state': 'Rise'}, {'w': b'raw'})
+
+    assert AnalysisCache(str(tmp_path / 'cache')).get('k') == ({'state': 'Rise'}, {'w': b'raw'})
+    assert cache.get('other') is None
+    assert (cache.hits, cache.misses) == (0, 1)
+
+
+def test_memory_drops_the_least_recently_used(tmp_path):
+    cache = AnalysisCache(str(tmp_path), entries=2)
+    cache.put('a', {'state': 'a'}, {})
+    cache.put('b', {'state': 'b'}, {})
+    cache.get('a')
+    cache.put('c', {'state': 'c'}, {})
+
+    assert cache.stats()['memory'] == 2
+    assert cache.evictions == 1
+
+    ''' b left the memory, it is read from the disk and pushes a out instead of c '''
+    os.remove(str(tmp_path / 'a.pkl'))
+
+    assert cache.get('b') == ({'state': 'b'}, {})
+    assert cache.get('c') == ({'state': 'c'}, {})
+    assert cache.get('a') is None
+
+
+def test_disk_drops_the_least_recently_used(tmp_path):
+    cache = AnalysisCache(str(tmp_path), entries=1, diskEntries=2)
+
+    for i, key in enumerate(['a', 'b', 'c']):
+        cache.put(key, {'state': key}, {})
+        os.utime(str(tmp_path / (key + '.pkl')), (1000 + i, 1000 + i))
+
+    cache.prune()
+
+    assert sorted(os.listdir(str(tmp_path))) == ['b.pkl', 'c.pkl']
+
+
+def test_results_handed_out_are_copies(tmp_path):
+    cache = AnalysisCache(str(tmp_path))
+    cache.put('k', {'state': 'Rise'}, {})
+    cache.get('k')[0]['state'] = 'Drop'
+
+    assert cache.get('k')[0] == {'state': 'Rise'}
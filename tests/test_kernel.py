@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+from datetime import datetime
+from src import kernel
+from src.stock import Stock
+from tests.test_prefix import settings, series
+
+import numpy as np
+import pytest
+
+compiled = pytest.mark.skipif(kernel._kernel is None, reason='setup.py did not build the compiled kernel')
+
+CASES = [(0, 1.0), (1, 2.0), (2, 0.01), (3, 5.0)]
+
+
+def reference(path, bars):
+    ''' Turns and circles of the original stick-by-stick walks of Stock '''
+    stock = Stock(1, 'w', datetime(2019, 2, 27), source=bars.toFrame(flags=False), download_only=True, engine='reference', settings=settings(path), cache=False)
+    stock.trend()
+    df = stock.circle()
+
+    return df['turn'].values.astype(np.int8), df['kT'].values.astype(np.int8), df['dT'].values.astype(np.int8)
+
+
+@pytest.mark.parametrize('seed, step', CASES)
+def test_numpy_engine_agrees_with_the_reference(tmp_path, seed, step):
+    bars = series(seed, 200, step)
+    turns, kT, dT = reference(tmp_path, bars)
+    numpy = kernel.findTurnsNumpy(bars.high, bars.low)
+
+    assert np.array_equal(numpy, turns)
+    assert all(np.array_equal(a, b) for a, b in zip(kernel.markCirclesNumpy(bars.high, bars.low, bars.close, numpy), (kT, dT)))
+
+
+@compiled
+@pytest.mark.parametrize('seed, step', CASES)
+def test_compiled_kernel_agrees_with_numpy(seed, step):
+    bars = series(seed, 500, step)
+    turns = kernel.findTurnsNumpy(bars.high, bars.low)
+
+    assert np.array_equal(kernel.findTurns(bars.high, bars.low), turns)
+    assert all(np.array_equal(a, b) for a, b in zip(kernel.markCircles(bars.high, bars.low, bars.close, turns), kernel.markCirclesNumpy(bars.high, bars.low, bars.close, turns)))
+
+
+@compiled
+@pytest.mark.parametrize('initTurn', [1, -1])
+def test_compiled_kernel_agrees_with_numpy_from_a_seeded_turn(initTurn):
+    bars = series(4, 300)
+
+    assert np.array_equal(kernel.findTurns(bars.high, bars.low, initTurn), kernel.findTurnsNumpy(bars.high, bars.low, initTurn))
+
+
+def test_prefix_turns_are_the_turns_of_the_prefix():
+    bars = series(5, 120, 2.0)
+    prefixes = kernel.PrefixTurns(bars.high, bars.low)
+
+    for w in range(1, len(bars) + 1):
+        assert np.array_equal(prefixes.turns(w), kernel.findTurnsNumpy(bars.high[:w], bars.low[:w])), w
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+from src.ledger import JobLedger
+
+import multiprocessing as mp
+
+
+def run(path, codes, failing=(), crashAfter=None, attempts=3):
+    ''' A run as history.py --resume makes it: analyze the pending codes, record each as it finishes, stop after crashAfter of them '''
+    ledger = JobLedger(path)
+
+    for i, code in enumerate(ledger.pending(codes, attempts)):
+        if crashAfter is not None and i == crashAfter:
+            return
+
+        ledger.fetched(code, 10 * code)
+        ledger.analyzed(code, None if code in failing else ['packed', code], code in failing)
+
+
+def test_resumed_run_skips_the_finished_codes(tmp_path):
+    path = str(tmp_path / 'ledger.db')
+    run(path, [1, 2, 3, 4], crashAfter=2)
+
+    assert JobLedger(path).pending([1, 2, 3, 4]) == [3, 4]
+
+    run(path, [1, 2, 3, 4])
+    done = JobLedger(path).load()
+
+    assert JobLedger(path).pending([1, 2, 3, 4]) == []
+    assert done['3'] == (30, ['packed', 3], False, 1)
+    assert done['1'][3] == 1
+
+
+def test_failed_codes_run_again_until_out_of_attempts(tmp_path):
+    path = str(tmp_path / 'ledger.db')
+
+    for attempt in range(1, 4):
+        run(path, [1, 2], failing=[2], attempts=2)
+
+        assert JobLedger(path).load()['2'][3] == min(attempt, 2)
+
+    assert JobLedger(path).pending([1, 2], attempts=2) == []
+    assert JobLedger(path).pending([1, 2], attempts=3) == [2]
+
+
+def test_fetched_alone_is_still_pending(tmp_path):
+    ledger = JobLedger(str(tmp_path / 'ledger.db'))
+    ledger.fetched(5, 120.0)
+
+    assert ledger.pending([5]) == [5]
+    assert ledger.load()['5'] == (120.0, None, False, 0)
+
+
+def test_fresh_run_clears_the_ledger(tmp_path):
+    path = str(tmp_path / 'ledger.db')
+    run(path, [1, 2])
+    JobLedger(path).clear()
+
+    assert JobLedger(path).pending([1, 2]) == [1, 2]
+
+
+def record(ledger, code):
+    ledger.analyzed(code, ['packed', code])
+
+
+def test_ledger_opened_before_a_fork_writes_from_the_child(tmp_path):
+    path = str(tmp_path / 'ledger.db')
+    ledger = JobLedger(path)
+    ledger.fetched(1, 10)
+
+    process = mp.get_context('fork').Process(target=record, args=(ledger, 2))
+    process.start()
+    process.join()
+
+    ledger.analyzed(1, ['packed', 1])
+
+    assert ledger.pending([1, 2, 3]) == [3]
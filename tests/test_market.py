@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+from datetime import datetime
+from src.market import MarketStore
+
+import pandas as pd
+
+
+def frame(rows):
+    return pd.DataFrame(rows, columns=['date', 'close', 'open', 'high', 'low', 'amount'])
+
+
+def store(path):
+    ''' Two weeks of code 1, the weekly bar of the second one written on its Wednesday '''
+    market = MarketStore(str(path))
+    market.write(1, 'd', None, frame([
+        ['2019-02-11', 10.0, 9.0, 11.0, 8.0, 100],
+        ['2019-02-18', 12.0, 10.0, 13.0, 9.5, 200],
+        ['2019-02-19', 11.0, 12.0, 12.5, 10.5, 300],
+        ['2019-02-20', 14.0, 11.0, 15.0, 10.0, 400]]))
+    market.write(1, 'w', None, frame([
+        ['2019-02-11', 10.0, 9.0, 11.0, 8.0, 100],
+        ['2019-02-18', 14.0, 10.0, 15.0, 9.5, 900]]))
+
+    return market
+
+
+def test_weekly_read_inside_a_week_rebuilds_it_from_the_days(tmp_path):
+    df = store(tmp_path / 'market.db').read(1, 'w', datetime(2019, 2, 19))
+
+    assert df['date'].tolist() == ['2019-02-11', '2019-02-18']
+    assert df.iloc[-1][['close', 'open', 'high', 'low', 'amount']].tolist() == [11.0, 10.0, 13.0, 9.5, 500]
+
+
+def test_weekly_read_after_the_last_day_keeps_the_stored_week(tmp_path):
+    market = store(tmp_path / 'market.db')
+
+    assert market.read(1, 'w', datetime(2019, 2, 20)).iloc[-1]['amount'] == 900
+    assert market.read(1, 'w').iloc[-1]['amount'] == 900
+
+
+def test_weekly_read_before_the_first_day_of_a_week_drops_it(tmp_path):
+    market = MarketStore(str(tmp_path / 'market.db'))
+    market.write(1, 'd', None, frame([['2019-02-11', 10.0, 9.0, 11.0, 8.0, 100], ['2019-02-19', 11.0, 12.0, 12.5, 10.5, 300]]))
+    market.write(1, 'w', None, frame([['2019-02-11', 10.0, 9.0, 11.0, 8.0, 100], ['2019-02-18', 11.0, 12.0, 12.5, 10.5, 300]]))
+
+    assert market.read(1, 'w', '2019-02-18')['date'].tolist() == ['2019-02-11']
+
+
+def test_weekly_read_many_matches_read(tmp_path):
+    market = store(tmp_path / 'market.db')
+    df = market.readMany([1], 'w', datetime(2019, 2, 18))
+
+    assert df.drop(columns=['code']).equals(market.read(1, 'w', datetime(2019, 2, 18)))
+    assert df.iloc[-1]['close'] == 12.0
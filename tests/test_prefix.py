@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+from datetime import datetime
+from src.bars import BarSeries
+from src.prefix import PrefixStates
+from src.settings import Settings
+from src.stock import Stock
+
+import numpy as np
+import pytest
+
+
+def settings(path):
+    ''' Settings writing nothing outside path, without a cache '''
+    config = path / 'config.ini'
+    config.write_text('[Dir]\narchive = {0}/\nresource = {0}/\nresult = {0}/\nconfig = {0}/\n'.format(path))
+
+    return Settings(str(config))
+
+
+def series(seed, length, step=1.0):
+    ''' Random walk of sticks, step rounds the prices so that some turns share them '''
+    random = np.random.RandomState(seed)
+    close = np.round(100 + np.cumsum(random.normal(0, 2, length)) / step) * step
+    open = np.round((close + random.normal(0, 1, length)) / step) * step
+    high = np.maximum(close, open) + np.round(np.abs(random.normal(0, 1.5, length)) / step) * step
+    low = np.minimum(close, open) - np.round(np.abs(random.normal(0, 1.5, length)) / step) * step
+
+    return BarSeries(np.arange(17000, 17000 + length, dtype=np.int32), close, open, high, low, np.full(length, 1000, dtype=np.int64))
+
+
+@pytest.mark.parametrize('seed, step', [(0, 1.0), (1, 1.0), (2, 0.01), (3, 2.0)])
+def test_forward_pass_agrees_with_stock_on_every_prefix(tmp_path, seed, step):
+    bars = series(seed, 150, step)
+    states = PrefixStates(bars.high, bars.low, bars.close).states
+    known = [w for w in range(1, len(bars) + 1) if states[w] is not None]
+
+    assert len(known) > len(bars) // 2
+
+    for w in known:
+        stock = Stock(1, 'w', datetime(2019, 2, 27), source=bars.slice(0, w), modifyArchive=False, settings=settings(tmp_path), cache=False, deep=True, resume=False)
+
+        assert stock.result['state'] == states[w], w
+
+
+def test_forward_pass_of_a_series_without_turns():
+    states = PrefixStates(np.arange(1.0, 11.0), np.arange(0.0, 10.0), np.arange(0.5, 10.5)).states
+
+    assert states[0] is None
+    assert set(states[1:]) == {'invalid'}
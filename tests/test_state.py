@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+from src.bars import BarSeries
+from src.state import StockState, fittingState
+
+import numpy as np
+import pytest
+
+
+def bars(dates):
+    ''' Sticks on dates given as 'YYYY-MM-DD' '''
+    days = np.array([np.datetime64(d, 'D') for d in dates]).astype(np.int32)
+    n = len(days)
+
+    return BarSeries(days, np.arange(n, dtype=np.float64) + 10, np.arange(n, dtype=np.float64) + 9, np.arange(n, dtype=np.float64) + 11, np.arange(n, dtype=np.float64) + 8, np.arange(n, dtype=np.int64) * 100)
+
+
+def test_fits_a_date_after_the_state():
+    state = StockState('2019-01-10', 1, 0, 1, bars(['2019-01-02', '2019-01-07']))
+
+    assert state.fits('2019-01-11')
+    assert state.fits(np.datetime64('2019-02-01'))
+    assert state.fits(int(np.datetime64('2019-01-11', 'D').astype(np.int64)))
+
+
+def test_does_not_fit_on_or_before_the_resume_date():
+    state = StockState('2019-01-10', 1, 0, 1, bars(['2019-01-02', '2019-01-07']))
+
+    assert not state.fits('2019-01-10')
+    assert not state.fits('2019-01-08')
+
+
+def test_does_not_fit_before_a_kept_stick():
+    state = StockState('', 0, 0, 0, bars(['2019-01-02', '2019-01-07']))
+
+    assert state.fits('2019-01-07')
+    assert not state.fits('2019-01-06')
+
+
+def test_empty_state_fits_any_date():
+    assert StockState('', 0, 0, 0, bars([])).fits('1990-01-01')
+
+
+def test_fitting_state_drops_and_warns(capsys):
+    state = StockState('2019-01-10', 1, 0, 1, bars(['2019-01-02']))
+
+    assert fittingState(state, '2019-01-11', 1) is state
+    assert capsys.readouterr().out == ''
+
+    assert fittingState(state, '2019-01-09', 1) is None
+    assert 'WARNING/State: 1' in capsys.readouterr().out
+
+    assert fittingState(None, '2019-01-09', 1) is None
+
+
+def assertSameState(state, other):
+    assert (other.lastDate, other.turn, other.kT, other.dT) == (state.lastDate, state.turn, state.kT, state.dT)
+
+    for name in BarSeries.__slots__:
+        assert np.array_equal(getattr(other.bars, name), getattr(state.bars, name)), name
+        assert getattr(other.bars, name).dtype == getattr(state.bars, name).dtype, name
+
+
+def test_bytes_round_trip():
+    state = StockState('2019-01-10', -1, 1, 0, bars(['2019-01-02', '2019-01-07', '2019-01-08']))
+    state.bars.turn[:] = [1, -1, 0]
+    state.bars.dT[1] = 1
+
+    assertSameState(state, StockState.frombytes(state.tobytes()))
+
+
+def test_round_trip_of_a_state_without_date_nor_sticks(tmp_path):
+    state = StockState('', 0, 0, 0, bars([]))
+    path = str(tmp_path / 'save_1_w.state')
+    state.save(path)
+
+    assertSameState(state, StockState.load(path))
+
+
+def test_frombytes_rejects_other_files():
+    raw = StockState('2019-01-10', 1, 0, 0, bars(['2019-01-02'])).tobytes()
+
+    for broken in [raw[:10], raw[:-1], b'XXXX' + raw[4:], raw[:4] + b'\x09\x00' + raw[6:]]:
+        with pytest.raises(ValueError):
+            StockState.frombytes(broken)
+
+
+def test_from_archive_keeps_the_last_stick_of_each_date_in_order():
+    df = bars(['2019-01-07', '2019-01-02', '2019-01-07', '2019-01-09']).toFrame()
+    df.loc[2, 'turn'] = 1
+    state = StockState.fromArchive(df)
+
+    assert state.lastDate == '2019-01-09'
+    assert state.turn == 1
+    assert [str(np.datetime64(int(d), 'D')) for d in state.bars.date] == ['2019-01-02', '2019-01-07']
+    assert state.bars.close.tolist() == [11.0, 12.0]
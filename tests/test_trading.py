@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+from datetime import datetime, timedelta
+from src.trading import TradingCalendar, DateIndex
+
+import numpy as np
+import pytest
+
+''' Laid out as holidays.csv is, every weekend listed. A Wednesday and a Friday off, a Saturday closed though marked open and a Monday listed as open '''
+HOLIDAYS = [('2019/1/2', '是'), ('2019/1/4', '是'), ('2019/1/5', '是'), ('2019/1/6', '是'), ('2019/1/7', '否'), ('2019/1/12', '否'), ('2019/1/13', '是'), \
+    ('2019/1/19', '是'), ('2019/1/20', '是'), ('2019/1/26', '是'), ('2019/1/27', '是'), ('2019/1/30', '是')]
+
+
+@pytest.fixture
+def calendar(tmp_path):
+    path = tmp_path / 'holidays.csv'
+    path.write_text('date,isHoliday\n' + ''.join('{},{}\n'.format(*row) for row in HOLIDAYS))
+
+    return TradingCalendar(str(path))
+
+
+def isOpen(date):
+    ''' The rule the bitmap holds, day by day '''
+    return date.weekday() < 5 and date.strftime('%Y/%-m/%-d') not in [day for day, closed in HOLIDAYS if closed == '是']
+
+
+def days(start, end):
+    return [start + timedelta(days=i) for i in range((end - start).days + 1)]
+
+
+def test_trading_days_inside_and_outside_the_holidays(calendar):
+    ''' The file covers January 2 to 30, the weekends alone close the days around it '''
+    for date in days(datetime(2018, 12, 20), datetime(2019, 2, 10)):
+        assert calendar.isTradingDay(date) == isOpen(date), date
+
+
+def test_next_and_previous_trading_day(calendar):
+    for date in days(datetime(2018, 12, 20), datetime(2019, 2, 10)):
+        after = date + timedelta(days=1)
+        before = date - timedelta(days=1)
+
+        while not isOpen(after):
+            after += timedelta(days=1)
+
+        while not isOpen(before):
+            before -= timedelta(days=1)
+
+        assert calendar.nextTradingDay(date) == after, date
+        assert calendar.prevTradingDay(date) == before, date
+
+
+def test_counted_and_listed_trading_days(calendar):
+    start = datetime(2018, 12, 28)
+
+    for end in days(start, datetime(2019, 2, 5)):
+        expected = [date for date in days(start, end) if isOpen(date)]
+
+        assert calendar.tradingDays(start, end) == expected
+        assert calendar.tradingDaysBetween(start, end) == len(expected)
+
+    ends = np.array(['2019-01-01', '2019-01-10', '2019-02-05'], dtype='datetime64[D]')
+
+    assert calendar.tradingDaysBetween(np.array(['2018-12-28'] * 3, dtype='datetime64[D]'), ends).tolist() == [3, 8, 25]
+
+
+def test_last_trading_day_of_week(calendar):
+    assert calendar.lastTradingDayOfWeek(datetime(2019, 1, 2)) == datetime(2019, 1, 3)
+    assert calendar.lastTradingDayOfWeek(datetime(2019, 1, 6)) == datetime(2019, 1, 3)
+    assert calendar.lastTradingDayOfWeek(datetime(2019, 2, 6)) == datetime(2019, 2, 8)
+
+
+def test_date_index_skips_the_closed_days(calendar):
+    dates = np.array(['2019-01-03', '2019-01-03', '2019-01-04', '2019-01-07', '2019-01-08'], dtype='datetime64[D]')
+    index = DateIndex(dates, calendar)
+
+    assert index.latest(datetime(2019, 1, 6)) == 0
+    assert index.latest(datetime(2019, 1, 7)) == 3
+    assert index.tradingDays(datetime(2019, 1, 1), datetime(2019, 1, 8)) == [(datetime(2019, 1, 3), 1), (datetime(2019, 1, 7), 4), (datetime(2019, 1, 8), 5)]